@@ -1,6 +1,7 @@
 import os
 import logging
-from flask import Flask
+from contextlib import nullcontext
+from flask import Flask, has_app_context
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_migrate import Migrate
@@ -49,6 +50,10 @@ def create_app(config_class=Config):
     app.register_blueprint(api_bp)
     app.register_blueprint(web_bp)
     
+    # Register CLI commands
+    from commands import register_commands
+    register_commands(app)
+    
     # Create database tables if they don't exist
     with app.app_context():
         # Import models to ensure they're registered with SQLAlchemy
@@ -58,18 +63,38 @@ def create_app(config_class=Config):
             db.create_all()
             logger.info("Database tables created successfully")
             
+            # create_all() does not add columns to tables that already exist
+            from models import upgrade_schema
+            upgrade_schema()
+            
             # Check if we need to import sample data
             from models import GovernmentService
             if GovernmentService.query.count() == 0:
                 logger.info("No services found. Importing sample data...")
                 from data.sample_services import import_sample_services
                 import_sample_services()
+            
+            # Build the in-memory spatial index used for nearest-service lookups
+            from services.geo_service import rebuild_service_index
+            rebuild_service_index()
         except Exception as e:
             logger.error(f"Error creating database tables: {e}")
     
     logger.info("Application initialized successfully")
     return app
 
+# App for tasks started outside the worker's app context, created once per process
+_task_app = None
+
+def task_app_context():
+    """Context for Celery task code: the worker's own app context if one is active, else a shared app's"""
+    global _task_app
+    if has_app_context():
+        return nullcontext()
+    if _task_app is None:
+        _task_app = create_app()
+    return _task_app.app_context()
+
 # Initialize the Celery app
 def init_celery(app=None):
     app = app or create_app()
@@ -80,4 +105,13 @@ def init_celery(app=None):
                 return self.run(*args, **kwargs)
     
     celery.Task = ContextTask
+
+    # Pool processes exit without running atexit handlers, so send queued SMS first
+    from celery.signals import worker_process_shutdown
+
+    @worker_process_shutdown.connect(weak=False)
+    def flush_outbound_sms(**kwargs):
+        from services.sms_queue import sms_queue
+        sms_queue.flush()
+
     return celery
@@ -0,0 +1,130 @@
+"""Check keyword-automaton entity extraction and keyword language detection against the legacy code and time both.
+
+Usage: python benchmarks/bench_entity_extraction.py [--repeat 50] [--fuzz 2000]
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from services.nlp_service import NLPService
+from bench_intent_matcher import load_corpus
+
+def legacy_detect_language(text):
+    """The original per-word substring scan"""
+    kinyarwanda_words = [
+        'muraho', 'amakuru', 'yego', 'oya', 'murakoze', 'ndashaka',
+        'mfasha', 'kubona', 'serivisi', 'aho', 'kugera'
+    ]
+    text_lower = text.lower()
+    kinyarwanda_count = sum(1 for word in kinyarwanda_words if word in text_lower)
+    return 'rw' if kinyarwanda_count >= 2 else 'en'
+
+def legacy_extract_entities(text):
+    """The original extract_entities, which rebuilt its lexicons and regexes on every call"""
+    entities = {}
+    text_lower = text.lower()
+    words = text.split()
+
+    service_keywords = {
+        'health': ['hospital', 'clinic', 'health center', 'doctor', 'medical', 'healthcare'],
+        'education': ['school', 'university', 'college', 'education', 'academic'],
+        'identification': ['ID', 'passport', 'identification', 'identity card', 'birth certificate'],
+        'taxation': ['tax', 'taxes', 'revenue', 'payment', 'financial'],
+        'social': ['social security', 'welfare', 'unemployment', 'benefits', 'assistance']
+    }
+    service_types = []
+    for service_type, keywords in service_keywords.items():
+        for keyword in keywords:
+            if keyword.lower() in text_lower:
+                service_types.append(service_type)
+                break
+    if service_types:
+        entities['SERVICE_TYPE'] = service_types
+
+    location_keywords = ['in', 'at', 'near', 'around', 'by']
+    for i, word in enumerate(words):
+        if word.lower() in location_keywords and i < len(words) - 1:
+            potential_location = words[i+1]
+            if potential_location not in ['the', 'a', 'an'] and len(potential_location) > 2:
+                entities['LOC'] = [potential_location]
+                break
+
+    person_prefixes = ['mr', 'mrs', 'ms', 'dr', 'prof']
+    for i, word in enumerate(words):
+        if i < len(words) - 1 and word.lower().rstrip('.') in person_prefixes:
+            potential_name = words[i+1]
+            if len(potential_name) > 1 and potential_name[0].isupper():
+                entities['PERSON'] = [f"{word} {potential_name}"]
+                break
+
+    org_suffixes = ['ministry', 'department', 'office', 'agency', 'authority', 'center', 'commission']
+    for suffix in org_suffixes:
+        pattern = re.compile(r'\b([A-Z][a-z]+ )+' + suffix + r'\b', re.IGNORECASE)
+        matches = pattern.findall(text)
+        if matches:
+            entities['ORG'] = matches
+            break
+
+    date_patterns = [
+        r'\b\d{1,2}/\d{1,2}/\d{2,4}\b',
+        r'\b\d{1,2}-\d{1,2}-\d{2,4}\b',
+        r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{1,2}(?:st|nd|rd|th)?,? \d{4}\b'
+    ]
+    date_matches = []
+    for pattern in date_patterns:
+        date_matches.extend(re.findall(pattern, text, re.IGNORECASE))
+    if date_matches:
+        entities['DATE'] = date_matches
+
+    return entities
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=50, help="Passes over the corpus when timing")
+    parser.add_argument('--fuzz', type=int, default=2000, help="Random multi-message texts to compare")
+    args = parser.parse_args()
+
+    nlp = NLPService()
+    corpus = load_corpus()
+
+    rng = random.Random(12)
+    texts = corpus + [' '.join(rng.sample(corpus, rng.randint(2, 4))) for _ in range(args.fuzz)]
+    mismatches = [
+        text for text in texts
+        if legacy_extract_entities(text) != nlp.extract_entities(text)
+        or legacy_detect_language(text) != nlp.keyword_language(text)
+    ]
+    print(f"Compared {len(texts)} texts: {len(mismatches)} mismatches")
+    for text in mismatches[:10]:
+        print(f"  {text!r}")
+
+    def legacy(text):
+        legacy_detect_language(text)
+        legacy_extract_entities(text)
+
+    def automaton(text):
+        hits = nlp.keyword_hits(text)
+        nlp.keyword_language(text, hits=hits)
+        nlp.extract_entities(text, hits=hits)
+
+    timings = {}
+    for label, run in (('legacy', legacy), ('automaton', automaton)):
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            for text in corpus:
+                run(text)
+        timings[label] = len(corpus) * args.repeat / (time.perf_counter() - started)
+        print(f"{label:>9}: {timings[label]:,.0f} messages/s")
+    print(f"Speed-up: {timings['automaton'] / timings['legacy']:.2f}x")
+
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    main()
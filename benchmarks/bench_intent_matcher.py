@@ -0,0 +1,73 @@
+"""Check the compiled intent matcher against the legacy per-pattern loop and time both.
+
+Every message in the regression corpus, plus random concatenations of corpus
+messages, must get identical intent scores from both implementations.
+
+Usage: python benchmarks/bench_intent_matcher.py [--repeat 50] [--fuzz 2000]
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.nlp_service import NLPService
+
+CORPUS_PATH = os.path.join(ROOT, 'data', 'nlp_regression_corpus.txt')
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f if line.strip() and not line.startswith('#')]
+
+def legacy_scores(intent_patterns, text):
+    """The original detect_intent scoring: one re.findall per pattern"""
+    intent_scores = defaultdict(int)
+    for intent, patterns in intent_patterns.items():
+        for pattern in patterns:
+            intent_scores[intent] += len(re.findall(pattern, text))
+    return intent_scores
+
+def legacy_intent(intent_patterns, text):
+    intent_scores = legacy_scores(intent_patterns, text)
+    top_intent = max(intent_scores.items(), key=lambda x: x[1])
+    return top_intent[0] if top_intent[1] > 0 else "general_inquiry"
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=50, help="Passes over the corpus when timing")
+    parser.add_argument('--fuzz', type=int, default=2000, help="Random multi-message texts to compare")
+    args = parser.parse_args()
+
+    nlp = NLPService()
+    corpus = load_corpus()
+
+    rng = random.Random(11)
+    texts = corpus + [' '.join(rng.sample(corpus, rng.randint(2, 4))) for _ in range(args.fuzz)]
+    mismatches = [
+        text for text in texts
+        if dict(legacy_scores(nlp.intent_patterns, text)) != dict(nlp.intent_matcher.scores(text))
+        or legacy_intent(nlp.intent_patterns, text) != nlp.detect_intent(text)
+    ]
+    print(f"Compared {len(texts)} texts: {len(mismatches)} mismatches")
+    for text in mismatches[:10]:
+        print(f"  {text!r}")
+
+    timings = {}
+    for label, detect in (('legacy', lambda text: legacy_intent(nlp.intent_patterns, text)), ('compiled', nlp.detect_intent)):
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            for text in corpus:
+                detect(text)
+        timings[label] = len(corpus) * args.repeat / (time.perf_counter() - started)
+        print(f"{label:>8}: {timings[label]:,.0f} messages/s")
+    print(f"Speed-up: {timings['compiled'] / timings['legacy']:.2f}x")
+
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Measure batch scoring throughput of the hashed n-gram intent model.
+
+Scores a saved model, or with no --model trains one on the regression corpus
+labeled by the regex patterns, and reports messages/s per batch size. The
+corpus labels are regex output, so agreement with them says nothing about
+correctness; accuracy is reported on the hand-labelled data/intent_eval.tsv,
+for the model and for the patterns themselves.
+
+Usage: python benchmarks/bench_intent_model.py [--model instance/intent_model.npz] [--messages 50000]
+                                               [--eval-file data/intent_eval.tsv]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from services.intent_model import IntentModel, EVAL_PATH, read_labeled
+from services.nlp_service import NLPService
+from bench_intent_matcher import load_corpus
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--model', default=None, help="Saved model to score (default: train on the corpus)")
+    parser.add_argument('--messages', type=int, default=50000, help="Messages to score per batch size")
+    parser.add_argument('--eval-file', default=EVAL_PATH, help="Hand-labelled 'intent<TAB>text' lines")
+    args = parser.parse_args()
+
+    nlp = NLPService()
+    with open(args.eval_file, encoding='utf-8') as f:
+        evaluation = read_labeled(f)
+    eval_texts = {text.strip().lower() for text, _ in evaluation}
+    corpus = [text for text in load_corpus() if text.strip().lower() not in eval_texts]
+    labels = [nlp.intent_matcher.best(text, default="general_inquiry") for text in corpus]
+
+    if args.model:
+        model = IntentModel.load(args.model)
+    else:
+        started = time.perf_counter()
+        model = IntentModel.train(corpus, labels)
+        print(f"Trained on {len(corpus)} texts in {(time.perf_counter() - started) * 1000:.0f} ms")
+    print(f"Agreement with regex labels (not accuracy): {model.evaluate(corpus, labels):.1%}")
+
+    texts, intents = [text for text, _ in evaluation], [intent for _, intent in evaluation]
+    regex_accuracy = sum(
+        1 for text, intent in evaluation if nlp.intent_matcher.best(text, default="general_inquiry") == intent
+    ) / len(evaluation)
+    print(f"Hand-labelled accuracy on {len(evaluation)} texts: model {model.evaluate(texts, intents):.1%}, "
+          f"regex patterns {regex_accuracy:.1%}")
+
+    rng = random.Random(15)
+    texts = [rng.choice(corpus) for _ in range(args.messages)]
+    for batch_size in (1, 100, 1000, 10000):
+        started = time.perf_counter()
+        for start in range(0, len(texts), batch_size):
+            model.predict(texts[start:start + batch_size])
+        print(f"batch {batch_size:>5}: {len(texts) / (time.perf_counter() - started):,.0f} messages/s")
+
+if __name__ == '__main__':
+    main()
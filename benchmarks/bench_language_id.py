@@ -0,0 +1,75 @@
+"""Evaluate and time the character n-gram language identifier.
+
+Runs k-fold cross-validation over the seed corpus in data/langid, scoring
+whole sentences and their first word alone, compares English/Kinyarwanda
+accuracy with the keyword rule, and reports microseconds per message.
+
+Usage: python benchmarks/bench_language_id.py [--languages en,rw,fr,sw] [--folds 5]
+"""
+import os
+import sys
+import time
+import argparse
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services.language_id import LanguageIdentifier, CORPUS_DIR
+from services.nlp_service import NLPService
+
+def load_corpus(languages):
+    corpus = {}
+    for language in languages:
+        with open(os.path.join(CORPUS_DIR, f"{language}.txt"), encoding='utf-8') as f:
+            corpus[language] = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return corpus
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--languages', default='en,rw', help="Comma-separated languages to train and test")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--min-confidence', type=float, default=0.9)
+    args = parser.parse_args()
+
+    languages = args.languages.split(',')
+    corpus = load_corpus(languages)
+    nlp = NLPService()
+
+    correct = defaultdict(int)
+    total = defaultdict(int)
+    for fold in range(args.folds):
+        train = {language: [text for i, text in enumerate(texts) if i % args.folds != fold] for language, texts in corpus.items()}
+        identifier = LanguageIdentifier.train(train)
+        for language, texts in corpus.items():
+            for text in texts[fold::args.folds]:
+                for variant, sample in (('sentence', text), ('first word', text.split()[0])):
+                    predicted, confidence = identifier.classify(sample)
+                    fallback = predicted if confidence >= args.min_confidence else nlp.keyword_language(sample)
+                    keyword = nlp.keyword_language(sample)
+                    total[variant, language] += 1
+                    correct['model', variant, language] += predicted == language
+                    correct['model + fallback', variant, language] += fallback == language
+                    correct['keyword rule', variant, language] += keyword == language
+
+    print(f"{args.folds}-fold cross-validation accuracy")
+    for method in ('model', 'model + fallback', 'keyword rule'):
+        for variant in ('sentence', 'first word'):
+            cells = '  '.join(
+                f"{language}={correct[method, variant, language] / total[variant, language]:6.1%}"
+                for language in languages
+            )
+            print(f"  {method:>16} / {variant:<10}  {cells}")
+
+    identifier = LanguageIdentifier.from_corpus(languages=languages)
+    texts = [text for texts in corpus.values() for text in texts]
+    repeat = max(1, 20000 // len(texts))
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            identifier.classify(text)
+    elapsed = time.perf_counter() - started
+    print(f"classify: {elapsed / (repeat * len(texts)) * 1e6:.1f} µs per message")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Exercise the LLM gateway against a local fake OpenAI-compatible server.
+
+The fake server answers /chat/completions after a configurable delay, with
+a share of deliberately slow responses, and serves bag-of-words
+/embeddings so reworded prompts land close together. The script reports
+single-flight coalescing, exact and semantic cache hits, budget rejections,
+and tail latency with and without hedging.
+
+Usage: python benchmarks/bench_llm_gateway.py [--requests 200] [--slow-share 0.1]
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask
+from services.llm_gateway import LLMGateway
+
+EMBEDDING_DIMENSIONS = 256
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    delay = 0.05
+    slow_delay = 1.5
+    slow_share = 0.1
+    rng = random.Random(17)
+    completions = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        if self.path.endswith('/embeddings'):
+            vector = [0.0] * EMBEDDING_DIMENSIONS
+            for word in payload['input'].lower().replace('?', '').split():
+                vector[zlib.crc32(word.encode('utf-8')) % EMBEDDING_DIMENSIONS] += 1.0
+            self._reply({'data': [{'embedding': vector}], 'model': payload['model']})
+            return
+
+        with self.lock:
+            type(self).completions += 1
+            slow = self.rng.random() < self.slow_share
+        time.sleep(self.slow_delay if slow else self.delay)
+        prompt = payload['messages'][-1]['content']
+        self._reply({
+            'model': payload['model'],
+            'choices': [{'message': {'role': 'assistant', 'content': f"Answer to: {prompt}"}}],
+            'usage': {'prompt_tokens': len(prompt) // 4 + 10, 'completion_tokens': 20, 'total_tokens': len(prompt) // 4 + 30}
+        })
+
+def make_gateway(base_url, **config):
+    app = Flask(__name__)
+    app.config.update(
+        LLM_BASE_URL=base_url, LLM_API_KEY='test', LLM_MODEL='fake-model', LLM_CACHE_PATH=None,
+        LLM_TIMEOUT_SECONDS=5, LLM_MAX_CONCURRENCY=32,
+        LLM_PROMPT_PRICE_PER_1K_TOKENS=0.00015, LLM_COMPLETION_PRICE_PER_1K_TOKENS=0.0006, **config
+    )
+    return LLMGateway(app)
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return ', '.join(f"p{int(p * 100)}={samples[min(len(samples) - 1, int(p * len(samples)))]:.0f} ms" for p in (0.5, 0.95, 0.99))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200, help="Distinct prompts in the latency runs")
+    parser.add_argument('--slow-share', type=float, default=0.1, help="Share of upstream responses that are slow")
+    args = parser.parse_args()
+
+    FakeOpenAIHandler.slow_share = args.slow_share
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeOpenAIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    # Single flight: many identical prompts at once cost one upstream call
+    gateway = make_gateway(base_url, LLM_HEDGE_AFTER_SECONDS=None)
+    FakeOpenAIHandler.completions = 0
+    with ThreadPoolExecutor(max_workers=50) as pool:
+        results = list(pool.map(lambda _: gateway.complete("Where is the nearest hospital?"), range(50)))
+    print(f"single flight: 50 identical concurrent prompts -> {FakeOpenAIHandler.completions} upstream call(s), "
+          f"{sum(1 for r in results if r and r['cached'] == 'coalesced')} coalesced")
+
+    # Exact and semantic caches
+    gateway = make_gateway(base_url, LLM_HEDGE_AFTER_SECONDS=None, LLM_EMBEDDING_MODEL='fake-embedding', LLM_SEMANTIC_THRESHOLD=0.9)
+    gateway.complete("Where is the nearest hospital in Kigali?")
+    print(f"exact repeat: cached={gateway.complete('Where is the nearest hospital in Kigali?')['cached']}")
+    print(f"reworded:     cached={gateway.complete('where is the nearest hospital in kigali')['cached']}")
+    print(f"unrelated:    cached={gateway.complete('How do I pay my taxes?')['cached']}")
+
+    # Budgets: requests beyond the per-minute limit are refused locally
+    gateway = make_gateway(base_url, LLM_HEDGE_AFTER_SECONDS=None, LLM_MAX_REQUESTS_PER_MINUTE=5)
+    answered = sum(1 for i in range(10) if gateway.complete(f"Question {i}"))
+    print(f"budget: {answered} of 10 answered with a 5 requests/minute budget, "
+          f"{gateway.stats()['counters']['budget_rejections']} rejected")
+
+    # Tail latency with and without hedging
+    for label, hedge_after in (('no hedging', None), ('hedge after 200 ms', 0.2)):
+        gateway = make_gateway(base_url, LLM_HEDGE_AFTER_SECONDS=hedge_after)
+        prompts = [f"{label} prompt {i}" for i in range(args.requests)]
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(gateway.complete, prompts))
+        counters = gateway.stats()['counters']
+        print(f"{label:>18}: {percentiles([r['latency_ms'] for r in results if r])}; "
+              f"{counters['hedges']} hedges, {counters['hedge_wins']} won, "
+              f"{counters['prompt_tokens'] + counters['completion_tokens']} tokens, ${counters['cost_usd']:.4f}")
+
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
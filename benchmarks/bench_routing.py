@@ -0,0 +1,81 @@
+"""Benchmark offline route queries per second on a single core.
+
+Uses a synthetic street grid around Kigali by default, or a real graph built
+with `flask build-road-graph` when --graph is given.
+
+Usage: python benchmarks/bench_routing.py [--graph instance/rwanda_roads.npz] [--routes 200]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.road_graph import RoadGraph
+
+def synthetic_grid(size, spacing_deg=0.0005, drop_ratio=0.1, seed=42):
+    """Square street grid with some missing blocks, named streets and mixed speeds"""
+    rng = random.Random(seed)
+    origin_lat, origin_lng = -1.99, 30.02
+    node_lat, node_lng = [], []
+    for i in range(size):
+        for j in range(size):
+            node_lat.append(origin_lat + i * spacing_deg + rng.uniform(-0.0001, 0.0001))
+            node_lng.append(origin_lng + j * spacing_deg + rng.uniform(-0.0001, 0.0001))
+
+    names = [f"KN {i} St" for i in range(size)] + [f"KN {j} Ave" for j in range(size)]
+    sources, targets, foot, car_speed, name_id = [], [], [], [], []
+    for i in range(size):
+        for j in range(size):
+            u = i * size + j
+            for v, name, speed in ((u + 1, i, 40 if i % 10 == 0 else 25), (u + size, size + j, 50 if j % 10 == 0 else 25)):
+                if (v == u + 1 and j == size - 1) or v >= size * size or rng.random() < drop_ratio:
+                    continue
+                for a, b in ((u, v), (v, u)):
+                    sources.append(a)
+                    targets.append(b)
+                    foot.append(True)
+                    car_speed.append(speed)
+                    name_id.append(name)
+    return RoadGraph.from_edges(node_lat, node_lng, sources, targets, foot, car_speed, name_id, names)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--graph', help="Path to a graph .npz built from an OSM extract")
+    parser.add_argument('--size', type=int, default=300, help="Synthetic grid side length in nodes")
+    parser.add_argument('--routes', type=int, default=200)
+    parser.add_argument('--profile', default='foot', choices=['foot', 'car'])
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    graph = RoadGraph.load(args.graph) if args.graph else synthetic_grid(args.size)
+    print(f"Loaded graph with {graph.node_count} nodes and {graph.edge_count} edges in {time.perf_counter() - started:.2f} s")
+
+    rng = random.Random(7)
+    lat_min, lat_max = float(graph.node_lat.min()), float(graph.node_lat.max())
+    lng_min, lng_max = float(graph.node_lng.min()), float(graph.node_lng.max())
+    pairs = [
+        (rng.uniform(lat_min, lat_max), rng.uniform(lng_min, lng_max), rng.uniform(lat_min, lat_max), rng.uniform(lng_min, lng_max))
+        for _ in range(args.routes)
+    ]
+
+    # Warm the per-profile adjacency lists and snapping grid before timing
+    graph.route(*pairs[0], profile=args.profile)
+
+    found = 0
+    total_km = 0.0
+    started = time.perf_counter()
+    for from_lat, from_lng, to_lat, to_lng in pairs:
+        directions = graph.route(from_lat, from_lng, to_lat, to_lng, profile=args.profile)
+        if directions:
+            found += 1
+            total_km += directions['distance'] / 1000
+    elapsed = time.perf_counter() - started
+
+    print(f"{found}/{len(pairs)} routes found, mean length {total_km / max(found, 1):.2f} km")
+    print(f"{len(pairs) / elapsed:.1f} routes/s ({elapsed / len(pairs) * 1000:.2f} ms/route) on one core")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Benchmark the in-memory spatial index against a synthetic 100k-service catalog.
+
+Usage: python benchmarks/bench_spatial_index.py [--services 100000] [--queries 20000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.spatial_index import SpatialIndex
+from services.distance import HaversineEngine
+from utils import haversine_km
+
+# Rough bounding box of Rwanda
+LAT_RANGE = (-2.84, -1.05)
+LNG_RANGE = (28.86, 30.90)
+CATEGORIES = ['health', 'education', 'identification', 'taxation', 'social', 'administration']
+
+def synthetic_catalog(count, seed=42):
+    """Generate service rows clustered around a handful of towns plus uniform rural coverage"""
+    rng = random.Random(seed)
+    towns = [(-1.9441, 30.0619), (-2.5967, 29.7394), (-1.4995, 29.6344), (-2.0783, 29.7567), (-1.6773, 29.2564)]
+    rows = []
+    for i in range(count):
+        if rng.random() < 0.6:
+            lat, lng = rng.choice(towns)
+            lat += rng.gauss(0, 0.05)
+            lng += rng.gauss(0, 0.05)
+        else:
+            lat = rng.uniform(*LAT_RANGE)
+            lng = rng.uniform(*LNG_RANGE)
+        rows.append({
+            'id': i + 1,
+            'name': f"Service {i + 1}",
+            'category': rng.choice(CATEGORIES),
+            'latitude': lat,
+            'longitude': lng
+        })
+    return rows
+
+def brute_force(rows, lat, lng, k, category=None, max_km=None):
+    found = []
+    for row in rows:
+        if category and row['category'] != category:
+            continue
+        distance = haversine_km(lat, lng, row['latitude'], row['longitude'])
+        if max_km is None or distance <= max_km:
+            found.append((distance, row['id']))
+    found.sort()
+    return found[:k] if k else found
+
+def timed(label, fn, queries):
+    started = time.perf_counter()
+    for lat, lng in queries:
+        fn(lat, lng)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed / len(queries) * 1e6:8.1f} us/query")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--services', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--cell-degrees', type=float, default=0.01)
+    args = parser.parse_args()
+
+    rows = synthetic_catalog(args.services)
+    rng = random.Random(7)
+    queries = [(rng.uniform(*LAT_RANGE), rng.uniform(*LNG_RANGE)) for _ in range(args.queries)]
+
+    index = SpatialIndex(cell_degrees=args.cell_degrees)
+    started = time.perf_counter()
+    index.build(rows)
+    print(f"Built index over {len(index)} services in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    # Verify exactness against a brute-force scan before timing anything
+    for lat, lng in queries[:50]:
+        expected = brute_force(rows, lat, lng, 5, max_km=10)
+        actual = [(d, row['id']) for d, row in index.nearest(lat, lng, k=5, max_km=10)]
+        assert [i for _, i in expected] == [i for _, i in actual], (lat, lng)
+        expected = brute_force(rows, lat, lng, None, category='health', max_km=3)
+        actual = [(d, row['id']) for d, row in index.within_radius(lat, lng, 3, category='health')]
+        assert [i for _, i in expected] == [i for _, i in actual], (lat, lng)
+    print("Results match brute-force haversine scan")
+
+    timed("nearest k=5 within 10 km", lambda lat, lng: index.nearest(lat, lng, k=5, max_km=10), queries)
+    timed("nearest k=5 health within 10 km", lambda lat, lng: index.nearest(lat, lng, k=5, category='health', max_km=10), queries)
+    timed("nearest k=1 unbounded", lambda lat, lng: index.nearest(lat, lng, k=1), queries)
+    timed("within 2 km", lambda lat, lng: index.within_radius(lat, lng, 2), queries)
+
+    # Batch lookups; small catalogs go through the vectorized engine in one pass
+    lats = [lat for lat, _ in queries]
+    lngs = [lng for _, lng in queries]
+    batch = index.nearest_many(lats[:50], lngs[:50], k=5, max_km=10)
+    for (lat, lng), results in zip(queries[:50], batch):
+        expected = brute_force(rows, lat, lng, 5, max_km=10)
+        assert [i for _, i in expected] == [row['id'] for _, row in results], (lat, lng)
+    started = time.perf_counter()
+    index.nearest_many(lats, lngs, k=5, category='health', max_km=10)
+    elapsed = time.perf_counter() - started
+    print(f"{'nearest_many k=5 health (batch)':<40} {elapsed / len(queries) * 1e6:8.1f} us/query")
+
+    small = HaversineEngine([row['latitude'] for row in rows[:1000]], [row['longitude'] for row in rows[:1000]])
+    started = time.perf_counter()
+    small.top_k(lats, lngs, 5)
+    elapsed = time.perf_counter() - started
+    print(f"{'engine top_k k=5 over 1k rows (batch)':<40} {elapsed / len(queries) * 1e6:8.1f} us/query")
+
+    sample = queries[:200]
+    timed("brute-force k=5 (reference)", lambda lat, lng: brute_force(rows, lat, lng, 5, max_km=10), sample)
+
+if __name__ == '__main__':
+    main()
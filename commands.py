@@ -0,0 +1,238 @@
+import logging
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+logger = logging.getLogger(__name__)
+
+@click.command('build-road-graph')
+@click.argument('osm_path')
+@click.option('--output', default=None, help="Output .npz path (defaults to ROAD_GRAPH_PATH)")
+@with_appcontext
+def build_road_graph_command(osm_path, output):
+    """Compile an OpenStreetMap XML extract into the offline routing graph"""
+    from services.road_graph import RoadGraph
+
+    output = output or current_app.config['ROAD_GRAPH_PATH']
+    graph = RoadGraph.from_osm_xml(osm_path)
+    graph.save(output)
+    click.echo(f"Wrote {graph.node_count} nodes and {graph.edge_count} edges to {output}")
+
+@click.command('build-travel-times')
+@click.option('--output', default=None, help="Output path (defaults to TRAVEL_TIME_MATRIX_PATH)")
+@click.option('--max-minutes', type=int, default=None, help="Walks longer than this are stored as unreachable")
+@with_appcontext
+def build_travel_times_command(output, max_minutes):
+    """Precompute walking minutes from every grid cell to every government service"""
+    from app import db
+    from models import GovernmentService
+    from services.geo_service import get_road_graph
+    from services.travel_time import TravelTimeMatrix
+
+    graph = get_road_graph()
+    if graph is None:
+        raise click.ClickException("No road graph found; run `flask build-road-graph` first")
+
+    services = db.session.query(
+        GovernmentService.id,
+        GovernmentService.latitude,
+        GovernmentService.longitude
+    ).filter(
+        GovernmentService.latitude.isnot(None),
+        GovernmentService.longitude.isnot(None)
+    ).all()
+
+    output = output or current_app.config['TRAVEL_TIME_MATRIX_PATH']
+    matrix = TravelTimeMatrix.build(
+        output,
+        graph,
+        [tuple(row) for row in services],
+        cell_degrees=current_app.config.get('TRAVEL_TIME_CELL_DEGREES', 0.01),
+        max_minutes=max_minutes or current_app.config.get('TRAVEL_TIME_MAX_MINUTES', 180)
+    )
+    click.echo(f"Wrote travel times for {len(matrix)} services over {matrix.n_lat * matrix.n_lng} cells to {output}")
+
+@click.command('export-services')
+@click.argument('output', type=click.File('w', encoding='utf-8'))
+@click.option('--since', default=None, help="Only services updated at or after this ISO 8601 time")
+@click.option('--category', default=None)
+@with_appcontext
+def export_services_command(output, since, category):
+    """Write the service catalog as a GeoJSON FeatureCollection (use - for stdout)"""
+    from datetime import datetime
+    from services.geo_service import GeoService
+
+    since = datetime.fromisoformat(since) if since else None
+    for chunk in GeoService(current_app._get_current_object()).export_geojson(since=since, category=category):
+        output.write(chunk)
+
+@click.command('build-service-tiles')
+@click.option('--output', default=None, help="Tile directory (defaults to SERVICE_TILES_DIR)")
+@click.option('--full', is_flag=True, help="Rebuild every tile instead of only those changed since the last run")
+@with_appcontext
+def build_service_tiles_command(output, full):
+    """Build or incrementally update the vector tile pyramid of services"""
+    from services.geo_service import GeoService
+
+    output = output or current_app.config['SERVICE_TILES_DIR']
+    manifest = GeoService(current_app._get_current_object()).update_service_tiles(output, full=full)
+    click.echo(
+        f"{'Rebuilt' if manifest['full'] else 'Updated'} {output}: {manifest['tiles_written']} tiles written, "
+        f"{manifest['tiles_removed']} removed, {manifest['services']} services"
+    )
+
+@click.command('annotate-messages')
+@click.option('--chunk-size', type=int, default=1000, show_default=True, help="Messages per SELECT and bulk UPDATE")
+@click.option('--since-id', type=int, default=None, help="Only messages with a greater id")
+@click.option('--missing-only', is_flag=True, help="Only messages without an intent yet")
+@click.option('--redetect-language', is_flag=True, help="Overwrite languages already stored on messages")
+@with_appcontext
+def annotate_messages_command(chunk_size, since_id, missing_only, redetect_language):
+    """Re-run intent, entity and language detection over the messages table"""
+    from models import Message
+    from services.nlp_service import NLPService
+
+    query = Message.query
+    if since_id is not None:
+        query = query.filter(Message.id > since_id)
+    if missing_only:
+        query = query.filter(Message.intent.is_(None))
+
+    nlp_service = NLPService(current_app._get_current_object())
+    result = nlp_service.process_messages(query=query, chunk_size=chunk_size, redetect_language=redetect_language)
+    click.echo(
+        f"Annotated {result['processed']} messages in {result['seconds']:.1f} s "
+        f"({result['messages_per_second']:.0f} msg/s, cache hit rate {result['cache_hit_rate']:.0%}), "
+        f"{result['failed_chunks']} chunks failed, last id {result['last_id']}"
+    )
+
+@click.command('train-intent-model')
+@click.option('--output', default=None, help="Output .npz path (defaults to INTENT_MODEL_PATH, else instance/intent_model.npz)")
+@click.option('--from-file', 'from_file', type=click.File('r', encoding='utf-8'), default=None,
+              help="Train on hand-labelled tab-separated 'intent<TAB>text' lines")
+@click.option('--db-labels', is_flag=True,
+              help="Also train on Message.intent where it matches the regex patterns (it is their output)")
+@click.option('--eval-file', 'eval_file', type=click.File('r', encoding='utf-8'), default=None,
+              help="Hand-labelled 'intent<TAB>text' lines to report accuracy on (defaults to data/intent_eval.tsv)")
+@click.option('--alpha', type=float, default=0.1, show_default=True, help="Additive smoothing")
+@click.option('--holdout', type=int, default=10, show_default=True, help="Hold out one text in N for evaluation (0 to disable)")
+@click.option('--force', is_flag=True, help="Save the model even if it does not beat the regex patterns on the eval set")
+@with_appcontext
+def train_intent_model_command(output, from_file, db_labels, eval_file, alpha, holdout, force):
+    """Train the hashed n-gram intent classifier from hand-labelled messages.
+
+    Message.intent in the database is what the patterns (or an earlier
+    model) said, so it is only used with --db-labels, and then only where
+    it agrees with the patterns: a model never trains on its own outputs.
+    The model is saved only if it beats the patterns on the hand-labelled
+    eval file, whose texts are never trained on; workers use it only once
+    INTENT_MODEL_PATH points at it.
+    """
+    import os
+    import zlib
+    from app import db
+    from models import Message
+    from services.intent_model import IntentModel, EVAL_PATH, read_labeled
+    from services.nlp_service import NLPService
+
+    if eval_file:
+        evaluation = read_labeled(eval_file)
+    elif os.path.exists(EVAL_PATH):
+        with open(EVAL_PATH, encoding='utf-8') as f:
+            evaluation = read_labeled(f)
+    else:
+        evaluation = []
+    eval_texts = {text.strip().lower() for text, _ in evaluation}
+    matcher = NLPService().intent_matcher
+
+    examples = read_labeled(from_file) if from_file else []
+    if db_labels:
+        examples.extend(
+            (row.content, row.intent)
+            for row in db.session.query(Message.content, Message.intent).filter(
+                Message.sender_type == 'user',
+                Message.intent.isnot(None)
+            ).yield_per(5000)
+            if row.content and matcher.best(row.content, default="general_inquiry") == row.intent
+        )
+    examples = [example for example in examples if example[0].strip().lower() not in eval_texts]
+    if not examples:
+        raise click.ClickException("No labeled messages to train on; pass --from-file or --db-labels")
+
+    # Split on a hash of the text so duplicates never straddle train and test
+    def held_out(text):
+        return holdout > 0 and zlib.crc32(text.strip().lower().encode('utf-8')) % holdout == 0
+
+    train = [example for example in examples if not held_out(example[0])]
+    test = [example for example in examples if held_out(example[0])]
+
+    model = IntentModel.train(
+        [text for text, _ in train], [intent for _, intent in train],
+        n_features=current_app.config.get('INTENT_MODEL_FEATURES', 2 ** 17), alpha=alpha
+    )
+    accuracy = model.evaluate([text for text, _ in test], [intent for _, intent in test])
+    model.metrics = {'train_examples': len(train), 'test_examples': len(test)}
+    if accuracy is not None:
+        model.metrics['test_accuracy'] = round(accuracy, 4)
+    click.echo(
+        f"Trained intent model with {len(model.classes)} intents on {len(train)} texts"
+        + (f" (held-out accuracy {accuracy:.1%} on {len(test)} texts)" if accuracy is not None else "")
+    )
+
+    eval_accuracy = model.evaluate([text for text, _ in evaluation], [intent for _, intent in evaluation])
+    if eval_accuracy is None:
+        if not force:
+            raise click.ClickException("No hand-labelled eval set to compare with the regex patterns; pass --force to save anyway")
+    else:
+        regex_accuracy = sum(
+            1 for text, intent in evaluation if matcher.best(text, default="general_inquiry") == intent
+        ) / len(evaluation)
+        model.metrics.update({
+            'eval_examples': len(evaluation),
+            'eval_accuracy': round(eval_accuracy, 4),
+            'eval_regex_accuracy': round(regex_accuracy, 4)
+        })
+        click.echo(
+            f"Hand-labelled accuracy on {len(evaluation)} texts: model {eval_accuracy:.1%}, "
+            f"regex patterns {regex_accuracy:.1%}"
+        )
+        if eval_accuracy < regex_accuracy and not force:
+            raise click.ClickException("Not saved: the model is less accurate than the regex patterns; pass --force to save anyway")
+
+    output = output or current_app.config.get('INTENT_MODEL_PATH') or 'instance/intent_model.npz'
+    model.save(output)
+    click.echo(f"Wrote intent model to {output}")
+
+@click.command('build-lexicon')
+@click.option('--source-dir', default=None, help="Directory of <lexicon>.txt files (defaults to LEXICON_SOURCE_DIR or data/lexicon)")
+@click.option('--output', default=None, help="Output path (defaults to LEXICON_PATH)")
+@with_appcontext
+def build_lexicon_command(source_dir, output):
+    """Compile the keyword lexicons into the memory-mapped file workers share"""
+    from services.lexicon import Lexicon, SOURCE_DIR
+
+    source_dir = source_dir or current_app.config.get('LEXICON_SOURCE_DIR') or SOURCE_DIR
+    output = output or current_app.config['LEXICON_PATH']
+    lexicon = Lexicon.build(source_dir, output)
+    counts = ', '.join(f"{name}={count}" for name, count in lexicon.stats()['lexicons'].items())
+    click.echo(f"Wrote lexicon {lexicon.version} with {len(lexicon)} terms ({counts}) to {output}")
+
+@click.command('upgrade-schema')
+@with_appcontext
+def upgrade_schema_command():
+    """Add model columns missing from existing tables (also run at app start-up)"""
+    from models import upgrade_schema
+
+    added = upgrade_schema()
+    click.echo(f"Added {', '.join(added)}" if added else "Schema is up to date")
+
+def register_commands(app):
+    """Register the maintenance CLI commands with the Flask app"""
+    app.cli.add_command(build_road_graph_command)
+    app.cli.add_command(build_travel_times_command)
+    app.cli.add_command(export_services_command)
+    app.cli.add_command(build_service_tiles_command)
+    app.cli.add_command(annotate_messages_command)
+    app.cli.add_command(train_intent_model_command)
+    app.cli.add_command(build_lexicon_command)
+    app.cli.add_command(upgrade_schema_command)
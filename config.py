@@ -14,7 +14,8 @@ class Config:
     }
     # Enable SQLite extensions for spatial support
     SQLALCHEMY_ENGINE_OPTIONS['connect_args'] = {'detect_types': sqlite3.PARSE_DECLTYPES}
-    SQLALCHEMY_ENGINE_OPTIONS['creator'] = lambda: sqlite3.connect('instance/tugendane.db', uri=True)
+    # Pooled connections are reused by background threads such as the outbound SMS flusher
+    SQLALCHEMY_ENGINE_OPTIONS['creator'] = lambda: sqlite3.connect('instance/tugendane.db', uri=True, check_same_thread=False)
 
 
     # Africa's Talking API configuration for Rwanda
@@ -24,6 +25,10 @@ class Config:
     AT_SENDER_ID = os.environ.get('AT_SENDER_ID', 'TUGENDANE')  # For alphanumeric sender ID
     AT_COUNTRY_CODE = '+250'  # Rwanda country code
     AT_TEST_PHONE = '+250788520617'  # Test phone number
+    AT_TIMEOUT_SECONDS = None  # (connect, read) for provider calls; defaults to the HTTP client's timeouts
+    SMS_PROVIDER = os.environ.get('SMS_PROVIDER', 'africastalking')  # 'fake' accepts every send locally, for load tests
+    FAKE_GATEWAY_LATENCY_MS = int(os.environ.get('FAKE_GATEWAY_LATENCY_MS', 0))
+    PROVIDER_HEALTH_TTL_SECONDS = 30  # Health probes reuse a check this recent
 
     # Webhook configuration
     BASE_URL = os.environ.get('BASE_URL', f'https://{os.environ.get("REPL_SLUG")}.{os.environ.get("REPL_OWNER")}.repl.co')
@@ -37,14 +42,139 @@ class Config:
     # OpenRouter configuration for LLM
     OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY')
     OPENAI_API_KEY = OPENROUTER_API_KEY  # Use OpenRouter key for API client
+    LLM_BASE_URL = os.environ.get('LLM_BASE_URL', 'https://openrouter.ai/api/v1')  # Any OpenAI-compatible API
+    LLM_API_KEY = os.environ.get('LLM_API_KEY')  # Defaults to OPENROUTER_API_KEY
+    LLM_MODEL = os.environ.get('LLM_MODEL', 'openai/gpt-4o-mini')
+    LLM_EMBEDDING_MODEL = os.environ.get('LLM_EMBEDDING_MODEL')  # Set to enable the semantic response cache
+    LLM_FALLBACK_ENABLED = os.environ.get('LLM_FALLBACK_ENABLED', 'false').lower() == 'true'  # Answer general inquiries with the LLM
+    LLM_TIMEOUT_SECONDS = 15
+    LLM_EMBEDDING_TIMEOUT_SECONDS = 3
+    LLM_HEDGE_AFTER_SECONDS = 4  # Send a duplicate request when the first is slower than this; None disables
+    LLM_MAX_COMPLETION_TOKENS = 200
+    LLM_MAX_REQUESTS_PER_MINUTE = 60  # Per worker process
+    LLM_MAX_TOKENS_PER_MINUTE = 40000  # Per worker process, prompt plus completion
+    LLM_MAX_CONCURRENCY = 8
+    LLM_CACHE_MAX_ENTRIES = 2000
+    LLM_CACHE_TTL_HOURS = 24
+    LLM_CACHE_PATH = os.environ.get('LLM_CACHE_PATH', 'instance/llm_cache.sqlite3')
+    LLM_SEMANTIC_CACHE_MAX_ENTRIES = 1000
+    LLM_SEMANTIC_THRESHOLD = 0.95  # Cosine similarity for reusing an answer to a different prompt
+    LLM_PROMPT_PRICE_PER_1K_TOKENS = float(os.environ.get('LLM_PROMPT_PRICE_PER_1K_TOKENS', 0.00015))
+    LLM_COMPLETION_PRICE_PER_1K_TOKENS = float(os.environ.get('LLM_COMPLETION_PRICE_PER_1K_TOKENS', 0.0006))
+
+    # NLP result cache (repeated message texts skip language, intent and entity detection)
+    NLP_CACHE_MAX_ENTRIES = 5000
+    NLP_CACHE_TTL_HOURS = 24
+    NLP_CACHE_MAX_TEXT_LENGTH = 160  # Longer messages are processed but not cached
+    NLP_CACHE_PATH = os.environ.get('NLP_CACHE_PATH', 'instance/nlp_cache.sqlite3')  # Shared by workers on the host
+    NLP_CACHE_VERSION = int(os.environ.get('NLP_CACHE_VERSION', 1))  # Bump to drop every cached result
+
+    # Trained intent model (falls back to the regex patterns when missing or unsure); opt-in, set once
+    # `flask train-intent-model` has saved one that beats the patterns on data/intent_eval.tsv
+    INTENT_MODEL_PATH = os.environ.get('INTENT_MODEL_PATH')
+    INTENT_MODEL_MIN_CONFIDENCE = float(os.environ.get('INTENT_MODEL_MIN_CONFIDENCE', 0.7))
+    INTENT_MODEL_FEATURES = 2 ** 17  # Hashed n-gram buckets; must be a power of two
+
+    # Keyword lexicons compiled from data/lexicon/*.txt by `flask build-lexicon`; memory-mapped and reloaded when rebuilt
+    LEXICON_PATH = os.environ.get('LEXICON_PATH', 'instance/lexicon.bin')
+    LEXICON_SOURCE_DIR = os.environ.get('LEXICON_SOURCE_DIR')  # Defaults to data/lexicon; used when LEXICON_PATH is missing
+    LEXICON_CHECK_INTERVAL_SECONDS = 5  # How often workers look for a rebuilt LEXICON_PATH
+
+    # Language identification (character n-grams trained on data/langid/<language>.txt)
+    LANGID_LANGUAGES = os.environ.get('LANGID_LANGUAGES', 'en,rw').split(',')  # Add fr,sw to detect them too
+    LANGID_MIN_CONFIDENCE = 0.9  # Less certain texts fall back to the Kinyarwanda keyword rule
+
+    # Executor for CPU-heavy NLP and speech-to-text: 'inline', 'thread' or 'process' (warm pool, shared-memory weights)
+    EXECUTOR_BACKEND = os.environ.get('EXECUTOR_BACKEND', 'inline')
+    EXECUTOR_WORKERS = int(os.environ.get('EXECUTOR_WORKERS', 0)) or None  # Defaults to CPU count minus one
+    EXECUTOR_TIMEOUT_SECONDS = 5  # Longer NLP jobs are redone inline; longer STT jobs fail the call step
+    EXECUTOR_RECYCLE_AFTER_TIMEOUTS = 3  # Consecutive timeouts after which the process pool is replaced (0 never)
+    EXECUTOR_START_METHOD = 'spawn'
 
     # Celery configuration
     CELERY_BROKER_URL = 'redis://localhost:6379/0'
     CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
 
+    # Inbound SMS pipeline: 'inline' answers inside the webhook, 'async' queues NLP and the reply to Celery
+    SMS_PIPELINE_MODE = os.environ.get('SMS_PIPELINE_MODE', 'inline')
+    SMS_PIPELINE_LOCK_URL = os.environ.get('SMS_PIPELINE_LOCK_URL')  # Redis for per-conversation locks; defaults to the broker
+    SMS_PIPELINE_LOCK_TIMEOUT_SECONDS = 120  # Released automatically if a worker dies holding it
+    SMS_PIPELINE_LOCK_WAIT_SECONDS = 10
+    SMS_PIPELINE_RETRY_SECONDS = 2
+
+    # Inbound webhook idempotency: provider retries are acknowledged without creating messages or replies
+    INBOUND_DEDUP_ENABLED = os.environ.get('INBOUND_DEDUP_ENABLED', 'true').lower() == 'true'
+    INBOUND_DEDUP_CACHE_SIZE = 10000  # Recent keys answered without a database round trip
+    INBOUND_DEDUP_CACHE_TTL_HOURS = 24  # Also how long keys are kept in the database
+    INBOUND_DEDUP_PRUNE_INTERVAL_SECONDS = 3600  # Expired keys are deleted at most this often
+
+    # Outbound SMS queue: identical bodies sent within the window share one multi-recipient provider call
+    SMS_QUEUE_ENABLED = os.environ.get('SMS_QUEUE_ENABLED', 'true').lower() == 'true'  # false sends each SMS in the caller
+    SMS_QUEUE_MAX_RECIPIENTS = int(os.environ.get('SMS_QUEUE_MAX_RECIPIENTS', 100))  # A full group is sent at once
+    SMS_QUEUE_MAX_DELAY_MS = int(os.environ.get('SMS_QUEUE_MAX_DELAY_MS', 250))  # Longest a reply waits for company
+
+    # Outbound SMS rate limits: token buckets per sender ID or shortcode, in 'local', 'file' (flock, one host) or 'redis' state
+    SMS_RATE_LIMIT_BACKEND = os.environ.get('SMS_RATE_LIMIT_BACKEND', 'file')
+    SMS_RATE_LIMIT_URL = os.environ.get('SMS_RATE_LIMIT_URL')  # Redis backend; defaults to the broker
+    SMS_RATE_LIMIT_DIR = os.environ.get('SMS_RATE_LIMIT_DIR', 'instance/sms_rate_limits')
+    SMS_RATE_LIMIT_PER_SECOND = float(os.environ.get('SMS_RATE_LIMIT_PER_SECOND', 10))  # Messages per second per sender
+    SMS_RATE_LIMIT_BURST = float(os.environ.get('SMS_RATE_LIMIT_BURST', 50))
+    SMS_RATE_LIMITS = os.environ.get('SMS_RATE_LIMITS', '')  # Per-sender overrides: 'TUGENDANE=5/20,635=20/100'
+    # Sender per priority lane (interactive, follow_up, bulk); unset lanes use the account's default sender
+    SMS_LANE_SENDERS = dict(
+        item.split('=', 1) for item in os.environ.get('SMS_LANE_SENDERS', '').split(',') if '=' in item
+    )
+
+    # Outbound SMS composition: over-budget messages are abbreviated, compacted or list fewer items
+    SMS_MAX_SEGMENTS = int(os.environ.get('SMS_MAX_SEGMENTS', 3))  # 153 GSM-7 or 67 UCS-2 characters per part
+    SMS_TRANSLITERATE = os.environ.get('SMS_TRANSLITERATE', 'true').lower() == 'true'  # Smart quotes etc. to GSM-7, avoiding UCS-2
+
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(days=31)
 
+    # Outbound HTTP configuration (shared by geocoding, routing and downloads)
+    HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))
+    HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+    HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 2))  # Idempotent requests only
+    HTTP_BACKOFF_BASE_SECONDS = 0.2
+    HTTP_BACKOFF_MAX_SECONDS = 2.0
+    HTTP_POOL_MAXSIZE = 10  # Keep-alive connections per host
+
+    # Geo configuration
+    SERVICE_SEARCH_RADIUS_KM = float(os.environ.get('SERVICE_SEARCH_RADIUS_KM', 10))
+    SERVICE_INDEX_CELL_DEGREES = 0.01  # ~1.1 km grid cells for the in-memory spatial index
+    SERVICE_INDEX_REFRESH_SECONDS = 300  # Reload periodically to pick up changes made by other workers
+    MAP_CLUSTER_MAX_ZOOM = 16  # Services are shown individually from this zoom level
+    MAP_TILE_MAX_AGE_SECONDS = 300
+    MAP_BBOX_MAX_TILES = 64
+    SERVICE_TILES_DIR = os.environ.get('SERVICE_TILES_DIR', 'instance/service_tiles')  # Precomputed MVT pyramid
+    SERVICE_TILES_MIN_ZOOM = 0
+    SERVICE_TILES_MAX_ZOOM = 14  # Clustered below this zoom, individual services at it
+
+    # Geocoding configuration
+    NOMINATIM_URL = os.environ.get('NOMINATIM_URL', 'https://nominatim.openstreetmap.org/search')
+    GEOCODE_TIMEOUT_SECONDS = 5
+    GEOCODE_LRU_SIZE = 2048
+    GEOCODE_CACHE_PATH = os.environ.get('GEOCODE_CACHE_PATH', 'instance/geocode_cache.sqlite3')
+    GEOCODE_CACHE_TTL_DAYS = 30
+    GEOCODE_NEGATIVE_TTL_HOURS = 6
+
+    # Routing configuration
+    ROUTING_BACKEND = os.environ.get('ROUTING_BACKEND', 'auto')  # 'local', 'graphhopper' or 'auto' (local first)
+    ROAD_GRAPH_PATH = os.environ.get('ROAD_GRAPH_PATH', 'instance/rwanda_roads.npz')
+    ROUTING_MAX_SNAP_METERS = 1000
+    GRAPHHOPPER_API_KEY = os.environ.get('GRAPHHOPPER_API_KEY')
+    GRAPHHOPPER_URL = os.environ.get('GRAPHHOPPER_URL', 'https://graphhopper.com/api/1/route')
+    DIRECTIONS_CACHE_CELL_METERS = 100  # Origins within the same cell share cached routes
+    DIRECTIONS_CACHE_MAX_ENTRIES = 10000
+    DIRECTIONS_CACHE_TTL_HOURS = 24 * 7
+    DIRECTIONS_CACHE_PATH = os.environ.get('DIRECTIONS_CACHE_PATH')  # Set to persist routes across restarts
+    TRAVEL_TIME_MATRIX_PATH = os.environ.get('TRAVEL_TIME_MATRIX_PATH', 'instance/travel_times.bin')
+    TRAVEL_TIME_CELL_DEGREES = 0.01  # ~1.1 km origin cells
+    TRAVEL_TIME_MAX_MINUTES = 180  # Longer walks are stored as unreachable and estimated instead
+    TRAVEL_TIME_DETOUR_FACTOR = 1.3  # Road distance over straight-line distance when estimating
+    TRAVEL_TIME_RERANK_CANDIDATES = 3  # Straight-line shortlist size, as a multiple of the limit
+
     # Service configuration
     DEBUG = True
     PORT = 5000
@@ -1,10 +1,13 @@
+import logging
 from datetime import datetime
 from geoalchemy2 import Geometry
 from app import db
 from sqlalchemy.dialects.postgresql import JSON
-from sqlalchemy import Index, func, Column, Integer, String, Boolean, DateTime, ForeignKey, Float, Text
+from sqlalchemy import inspect, text, Index, func, Column, Integer, String, Boolean, DateTime, ForeignKey, Float, Text
 from sqlalchemy.orm import relationship
 
+logger = logging.getLogger(__name__)
+
 class GovernmentService(db.Model):
     __tablename__ = 'government_services'
 
@@ -103,6 +106,17 @@ class Message(db.Model):
     entities = db.Column(JSON)
     language = db.Column(db.String(10))
 
+    # Outbound delivery: 'queued', then 'sent' or 'failed' once the provider answers
+    delivery_status = db.Column(db.String(20))
+    provider_message_id = db.Column(db.String(100))  # The provider's id, for inbound and outbound messages
+    segment_count = db.Column(db.Integer)  # SMS parts billed for an outbound message
+    encoding = db.Column(db.String(10))  # 'GSM-7' or 'UCS-2'
+
+    # Set once an inbound message has been answered; user messages stored before the column existed were
+    answered_at = db.Column(db.DateTime, info={
+        'backfill': "UPDATE messages SET answered_at = created_at WHERE sender_type = 'user' AND intent IS NOT NULL"
+    })
+
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -134,4 +148,56 @@ class Conversation(db.Model):
     messages = relationship("Message", back_populates="conversation", order_by="Message.created_at")
 
     def __repr__(self):
-        return f"<Conversation {self.id} User:{self.user_id} Channel:{self.channel}>"
\ No newline at end of file
+        return f"<Conversation {self.id} User:{self.user_id} Channel:{self.channel}>"
+
+class InboundMessageKey(db.Model):
+    """Provider callbacks already ingested, so retried webhooks are acknowledged without reprocessing"""
+    __tablename__ = 'inbound_message_keys'
+
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(80), unique=True, nullable=False)  # 'id:<provider id>' or 'h:<sha1 of from, text, date>'
+    message_id = db.Column(db.Integer, db.ForeignKey('messages.id'))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Keys past retention are pruned
+
+    def __repr__(self):
+        return f"<InboundMessageKey {self.key} Message:{self.message_id}>"
+
+def upgrade_schema():
+    """Add model columns that existing tables lack; returns the 'table.column' names added.
+
+    create_all() creates missing tables but never alters existing ones, so
+    columns added to a model since its table was created are added here.
+    Only nullable columns can be added this way; anything else needs a
+    migration. A column's info['backfill'] statement runs right after it is
+    added, in the same transaction.
+    """
+    dialect = db.engine.dialect
+    quote = dialect.identifier_preparer.quote
+    inspector = inspect(db.engine)
+    tables = set(inspector.get_table_names())
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                logger.error(f"Cannot add non-nullable column {table.name}.{column.name}; write a migration")
+                continue
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(text(
+                        f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(dialect=dialect)}"
+                    ))
+                    if column.info.get('backfill'):
+                        connection.execute(text(column.info['backfill']))
+                added.append(f"{table.name}.{column.name}")
+                logger.info(f"Added column {table.name}.{column.name}")
+            except Exception as e:
+                # Another worker starting at the same time may have added it first
+                if column.name not in {c['name'] for c in inspect(db.engine).get_columns(table.name)}:
+                    logger.error(f"Failed to add column {table.name}.{column.name}: {e}")
+    return added
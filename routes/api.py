@@ -1,6 +1,10 @@
+import io
+import csv
+import math
 import logging
 import json
-from flask import Blueprint, request, jsonify, current_app, url_for
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, current_app, url_for, stream_with_context
 from app import db
 from models import User, Conversation, Message, GovernmentService, UserInteraction
 from services.sms_service import SMSService
@@ -8,12 +12,21 @@ from services.voice_service import VoiceService
 from services.nlp_service import NLPService
 from services.geo_service import GeoService
 from services.scheduler import SchedulerService
+from services.llm_gateway import llm_gateway
+from services.sms_pipeline import enqueue_incoming_sms, mark_answered
+from services.executor import job_executor
+from services.inbound_dedup import inbound_dedup, inbound_key
+from services.providers import provider_registry
+from services.sms_composer import sms_composer
 
 logger = logging.getLogger(__name__)
 
 # Create blueprint
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
+# Upper bound on services returned per origin by the batch endpoint
+BATCH_MAX_LIMIT = 10
+
 # Initialize services
 sms_service = SMSService()
 voice_service = VoiceService()
@@ -30,11 +43,28 @@ def initialize_services():
         voice_service.init_app(current_app)
     if not nlp_service.app:
         nlp_service.init_app(current_app)
+    if not llm_gateway.app:
+        llm_gateway.init_app(current_app)
+    if not job_executor.app:
+        job_executor.init_app(current_app)
+    if not inbound_dedup.app:
+        inbound_dedup.init_app(current_app)
     if not geo_service.app:
         geo_service.init_app(current_app)
     if not scheduler_service.app:
         scheduler_service.init_app(current_app)
 
+@api_bp.route('/health')
+def health():
+    """Liveness for load balancer probes: 200 while the app serves requests, with the provider's status in the body"""
+    return jsonify({'status': 'ok', 'provider': provider_registry.health()}), 200
+
+@api_bp.route('/ready')
+def ready():
+    """Readiness for probes that should take an instance out of rotation when it cannot send SMS: 503 then"""
+    result = provider_registry.health()
+    return jsonify(result), 200 if result['ok'] else 503
+
 @api_bp.route('/sms/receive', methods=['POST'])
 def receive_sms():
     """Endpoint for receiving SMS messages from Africa's Talking API"""
@@ -47,18 +77,51 @@ def receive_sms():
             logger.error("Missing required SMS parameters")
             return jsonify({'status': 'error', 'message': 'Missing parameters'}), 400
         
+        # Provider retries of a callback already taken are acknowledged without touching NLP or sending
+        key = inbound_key(request.form)
+        if not inbound_dedup.claim(key):
+            logger.info(f"Ignored duplicate SMS callback from {sender}")
+            return jsonify({'status': 'success', 'message': 'Duplicate SMS ignored'}), 200
+        
         # Process the incoming SMS
-        user, conversation, msg = sms_service.handle_incoming_sms(sender, message)
+        user, conversation, msg = sms_service.handle_incoming_sms(
+            sender, message, provider_message_id=request.form.get('id')
+        )
         
         if not user or not conversation or not msg:
             logger.error("Failed to process incoming SMS")
+            inbound_dedup.release(key)
             return jsonify({'status': 'error', 'message': 'Processing failed'}), 500
+        inbound_dedup.complete(key, msg.id)
         
-        # Process the message with NLP to extract intent and entities
-        nlp_result = nlp_service.process_message(msg.id)
+        # In async mode the message is stored and answered by a worker, so the provider is not kept waiting
+        if current_app.config.get('SMS_PIPELINE_MODE') == 'async' and enqueue_incoming_sms(msg):
+            return jsonify({'status': 'success', 'message': 'SMS queued'}), 200
         
-        # Generate and send response based on the intent
-        response = process_user_intent(user, conversation, msg, nlp_result)
+        try:
+            # Process the message with NLP to extract intent and entities; on executor timeout it runs here
+            analysis = job_executor.result(job_executor.submit_analyze([msg.content]), default=[None])[0]
+            nlp_result = nlp_service.process_message(msg.id, analysis=analysis)
+            
+            # Generate and send response based on the intent
+            response = process_user_intent(user, conversation, msg, nlp_result)
+            mark_answered(msg)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error answering SMS {msg.id}: {e}")
+            # A worker answers the stored message whatever NLP already wrote to it
+            if current_app.config.get('SMS_PIPELINE_MODE') == 'async' and enqueue_incoming_sms(msg):
+                return jsonify({'status': 'success', 'message': 'SMS queued'}), 200
+
+            # Nothing will answer it here, so forget the message and let the provider's retry through
+            inbound_dedup.release(key)
+            try:
+                db.session.delete(msg)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Failed to discard unanswered SMS {msg.id}: {e}")
+            return jsonify({'status': 'error', 'message': 'Processing failed'}), 500
         
         return jsonify({'status': 'success', 'message': 'SMS processed successfully'}), 200
         
@@ -129,13 +192,17 @@ def voice_recording():
             return voice_service.generate_voice_response("error")
         
         # Process the voice recording (convert speech to text)
-        text = voice_service.process_speech_to_text(recording_url)
+        text = job_executor.result(job_executor.submit_speech_to_text(recording_url))
+        if not text:
+            logger.error("Speech-to-text failed or timed out")
+            return voice_service.generate_voice_response("error")
         
         # Record the message
         msg = voice_service.record_voice_message(conversation.id, text)
         
-        # Process with NLP
-        nlp_result = nlp_service.process_message(msg.id)
+        # Process with NLP; on executor timeout it runs here
+        analysis = job_executor.result(job_executor.submit_analyze([text]), default=[None])[0]
+        nlp_result = nlp_service.process_message(msg.id, analysis=analysis)
         
         # Check for service request
         if nlp_result and nlp_result['intent'] == 'find_service':
@@ -167,6 +234,7 @@ def voice_recording():
                     return voice_service.generate_voice_response(
                         "service_confirmation",
                         service_name=service['name'],
+                        walking_minutes=service['travel_time_min'],
                         language=user.language_preference,
                         callback_url=callback_url
                     )
@@ -237,7 +305,8 @@ def voice_confirmation():
                 user.last_longitude,
                 service.latitude,
                 service.longitude,
-                language=user.language_preference
+                language=user.language_preference,
+                service_id=service.id
             )
             
             # Format directions as text
@@ -318,6 +387,127 @@ def voice_call_status():
         logger.error(f"Error in voice_call_status: {e}")
         return "", 500
 
+@api_bp.route('/services/nearest/batch', methods=['POST'])
+def nearest_services_batch():
+    """Bulk nearest-service lookup for many origins, streamed back as NDJSON or CSV
+    
+    Origins come from a JSON body ({"origins": [{"ref", "latitude", "longitude", "category"}]}
+    or just the array of origins), an uploaded CSV file field named 'file', or a raw text/csv
+    body. CSV columns are ref, latitude (or lat), longitude (or lng/lon) and an optional
+    category. Options not in a JSON object body are read from the query string.
+    """
+    try:
+        output_format = request.args.get('format', 'ndjson')
+        if output_format not in ('ndjson', 'csv'):
+            return jsonify({'status': 'error', 'message': 'format must be ndjson or csv'}), 400
+        
+        payload = request.get_json(silent=True) if request.is_json else None
+        if isinstance(payload, list):
+            payload = {'origins': payload}
+            options = request.args
+        elif payload is not None and not isinstance(payload, dict):
+            return jsonify({'status': 'error', 'message': 'JSON body must be an object or an array of origins'}), 400
+        else:
+            options = payload or request.values
+        
+        limit = max(1, min(int(options.get('limit', 1)), BATCH_MAX_LIMIT))
+        radius_km = float(options.get('radius_km') or math.inf)
+        categories = options.get('categories')
+        if isinstance(categories, str):
+            categories = [category.strip() for category in categories.split(',') if category.strip()]
+        
+        if payload is not None:
+            origins = (_parse_origin(origin) for origin in payload.get('origins', []))
+        elif 'file' in request.files:
+            stream = io.TextIOWrapper(request.files['file'].stream, encoding='utf-8')
+            origins = (_parse_origin(row) for row in csv.DictReader(stream))
+        elif request.mimetype == 'text/csv':
+            stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+            origins = (_parse_origin(row) for row in csv.DictReader(stream))
+        else:
+            return jsonify({'status': 'error', 'message': 'Provide a JSON body, a CSV upload or a text/csv body'}), 400
+        
+        results = geo_service.find_nearest_services_batch(
+            origins,
+            categories=categories or None,
+            limit=limit,
+            radius_km=radius_km
+        )
+        
+        if output_format == 'csv':
+            body = _batch_results_as_csv(results)
+            mimetype = 'text/csv'
+        else:
+            body = (json.dumps(result) + '\n' for result in results)
+            mimetype = 'application/x-ndjson'
+        
+        return Response(stream_with_context(body), mimetype=mimetype)
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'Invalid parameters: {e}'}), 400
+    except Exception as e:
+        logger.error(f"Error in nearest_services_batch: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@api_bp.route('/services/export.geojson')
+def export_services_geojson():
+    """Stream the full service catalog, or services updated since ?since=, as GeoJSON"""
+    try:
+        since = request.args.get('since')
+        since = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'since must be an ISO 8601 timestamp'}), 400
+    
+    body = geo_service.export_geojson(since=since, category=request.args.get('category') or None)
+    return Response(
+        stream_with_context(body),
+        mimetype='application/geo+json',
+        headers={'Content-Disposition': 'attachment; filename=services.geojson'}
+    )
+
+def _parse_origin(row):
+    """Normalize an input row into an origin dict; bad coordinates become None"""
+    def number(bound, *keys):
+        for key in keys:
+            value = row.get(key)
+            if value not in (None, ''):
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    return None
+                # float() accepts 'nan' and 'inf', which would match a service and break the JSON output
+                return value if math.isfinite(value) and abs(value) <= bound else None
+        return None
+    
+    return {
+        'ref': row.get('ref', row.get('id')),
+        'latitude': number(90, 'latitude', 'lat'),
+        'longitude': number(180, 'longitude', 'lng', 'lon'),
+        'category': row.get('category') or None
+    }
+
+def _batch_results_as_csv(results):
+    """Flatten batch results into CSV lines, one per origin/service pair"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['ref', 'latitude', 'longitude', 'category', 'rank', 'service_id', 'service_name', 'distance_km', 'error'])
+    
+    for result in results:
+        if 'error' in result:
+            writer.writerow([result['ref'], '', '', '', '', '', '', '', result['error']])
+        elif not result['services']:
+            writer.writerow([result['ref'], result['latitude'], result['longitude'], result['category'] or '', '', '', '', '', ''])
+        for rank, service in enumerate(result.get('services', []), 1):
+            writer.writerow([
+                result['ref'], result['latitude'], result['longitude'], result['category'] or '',
+                rank, service['id'], service['name'], service['distance_km'], ''
+            ])
+        
+        # Hand the buffered lines to the client and start a fresh buffer
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
 def process_user_intent(user, conversation, message, nlp_result):
     """Process user intent and generate appropriate response"""
     if not nlp_result:
@@ -354,6 +544,9 @@ def process_user_intent(user, conversation, message, nlp_result):
     elif intent == 'help':
         return send_help_information(user, conversation)
         
+    elif intent == 'general_inquiry' and current_app.config.get('LLM_FALLBACK_ENABLED'):
+        return send_llm_response(user, conversation, message.content)
+        
     else:
         return send_default_response(user, conversation)
 
@@ -382,38 +575,38 @@ def find_service_for_user(user, conversation, entities):
         )
         
         if services:
-            # Format service information
+            # Format service information, listing as many services as fit the segment budget; the header counts those listed
             if user.language_preference == 'rw':
-                message = f"Nabonye {len(services)} serivisi za {service_type or 'guverinoma'} hafi yawe:\n\n"
+                header = lambda count: f"Nabonye {count} serivisi za {service_type or 'guverinoma'} hafi yawe:\n"
+                footer = "Shyiramo nomero ya service ukeneye amabwiriza yo kuyigeraho (urugero: '1')."
             else:
-                message = f"Found {len(services)} {service_type or 'government'} services near you:\n\n"
+                header = lambda count: f"Found {count} {service_type or 'government'} services near you:\n"
+                footer = "Enter the number of the service you want directions to (example: '1')."
             
+            items = []
             for i, service in enumerate(services[:3], 1):
                 if user.language_preference == 'rw':
-                    message += f"{i}. {service['name']} ({service['distance_km']} km)\n"
-                    message += f"   Aho Iherereye: {service['address']}\n"
+                    item = f"{i}. {service['name']} ({service['distance_km']} km, iminota ~{service['travel_time_min']} n'amaguru)\n"
+                    item += f"   Aho Iherereye: {service['address']}\n"
                     if service['opening_hours']:
-                        message += f"   Amasaha: {service['opening_hours']}\n"
+                        item += f"   Amasaha: {service['opening_hours']}\n"
                     if service['phone_number']:
-                        message += f"   Telefone: {service['phone_number']}\n"
+                        item += f"   Telefone: {service['phone_number']}\n"
                 else:
-                    message += f"{i}. {service['name']} ({service['distance_km']} km)\n"
-                    message += f"   Address: {service['address']}\n"
+                    item = f"{i}. {service['name']} ({service['distance_km']} km, ~{service['travel_time_min']} min walk)\n"
+                    item += f"   Address: {service['address']}\n"
                     if service['opening_hours']:
-                        message += f"   Hours: {service['opening_hours']}\n"
+                        item += f"   Hours: {service['opening_hours']}\n"
                     if service['phone_number']:
-                        message += f"   Phone: {service['phone_number']}\n"
-                message += "\n"
+                        item += f"   Phone: {service['phone_number']}\n"
+                items.append(item)
             
-            if user.language_preference == 'rw':
-                message += "Shyiramo nomero ya service ukeneye amabwiriza yo kuyigeraho (urugero: '1')."
-            else:
-                message += "Enter the number of the service you want directions to (example: '1')."
+            message, listed = sms_composer.fit(header, items, footer)
             
             # Update conversation state
             conversation.current_state = 'service_selection'
             conversation.context = json.dumps({
-                'service_ids': [s['id'] for s in services[:3]]
+                'service_ids': [s['id'] for s in services[:listed]]
             })
             db.session.commit()
             
@@ -508,7 +701,8 @@ def get_directions_for_user(user, conversation, entities):
                     user.last_longitude,
                     service['latitude'],
                     service['longitude'],
-                    language=user.language_preference
+                    language=user.language_preference,
+                    service_id=service['id']
                 )
                 
                 # Format directions as text
@@ -710,31 +904,47 @@ def process_follow_up_reply(user, conversation, intent, message_text):
 
 def send_help_information(user, conversation):
     """Send help information to the user"""
+    # Examples are dropped from the end rather than send the help in more segments than the budget
     if user.language_preference == 'rw':
-        message = """Ubu ni bumwe mu buryo wakoresha Tugendane:
-
-1. Gushaka serivisi: "Ndashaka ivuriro hafi"
-2. Kubona inzira: "Amabwiriza yo kujya ku biro by'umurenge"
-3. Gusesengura amasaha: "Ni ryari minisiteri ifungurwa?"
-4. Impapuro zisabwa: "Ni ibihe byangombwa bisabwa kubona passport?"
-
-Shyiramo SMS yawe mu rurimi urwo aricyo cyose (Icyongereza cyangwa Ikinyarwanda).
-"""
+        header = "Ubu ni bumwe mu buryo wakoresha Tugendane:\n"
+        examples = [
+            '1. Gushaka serivisi: "Ndashaka ivuriro hafi"',
+            '2. Kubona inzira: "Amabwiriza yo kujya ku biro by\'umurenge"',
+            '3. Gusesengura amasaha: "Ni ryari minisiteri ifungurwa?"',
+            '4. Impapuro zisabwa: "Ni ibihe byangombwa bisabwa kubona passport?"'
+        ]
+        footer = "\nShyiramo SMS yawe mu rurimi urwo aricyo cyose (Icyongereza cyangwa Ikinyarwanda)."
     else:
-        message = """Here are some ways you can use Tugendane:
-
-1. Find a service: "I need a health clinic nearby"
-2. Get directions: "Directions to the sector office"
-3. Check hours: "When is the ministry open?"
-4. Required documents: "What documents do I need for a passport?"
-
-You can send your SMS in either English or Kinyarwanda.
-"""
+        header = "Here are some ways you can use Tugendane:\n"
+        examples = [
+            '1. Find a service: "I need a health clinic nearby"',
+            '2. Get directions: "Directions to the sector office"',
+            '3. Check hours: "When is the ministry open?"',
+            '4. Required documents: "What documents do I need for a passport?"'
+        ]
+        footer = "\nYou can send your SMS in either English or Kinyarwanda."
+    
+    message, _ = sms_composer.fit(header, examples, footer)
     
     # Send the response
     sms_service.send_response(user, conversation, message)
     return True
 
+def send_llm_response(user, conversation, message_text):
+    """Answer a message no intent matched with the LLM, or send the default response"""
+    language = 'Kinyarwanda' if user.language_preference == 'rw' else 'English'
+    system = (
+        "You help people in Rwanda find government services (health, education, identification, "
+        f"taxation, social support) by SMS. Reply in {language} in at most 300 characters. "
+        "If the question is unrelated to public services, say what you can help with."
+    )
+    answer = llm_gateway.complete(message_text, system=system)
+    if not answer or not answer['text']:
+        return send_default_response(user, conversation)
+    
+    sms_service.send_response(user, conversation, answer['text'])
+    return True
+
 def send_default_response(user, conversation):
     """Send a default response when intent is not recognized"""
     if user.language_preference == 'rw':
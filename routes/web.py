@@ -1,10 +1,18 @@
+import os
 import logging
 import json
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app, flash, session
+import math
+from flask import Blueprint, render_template, request, jsonify, redirect, url_for, current_app, flash, session, send_from_directory
 from app import db
 from models import User, Conversation, Message, GovernmentService, UserInteraction
 from services.nlp_service import NLPService
 from services.geo_service import GeoService
+from services.llm_gateway import llm_gateway
+from services.executor import job_executor
+from services.sms_queue import sms_queue
+from services.sms_composer import sms_composer
+from services.inbound_dedup import inbound_dedup
+from services.providers import provider_registry
 from sqlalchemy import desc, func
 
 logger = logging.getLogger(__name__)
@@ -150,36 +158,35 @@ def get_services():
     try:
         lat = request.args.get('lat', type=float)
         lng = request.args.get('lng', type=float)
-        radius = request.args.get('radius', default=10, type=float)  # 10km default radius
+        radius = request.args.get('radius', type=float)  # Optional radius in km
         
         if not lat or not lng:
             # Default to Rwanda center
             lat = -1.9403
             lng = 29.8739
         
-        if lat and lng:
-            # Get services near the user's location
-            services = GovernmentService.query.order_by(
-                GovernmentService.location.distance_centroid(
-                    'POINT({} {})'.format(lng, lat)
-                )
-            ).limit(10).all()
-        else:
-            # Get all services if no location provided
-            services = GovernmentService.query.all()
+        # Get the services nearest to the requested location
+        services = geo_service.find_nearest_services(
+            lat,
+            lng,
+            limit=10,
+            radius_km=radius or math.inf
+        )
         
         # Format services for map display
         service_list = []
         for service in services:
             service_list.append({
-                'id': service.id,
-                'name': service.name,
-                'category': service.category,
-                'address': service.address,
-                'latitude': service.latitude,
-                'longitude': service.longitude,
-                'phone_number': service.phone_number,
-                'opening_hours': service.opening_hours
+                'id': service['id'],
+                'name': service['name'],
+                'category': service['category'],
+                'address': service['address'],
+                'latitude': service['latitude'],
+                'longitude': service['longitude'],
+                'phone_number': service['phone_number'],
+                'opening_hours': service['opening_hours'],
+                'distance_km': service['distance_km'],
+                'travel_time_min': service['travel_time_min']
             })
         
         return jsonify({'services': service_list})
@@ -188,6 +195,66 @@ def get_services():
         logger.error(f"Error getting services: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@web_bp.route('/api/services/tiles/<int:z>/<int:x>/<int:y>.json')
+def get_service_tile(z, x, y):
+    """Clustered services inside one map tile, cacheable by browsers and proxies"""
+    try:
+        category = request.args.get('category') or None
+        features = geo_service.service_tile(z, x, y, category=category)
+        
+        response = jsonify({'z': z, 'x': x, 'y': y, 'features': features})
+        response.add_etag()
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config.get('MAP_TILE_MAX_AGE_SECONDS', 300)
+        return response.make_conditional(request)
+        
+    except Exception as e:
+        logger.error(f"Error getting service tile {z}/{x}/{y}: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+@web_bp.route('/api/services/vector/<int:z>/<int:x>/<int:y>.pbf')
+def get_service_vector_tile(z, x, y):
+    """Precomputed Mapbox Vector Tile from the pyramid built by `flask build-service-tiles`"""
+    directory = os.path.abspath(current_app.config['SERVICE_TILES_DIR'])
+    if not os.path.exists(os.path.join(directory, str(z), str(x), f"{y}.pbf")):
+        # Empty tiles are not stored
+        return '', 204
+    
+    return send_from_directory(
+        directory,
+        f"{z}/{x}/{y}.pbf",
+        mimetype='application/vnd.mapbox-vector-tile',
+        max_age=current_app.config.get('MAP_TILE_MAX_AGE_SECONDS', 300)
+    )
+
+@web_bp.route('/api/services/bbox')
+def get_services_in_bbox():
+    """Clustered services inside a map viewport"""
+    try:
+        south = request.args.get('south', type=float)
+        west = request.args.get('west', type=float)
+        north = request.args.get('north', type=float)
+        east = request.args.get('east', type=float)
+        zoom = request.args.get('zoom', type=int)
+        
+        if None in (south, west, north, east, zoom):
+            return jsonify({'status': 'error', 'message': 'south, west, north, east and zoom are required'}), 400
+        
+        try:
+            features = geo_service.services_in_bbox(
+                south, west, north, east, zoom,
+                category=request.args.get('category') or None,
+                max_tiles=current_app.config.get('MAP_BBOX_MAX_TILES', 64)
+            )
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        
+        return jsonify({'zoom': zoom, 'features': features})
+        
+    except Exception as e:
+        logger.error(f"Error getting services in bbox: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @web_bp.route('/admin')
 def admin():
     """Admin dashboard for monitoring"""
@@ -229,6 +296,20 @@ def admin():
         service_usage=service_usage
     )
 
+@web_bp.route('/admin/metrics')
+def admin_metrics():
+    """Cache and index counters for capacity monitoring"""
+    return jsonify({
+        'geo': geo_service.stats(),
+        'nlp': nlp_service.stats(),
+        'llm': llm_gateway.stats(),
+        'executor': job_executor.stats(),
+        'sms_queue': sms_queue.stats(),
+        'sms_composer': sms_composer.stats(),
+        'inbound_dedup': inbound_dedup.stats(),
+        'providers': provider_registry.stats()
+    })
+
 @web_bp.route('/admin/conversation/<int:conversation_id>')
 def view_conversation(conversation_id):
     """View details of a conversation"""
@@ -0,0 +1,91 @@
+import math
+import logging
+from services.cache_store import LRUCache, SQLiteCacheStore
+
+logger = logging.getLogger(__name__)
+
+# Meters per degree of latitude on the mean-radius sphere
+METERS_PER_DEGREE = 111195.0
+
+class DirectionsCache:
+    """Bounded LRU cache of routing results keyed on snapped origin cells.
+
+    Origins are snapped to a grid of roughly cell_meters, so every request
+    starting in the same cell for the same destination, vehicle and locale
+    shares one routing call. Entries can optionally persist in a SQLite file
+    so they survive restarts and are shared between workers.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.cell_degrees = 100 / METERS_PER_DEGREE
+        self.memory = LRUCache()
+        self.store = None
+        self.hits = 0
+        self.misses = 0
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize with Flask app context"""
+        self.app = app
+        self.cell_degrees = app.config.get('DIRECTIONS_CACHE_CELL_METERS', 100) / METERS_PER_DEGREE
+        self.ttl_seconds = app.config.get('DIRECTIONS_CACHE_TTL_HOURS', 24 * 7) * 3600
+        self.memory = LRUCache(
+            maxsize=app.config.get('DIRECTIONS_CACHE_MAX_ENTRIES', 10000),
+            ttl_seconds=self.ttl_seconds
+        )
+
+        store_path = app.config.get('DIRECTIONS_CACHE_PATH')
+        if store_path:
+            try:
+                self.store = SQLiteCacheStore(store_path, 'directions')
+            except Exception as e:
+                logger.error(f"Failed to open directions cache at {store_path}: {e}")
+                self.store = None
+
+    def snap(self, latitude, longitude):
+        """Grid cell containing a coordinate"""
+        return (
+            math.floor(latitude / self.cell_degrees),
+            math.floor(longitude / self.cell_degrees)
+        )
+
+    def make_key(self, from_lat, from_lng, to_lat, to_lng, vehicle, locale, service_id=None):
+        """Cache key for a route; known services are keyed by id, other destinations by cell"""
+        origin = self.snap(from_lat, from_lng)
+        if service_id is not None:
+            destination = f"s{service_id}"
+        else:
+            destination = "c{}:{}".format(*self.snap(to_lat, to_lng))
+        return f"{origin[0]}:{origin[1]}|{destination}|{vehicle}|{locale}"
+
+    def get(self, key):
+        directions = self.memory.get(key)
+        if directions is None and self.store:
+            directions = self.store.get(key)
+            if directions is not None:
+                self.memory.set(key, directions)
+
+        if directions is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return directions
+
+    def set(self, key, directions):
+        self.memory.set(key, directions)
+        if self.store:
+            self.store.set(key, directions, ttl_seconds=self.ttl_seconds)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'cell_meters': round(self.cell_degrees * METERS_PER_DEGREE),
+            'memory': self.memory.stats(),
+            'store': self.store.stats() if self.store else None
+        }
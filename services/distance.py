@@ -0,0 +1,97 @@
+import logging
+import numpy as np
+from utils import EARTH_RADIUS_KM
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on origins x catalog cells evaluated at once (~32 MB of float64)
+MAX_MATRIX_ELEMENTS = 4_000_000
+
+class HaversineEngine:
+    """Vectorized haversine distances over a catalog held in contiguous float64 arrays"""
+
+    def __init__(self, latitudes=(), longitudes=()):
+        self.load(latitudes, longitudes)
+
+    def load(self, latitudes, longitudes):
+        """Replace the catalog coordinates (degrees)"""
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        if latitudes.shape != longitudes.shape:
+            raise ValueError("latitudes and longitudes must have the same shape")
+
+        self.lat_rad = np.ascontiguousarray(np.radians(latitudes))
+        self.lng_rad = np.ascontiguousarray(np.radians(longitudes))
+        self.cos_lat = np.cos(self.lat_rad)
+
+    def __len__(self):
+        return self.lat_rad.shape[0]
+
+    def _catalog(self, rows):
+        if rows is None:
+            return self.lat_rad, self.lng_rad, self.cos_lat
+        return self.lat_rad[rows], self.lng_rad[rows], self.cos_lat[rows]
+
+    def distances(self, latitude, longitude, rows=None):
+        """Distances in km from one origin to every catalog row (or the given row positions)"""
+        lat_rad, lng_rad, cos_lat = self._catalog(rows)
+        origin_lat = np.radians(latitude)
+        origin_lng = np.radians(longitude)
+
+        a = np.sin((lat_rad - origin_lat) / 2) ** 2
+        a += np.cos(origin_lat) * cos_lat * np.sin((lng_rad - origin_lng) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def distance_matrix(self, latitudes, longitudes, rows=None):
+        """Distances in km with shape (origins, catalog rows) computed in a single pass"""
+        lat_rad, lng_rad, cos_lat = self._catalog(rows)
+        origin_lat = np.radians(np.asarray(latitudes, dtype=np.float64))[:, np.newaxis]
+        origin_lng = np.radians(np.asarray(longitudes, dtype=np.float64))[:, np.newaxis]
+
+        a = np.sin((lat_rad - origin_lat) / 2) ** 2
+        a += np.cos(origin_lat) * cos_lat * np.sin((lng_rad - origin_lng) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+    def top_k(self, latitudes, longitudes, k, rows=None, max_km=None):
+        """Nearest k catalog positions for every origin.
+
+        Returns (positions, distances), both shaped (origins, k) and ordered by
+        distance. Slots without a match (fewer rows, or beyond max_km) hold
+        position -1 and distance inf.
+        """
+        latitudes = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        longitudes = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        origins = latitudes.shape[0]
+
+        candidates = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.intp)
+        positions = np.full((origins, k), -1, dtype=np.intp)
+        distances = np.full((origins, k), np.inf)
+        n = candidates.shape[0]
+        if n == 0 or k <= 0 or origins == 0:
+            return positions, distances
+
+        kk = min(k, n)
+        chunk = max(1, MAX_MATRIX_ELEMENTS // n)
+        for start in range(0, origins, chunk):
+            stop = min(start + chunk, origins)
+            matrix = self.distance_matrix(latitudes[start:stop], longitudes[start:stop], rows=rows)
+
+            # argpartition finds the k smallest in linear time; only those k get sorted
+            if kk < n:
+                nearest = np.argpartition(matrix, kk - 1, axis=1)[:, :kk]
+            else:
+                nearest = np.broadcast_to(np.arange(n), (stop - start, n))
+            nearest_distances = np.take_along_axis(matrix, nearest, axis=1)
+            order = np.argsort(nearest_distances, axis=1)
+            nearest = np.take_along_axis(nearest, order, axis=1)
+            nearest_distances = np.take_along_axis(nearest_distances, order, axis=1)
+
+            positions[start:stop, :kk] = candidates[nearest]
+            distances[start:stop, :kk] = nearest_distances
+
+        if max_km is not None:
+            beyond = distances > max_km
+            positions[beyond] = -1
+            distances[beyond] = np.inf
+
+        return positions, distances
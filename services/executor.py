@@ -0,0 +1,371 @@
+import os
+import time
+import atexit
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+import numpy as np
+from services.http_client import UpstreamMetrics
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('inline', 'thread', 'process')
+SHARED_ALIGNMENT = 64
+
+class SharedArrays:
+    """NumPy arrays copied once into a shared memory block that child processes map without copying"""
+
+    def __init__(self, arrays):
+        layout = {}
+        offset = 0
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            layout[key] = (offset, array.dtype.str, array.shape)
+            offset += (array.nbytes + SHARED_ALIGNMENT - 1) // SHARED_ALIGNMENT * SHARED_ALIGNMENT
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for key, array in arrays.items():
+            start, dtype, shape = layout[key]
+            np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=start)[...] = array
+        self.manifest = {'name': self.shm.name, 'layout': layout}
+        self.nbytes = offset
+
+    @staticmethod
+    def attach(manifest):
+        """Map a published block; returns the SharedMemory handle (keep it alive) and read-only views"""
+        # Pool children share the parent's resource tracker, so the block is only unlinked by close()
+        shm = shared_memory.SharedMemory(name=manifest['name'])
+
+        views = {}
+        for key, (start, dtype, shape) in manifest['layout'].items():
+            view = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=start)
+            view.flags.writeable = False
+            views[key] = view
+        return shm, views
+
+    def close(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+# State of the process running jobs: a pool child, or the web worker itself for inline/thread backends
+_worker = {}
+_worker_lock = threading.Lock()
+
+def _init_worker(config, models):
+    """Load services once per child; model weights come from shared memory when published"""
+    from flask import Flask
+    from services.nlp_service import NLPService, install_models
+    from services.intent_model import IntentModel
+    from services.language_id import LanguageIdentifier
+
+    intent_model = language_identifier = None
+    if models:
+        shm, arrays = SharedArrays.attach(models['shared'])
+        _worker['shm'] = shm
+        if 'intent_model' in models:
+            meta = models['intent_model']
+            intent_model = IntentModel(
+                meta['classes'], arrays['intent_class_log_prior'], arrays['intent_feature_log_prob'],
+                built_at=meta['built_at'], metrics=meta['metrics']
+            )
+        if 'language_identifier' in models:
+            meta = models['language_identifier']
+            language_identifier = LanguageIdentifier(
+                meta['languages'], arrays['langid_log_prob'], fingerprint=meta['fingerprint'],
+                position_log_prob=arrays['langid_position_log_prob']
+            )
+
+    app = Flask('executor')
+    app.config.update(config)
+    install_models(app.config, intent_model=intent_model, language_identifier=language_identifier)
+    _worker['app'] = app
+    _worker['nlp'] = NLPService(app)
+    _worker['pid'] = os.getpid()
+
+def _worker_services():
+    if not _worker:
+        raise RuntimeError("Executor worker is not initialized")
+    return _worker
+
+def _timed(function, *args):
+    started = time.perf_counter()
+    started_cpu = time.process_time()
+    result = function(*args)
+    return result, time.perf_counter() - started, time.process_time() - started_cpu, os.getpid()
+
+def _ping():
+    return _worker_services()['pid']
+
+def _analyze_job(texts):
+    return _worker_services()['nlp'].analyze_many(texts)
+
+def _speech_to_text_job(audio_url):
+    worker = _worker_services()
+    if 'voice' not in worker:
+        from services.voice_service import VoiceService
+        worker['voice'] = VoiceService()
+    return worker['voice'].process_speech_to_text(audio_url)
+
+class JobExecutor:
+    """Runs CPU-heavy NLP and speech-to-text jobs off the request thread.
+
+    Backends: 'inline' runs jobs in the caller and returns finished futures,
+    'thread' uses a thread pool, and 'process' uses a warm process pool whose
+    children build their services once and map model weights from one shared
+    memory block. Callers get futures and collect them with result(), which
+    enforces the timeout and records utilization. A process pool that broke
+    (a child was killed) is replaced on the next submit, and one whose jobs
+    keep timing out is recycled, since a timed-out job keeps its process.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.backend = 'inline'
+        self.workers = max(1, (os.cpu_count() or 2) - 1)
+        self.timeout = 5
+        self.recycle_after_timeouts = 3
+        self.start_method = 'spawn'
+        self.latency = UpstreamMetrics()
+        self.counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'timeouts': 0, 'pool_restarts': 0}
+        self.busy_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.in_flight = 0
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+        self._pool_models = None
+        self._shared = None
+        self._timeouts_in_a_row = 0
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize with Flask app context"""
+        self.app = app
+        self.backend = app.config.get('EXECUTOR_BACKEND', self.backend)
+        if self.backend not in BACKENDS:
+            logger.error(f"Unknown executor backend {self.backend}; using inline")
+            self.backend = 'inline'
+        self.workers = app.config.get('EXECUTOR_WORKERS') or self.workers
+        self.timeout = app.config.get('EXECUTOR_TIMEOUT_SECONDS', self.timeout)
+        self.recycle_after_timeouts = app.config.get('EXECUTOR_RECYCLE_AFTER_TIMEOUTS', self.recycle_after_timeouts)
+        self.start_method = app.config.get('EXECUTOR_START_METHOD', self.start_method)
+        atexit.register(self.shutdown)
+
+    def _worker_config(self):
+        """The picklable part of the app config, for building services in children"""
+        return {
+            key: value for key, value in self.app.config.items()
+            if isinstance(value, (str, int, float, bool, list, tuple, type(None)))
+        }
+
+    def _current_models(self):
+        """The models the web worker would use now, so the pool is rebuilt when they change"""
+        from services.nlp_service import get_intent_model, get_language_identifier
+        from services.language_id import CORPUS_DIR
+
+        intent_model = get_intent_model(self.app.config.get('INTENT_MODEL_PATH'))
+        language_identifier = get_language_identifier(
+            self.app.config.get('LANGID_CORPUS_DIR') or CORPUS_DIR,
+            self.app.config.get('LANGID_LANGUAGES', ['en', 'rw'])
+        )
+        return intent_model, language_identifier
+
+    def _publish_models(self, intent_model, language_identifier):
+        """Copy model weights into shared memory; returns the manifest children attach to"""
+        arrays = {}
+        models = {}
+        if intent_model is not None:
+            arrays['intent_feature_log_prob'] = intent_model.feature_log_prob
+            arrays['intent_class_log_prior'] = intent_model.class_log_prior
+            models['intent_model'] = {
+                'classes': intent_model.classes, 'built_at': intent_model.built_at, 'metrics': intent_model.metrics
+            }
+        if language_identifier is not None:
+            arrays['langid_log_prob'] = language_identifier.log_prob
+            arrays['langid_position_log_prob'] = language_identifier.position_log_prob
+            models['language_identifier'] = {
+                'languages': language_identifier.languages, 'fingerprint': language_identifier.fingerprint
+            }
+        if not arrays:
+            return None
+
+        self._shared = SharedArrays(arrays)
+        models['shared'] = self._shared.manifest
+        logger.info(f"Published {self._shared.nbytes / 1e6:.1f} MB of model weights to shared memory")
+        return models
+
+    def _get_pool(self):
+        if self.backend == 'inline':
+            return None
+
+        with self._lock:
+            models = self._current_models() if self.backend == 'process' else None
+            if self._pool is not None and self._pool_pid == os.getpid() and self._pool_models == models:
+                return self._pool
+
+            # Pools and their children belong to the process that made them; models may have been rebuilt
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self.counters['pool_restarts'] += 1
+                self._pool.shutdown(wait=False, cancel_futures=False)
+                if self._shared is not None:
+                    self._shared.close()
+                    self._shared = None
+
+            if self.backend == 'thread':
+                self._ensure_local_worker()
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='executor')
+            else:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                    initializer=_init_worker,
+                    initargs=(self._worker_config(), self._publish_models(*models))
+                )
+                # Start every child now so the first requests do not pay for interpreter start-up
+                for future in [self._pool.submit(_ping) for _ in range(self.workers)]:
+                    future.result(timeout=60)
+                logger.info(f"Started {self.workers} executor processes")
+            self._pool_pid = os.getpid()
+            self._pool_models = models
+            return self._pool
+
+    def _discard_pool(self, pool, reason):
+        """Drop a process pool that can no longer run jobs; the next submit starts a new one"""
+        with self._lock:
+            if self._pool is not pool:
+                return
+            logger.error(f"Restarting executor processes: {reason}")
+            self.counters['pool_restarts'] += 1
+            self._pool = None
+            self._timeouts_in_a_row = 0
+            if self._shared is not None:
+                self._shared.close()
+                self._shared = None
+
+        # shutdown() waits for nothing but leaves a hung child running, so stop the children first
+        if hasattr(pool, 'terminate_workers'):
+            pool.terminate_workers()
+        else:
+            for process in list((getattr(pool, '_processes', None) or {}).values()):
+                process.terminate()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _ensure_local_worker(self):
+        with _worker_lock:
+            if _worker.get('pid') != os.getpid():
+                _init_worker(self._worker_config(), None)
+
+    def submit(self, function, *args):
+        """Schedule a job function; returns a future of (result, wall_seconds, cpu_seconds, pid)"""
+        with self._lock:
+            self.counters['submitted'] += 1
+            self.in_flight += 1
+        submitted_at = time.perf_counter()
+
+        try:
+            pool = self._get_pool()
+            if pool is None:
+                self._ensure_local_worker()
+                future = Future()
+                try:
+                    future.set_result(_timed(function, *args))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                try:
+                    future = pool.submit(_timed, function, *args)
+                except BrokenProcessPool:
+                    # A child died (OOM kill, segfault) and the pool refuses every job; retry once on a new one
+                    self._discard_pool(pool, "a child process died")
+                    future = self._get_pool().submit(_timed, function, *args)
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+
+        future.submitted_at = submitted_at
+        future.add_done_callback(self._record)
+        return future
+
+    def _record(self, future):
+        with self._lock:
+            self.in_flight -= 1
+            if future.cancelled() or future.exception() is not None:
+                self.counters['failed'] += 1
+                return
+            _, wall_seconds, cpu_seconds, _ = future.result()
+            self.counters['completed'] += 1
+            self._timeouts_in_a_row = 0
+            self.busy_seconds += wall_seconds
+            self.cpu_seconds += cpu_seconds
+        self.latency.record((time.perf_counter() - future.submitted_at) * 1000)
+
+    def result(self, future, timeout=None, default=None):
+        """Wait for a job's result; returns default on timeout or failure"""
+        try:
+            return future.result(timeout=timeout or self.timeout)[0]
+        except TimeoutError:
+            with self._lock:
+                self.counters['timeouts'] += 1
+                self._timeouts_in_a_row += 1
+                recycle = (
+                    self.backend == 'process' and self.recycle_after_timeouts
+                    and self._timeouts_in_a_row >= self.recycle_after_timeouts
+                )
+                pool = self._pool
+            # Cancelling does not stop a job that is already running in a child
+            future.cancel()
+            logger.warning(f"Executor job timed out after {timeout or self.timeout} s")
+            if recycle and pool is not None:
+                self._discard_pool(pool, f"{self.recycle_after_timeouts} jobs in a row timed out")
+        except Exception as e:
+            logger.error(f"Executor job failed: {e}")
+        return default
+
+    def submit_analyze(self, texts):
+        """Language, intent and entities for a list of texts, as NLPService.analyze_many"""
+        return self.submit(_analyze_job, list(texts))
+
+    def submit_speech_to_text(self, audio_url):
+        return self.submit(_speech_to_text_job, audio_url)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            if self._shared is not None:
+                self._shared.close()
+                self._shared = None
+
+    def stats(self):
+        elapsed = time.time() - self.started_at
+        with self._lock:
+            counters = dict(self.counters)
+            busy_seconds = self.busy_seconds
+            cpu_seconds = self.cpu_seconds
+            in_flight = self.in_flight
+        capacity = (self.workers if self.backend != 'inline' else 1) * elapsed
+        return {
+            'backend': self.backend,
+            'workers': self.workers,
+            'in_flight': in_flight,
+            'queued': max(0, in_flight - self.workers) if self.backend != 'inline' else 0,
+            'counters': counters,
+            'busy_seconds': round(busy_seconds, 3),
+            'cpu_seconds': round(cpu_seconds, 3),
+            'utilization': round(busy_seconds / capacity, 4) if capacity else 0.0,
+            'shared_memory_bytes': self._shared.nbytes if self._shared else 0,
+            'latency': self.latency.snapshot()
+        }
+
+# Shared by every blueprint in the process
+job_executor = JobExecutor()
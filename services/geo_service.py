@@ -1,13 +1,116 @@
+import os
 import logging
 import json
-import requests
+from collections import defaultdict
 from flask import current_app
-from sqlalchemy import func
+from datetime import datetime, timedelta
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, object_session
 from app import db
 from models import GovernmentService
+from services.spatial_index import SpatialIndex
+from services.map_clusters import ClusterIndex, tiles_for_bbox
+from services.vector_tiles import TilePyramid
+from services.geocoder import Geocoder
+from services.directions_cache import DirectionsCache
+from services.http_client import http_client
+from services.road_graph import RoadGraph, PROFILES
+from services.travel_time import TravelTimeMatrix, estimate_walking_minutes
 
 logger = logging.getLogger(__name__)
 
+# Shared by every GeoService instance in the process
+service_index = SpatialIndex()
+service_clusters = ClusterIndex()
+geocoder = Geocoder()
+directions_cache = DirectionsCache()
+
+def rebuild_service_index():
+    """Reload the in-memory spatial index from the government_services table"""
+    service_index.cell_degrees = current_app.config.get('SERVICE_INDEX_CELL_DEGREES', 0.01)
+    
+    rows = db.session.query(
+        GovernmentService.id,
+        GovernmentService.name,
+        GovernmentService.category,
+        GovernmentService.address,
+        GovernmentService.phone_number,
+        GovernmentService.opening_hours,
+        GovernmentService.latitude,
+        GovernmentService.longitude
+    ).filter(
+        GovernmentService.latitude.isnot(None),
+        GovernmentService.longitude.isnot(None)
+    ).all()
+    
+    rows = [row._asdict() for row in rows]
+    service_index.build(rows)
+    
+    # Map clusters are built from the same snapshot so tiles and lookups agree
+    service_clusters.max_cluster_zoom = current_app.config.get('MAP_CLUSTER_MAX_ZOOM', 16)
+    service_clusters.build(rows)
+    return service_index
+
+# Offline road network, loaded once per process on first use
+_road_graph = None
+_road_graph_loaded = False
+
+def get_road_graph():
+    """Return the offline road graph configured by ROAD_GRAPH_PATH, or None if unavailable"""
+    global _road_graph, _road_graph_loaded
+    if not _road_graph_loaded:
+        _road_graph_loaded = True
+        path = current_app.config.get('ROAD_GRAPH_PATH')
+        if path and os.path.exists(path):
+            try:
+                _road_graph = RoadGraph.load(path)
+                logger.info(f"Loaded road graph with {_road_graph.node_count} nodes and {_road_graph.edge_count} edges")
+            except Exception as e:
+                logger.error(f"Failed to load road graph from {path}: {e}")
+    return _road_graph
+
+# Precomputed walking times, reopened whenever the build job replaces the file
+_travel_times = None
+_travel_times_mtime = None
+
+def get_travel_time_matrix():
+    """Return the memory-mapped matrix configured by TRAVEL_TIME_MATRIX_PATH, or None if unavailable"""
+    global _travel_times, _travel_times_mtime
+    path = current_app.config.get('TRAVEL_TIME_MATRIX_PATH')
+    try:
+        mtime = os.path.getmtime(path) if path else None
+    except OSError:
+        mtime = None
+    
+    if mtime != _travel_times_mtime:
+        _travel_times_mtime = mtime
+        _travel_times = None
+        if mtime is not None:
+            try:
+                _travel_times = TravelTimeMatrix(path)
+                logger.info(f"Loaded travel times for {len(_travel_times)} services from {path}")
+            except Exception as e:
+                logger.error(f"Failed to load travel-time matrix from {path}: {e}")
+    return _travel_times
+
+@event.listens_for(GovernmentService, 'after_insert')
+@event.listens_for(GovernmentService, 'after_update')
+@event.listens_for(GovernmentService, 'after_delete')
+def _mark_service_index_dirty(mapper, connection, target):
+    """Remember that the session touched services so the index is rebuilt after commit"""
+    session = object_session(target)
+    if session is not None:
+        session.info['service_index_dirty'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_service_index(session):
+    if session.info.pop('service_index_dirty', False):
+        service_index.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_service_index_flag(session):
+    session.info.pop('service_index_dirty', None)
+
 class GeoService:
     """Service for geographic operations and routing"""
     
@@ -21,70 +124,297 @@ class GeoService:
         """Initialize with Flask app context"""
         self.app = app
         self.graphhopper_api_key = app.config.get('GRAPHHOPPER_API_KEY')
+        self.graphhopper_url = app.config.get('GRAPHHOPPER_URL', 'https://graphhopper.com/api/1/route')
         self.search_radius = app.config.get('SERVICE_SEARCH_RADIUS_KM', 10)
+        self.index_refresh_seconds = app.config.get('SERVICE_INDEX_REFRESH_SECONDS', 300)
+        self.routing_backend = app.config.get('ROUTING_BACKEND', 'auto')
+        self.max_snap_m = app.config.get('ROUTING_MAX_SNAP_METERS', 1000)
+        self.detour_factor = app.config.get('TRAVEL_TIME_DETOUR_FACTOR', 1.3)
+        self.rerank_candidates = app.config.get('TRAVEL_TIME_RERANK_CANDIDATES', 3)
+        
+        # Caches and the HTTP client are shared by every GeoService instance in the process
+        if not http_client.app:
+            http_client.init_app(app)
+        if not geocoder.app:
+            geocoder.init_app(app)
+        if not directions_cache.app:
+            directions_cache.init_app(app)
+        self.geocoder = geocoder
+        self.directions_cache = directions_cache
     
-    def find_nearest_services(self, latitude, longitude, service_category=None, limit=5):
+    def find_nearest_services(self, latitude, longitude, service_category=None, limit=5, radius_km=None):
         """Find the nearest government services based on coordinates and category"""
         try:
-            # Convert kilometers to approximate degrees for the query
-            # This is a rough approximation that works for small distances
-            radius_degrees = self.search_radius / 111.0  # ~111km per degree at the equator
+            index = self._get_index()
             
-            # Build the query
-            query = db.session.query(GovernmentService)
+            # Fall back to the configured search radius
+            if radius_km is None:
+                radius_km = self.search_radius
             
-            # Add PostGIS distance calculation
-            distance = func.ST_Distance(
-                func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326),
-                GovernmentService.location
+            # With walking times available, rank a wider straight-line shortlist by minutes
+            travel_times = get_travel_time_matrix()
+            results = index.nearest(
+                latitude,
+                longitude,
+                k=limit * self.rerank_candidates if travel_times else limit,
+                category=service_category,
+                max_km=radius_km
             )
             
-            query = query.add_columns(distance.label('distance'))
+            services = self._format_results(results)
+            self._add_travel_times(latitude, longitude, services, travel_times)
+            if travel_times:
+                services.sort(key=lambda service: (service['travel_time_min'], service['distance_km']))
+            return services[:limit]
             
-            # Filter by category if provided
-            if service_category:
-                query = query.filter(GovernmentService.category == service_category)
-            
-            # Filter by distance
-            query = query.filter(
-                func.ST_DWithin(
-                    func.ST_SetSRID(func.ST_MakePoint(longitude, latitude), 4326),
-                    GovernmentService.location,
-                    radius_degrees
-                )
+        except Exception as e:
+            logger.error(f"Error finding nearest services: {e}")
+            return []
+    
+    def find_nearest_services_batch(self, origins, categories=None, limit=1, radius_km=None, chunk_size=5000):
+        """Find the nearest services for many origins, yielding one result per origin and category.
+        
+        origins is any iterable of dicts with 'latitude', 'longitude' and optional
+        'ref' and 'category' keys. It is consumed in chunks, so memory stays flat
+        regardless of how many origins are streamed through.
+        """
+        index = self._get_index()
+        
+        # Fall back to the configured search radius
+        if radius_km is None:
+            radius_km = self.search_radius
+        
+        chunk = []
+        for origin in origins:
+            chunk.append(origin)
+            if len(chunk) >= chunk_size:
+                yield from self._nearest_for_chunk(index, chunk, categories, limit, radius_km)
+                chunk = []
+        
+        if chunk:
+            yield from self._nearest_for_chunk(index, chunk, categories, limit, radius_km)
+    
+    def _nearest_for_chunk(self, index, chunk, categories, limit, radius_km):
+        """Score one chunk of origins with a single batch lookup per category"""
+        groups = defaultdict(list)
+        for position, origin in enumerate(chunk):
+            if origin.get('latitude') is None or origin.get('longitude') is None:
+                continue
+            for category in categories or [origin.get('category')]:
+                groups[category or None].append(position)
+        
+        found = {}
+        for category, positions in groups.items():
+            results = index.nearest_many(
+                [chunk[position]['latitude'] for position in positions],
+                [chunk[position]['longitude'] for position in positions],
+                k=limit,
+                category=category,
+                max_km=radius_km
             )
+            for position, origin_results in zip(positions, results):
+                found[(position, category)] = origin_results
+        
+        for position, origin in enumerate(chunk):
+            if origin.get('latitude') is None or origin.get('longitude') is None:
+                yield {'ref': origin.get('ref'), 'error': 'invalid coordinates'}
+                continue
+            for category in categories or [origin.get('category')]:
+                yield {
+                    'ref': origin.get('ref'),
+                    'latitude': origin['latitude'],
+                    'longitude': origin['longitude'],
+                    'category': category or None,
+                    'services': self._format_results(found.get((position, category or None), []))
+                }
+    
+    def _format_results(self, results):
+        """Turn (distance_km, row) pairs from the index into service dicts"""
+        services = []
+        for distance_km, row in results:
+            service = dict(row)
+            service['distance_km'] = round(distance_km, 2)
+            services.append(service)
+        return services
+    
+    def service_tile(self, z, x, y, category=None):
+        """Clustered services inside a web-mercator map tile"""
+        self._get_index()
+        return service_clusters.tile(z, x, y, category=category)
+    
+    def services_in_bbox(self, south, west, north, east, zoom, category=None, max_tiles=64):
+        """Clustered services for a map viewport, merged from the tiles covering it"""
+        tiles = tiles_for_bbox(south, west, north, east, zoom)
+        if len(tiles) > max_tiles:
+            raise ValueError(f"Viewport covers {len(tiles)} tiles at zoom {zoom}; the limit is {max_tiles}")
+        
+        features = []
+        for x, y in tiles:
+            features.extend(self.service_tile(zoom, x, y, category=category))
+        return features
+    
+    def export_geojson(self, since=None, category=None, chunk_size=1000):
+        """Stream the service catalog as a GeoJSON FeatureCollection, one chunk of text at a time.
+        
+        Rows are read with yield_per and serialized in batches, so memory stays
+        flat however many services are exported. Pass since to export only
+        services updated at or after that time.
+        """
+        query = db.session.query(
+            GovernmentService.id,
+            GovernmentService.name,
+            GovernmentService.category,
+            GovernmentService.description,
+            GovernmentService.address,
+            GovernmentService.phone_number,
+            GovernmentService.email,
+            GovernmentService.opening_hours,
+            GovernmentService.required_documents,
+            GovernmentService.latitude,
+            GovernmentService.longitude,
+            GovernmentService.updated_at
+        ).order_by(GovernmentService.id)
+        
+        if since is not None:
+            query = query.filter(GovernmentService.updated_at >= since)
+        if category:
+            query = query.filter(GovernmentService.category == category)
+        
+        yield '{"type":"FeatureCollection","features":['
+        
+        separator = ''
+        batch = []
+        for row in query.yield_per(chunk_size):
+            properties = row._asdict()
+            latitude = properties.pop('latitude')
+            longitude = properties.pop('longitude')
+            if properties['updated_at'] is not None:
+                properties['updated_at'] = properties['updated_at'].isoformat()
             
-            # Order by distance and limit results
-            query = query.order_by(distance).limit(limit)
-            
-            # Execute query
-            results = query.all()
-            
-            # Format the results
-            services = []
-            for service, distance in results:
-                # Convert distance from degrees to kilometers (approximate)
-                distance_km = distance * 111.0
-                
-                services.append({
-                    'id': service.id,
-                    'name': service.name,
-                    'category': service.category,
-                    'address': service.address,
-                    'phone_number': service.phone_number,
-                    'opening_hours': service.opening_hours,
-                    'latitude': service.latitude,
-                    'longitude': service.longitude,
-                    'distance_km': round(distance_km, 2)
-                })
-            
-            return services
+            feature = {
+                'type': 'Feature',
+                'id': row.id,
+                'geometry': {'type': 'Point', 'coordinates': [longitude, latitude]} if latitude is not None and longitude is not None else None,
+                'properties': properties
+            }
+            batch.append(separator + json.dumps(feature, separators=(',', ':'), ensure_ascii=False))
+            separator = ','
             
+            if len(batch) >= chunk_size:
+                yield ''.join(batch)
+                batch = []
+        
+        if batch:
+            yield ''.join(batch)
+        yield ']}'
+    
+    def update_service_tiles(self, directory, full=False):
+        """Rebuild the vector tile pyramid, rewriting only tiles touched since the last build"""
+        pyramid = TilePyramid(
+            directory,
+            min_zoom=self.app.config.get('SERVICE_TILES_MIN_ZOOM', 0),
+            max_zoom=self.app.config.get('SERVICE_TILES_MAX_ZOOM', 14),
+            max_cluster_zoom=self.app.config.get('SERVICE_TILES_MAX_ZOOM', 14)
+        )
+        
+        # Read the new watermark first so edits made while we read are picked up next time
+        watermark = db.session.query(func.max(GovernmentService.updated_at)).scalar()
+        manifest = None if full else pyramid.load_manifest()
+        
+        changed_ids = None
+        if manifest and manifest.get('watermark'):
+            # Timestamps may only have second resolution, so look back one extra second
+            since = datetime.fromisoformat(manifest['watermark']) - timedelta(seconds=1)
+            changed_ids = [
+                service_id for (service_id,) in
+                db.session.query(GovernmentService.id).filter(GovernmentService.updated_at >= since)
+            ]
+        
+        rows = db.session.query(
+            GovernmentService.id,
+            GovernmentService.name,
+            GovernmentService.category,
+            GovernmentService.latitude,
+            GovernmentService.longitude
+        ).yield_per(5000)
+        
+        return pyramid.update(
+            (row._asdict() for row in rows),
+            changed_ids=changed_ids,
+            watermark=watermark.isoformat() if watermark else None
+        )
+    
+    def _add_travel_times(self, latitude, longitude, services, travel_times):
+        """Set travel_time_min from the matrix, estimating from straight-line distance where it has no entry"""
+        if travel_times:
+            minutes = travel_times.minutes(latitude, longitude, [service['id'] for service in services])
+        else:
+            minutes = [None] * len(services)
+        
+        for service, value in zip(services, minutes):
+            service['travel_time_estimated'] = value is None
+            if value is None:
+                value = estimate_walking_minutes(service['distance_km'], self.detour_factor)
+            service['travel_time_min'] = value
+    
+    def stats(self):
+        """Counters for the in-process geo caches"""
+        return {
+            'service_index': {'services': len(service_index), 'stale': service_index.stale},
+            'service_clusters': {'services': len(service_clusters), 'max_cluster_zoom': service_clusters.max_cluster_zoom},
+            'geocoder': geocoder.stats(),
+            'directions_cache': directions_cache.stats(),
+            'http': http_client.stats(),
+            'travel_times': _travel_times.stats() if _travel_times else None
+        }
+    
+    def _get_index(self):
+        """Return the shared spatial index, rebuilding it if services changed"""
+        if service_index.needs_rebuild(self.index_refresh_seconds):
+            rebuild_service_index()
+        return service_index
+    
+    def get_directions(self, from_lat, from_lng, to_lat, to_lng, language='en', service_id=None, vehicle='foot'):
+        """Get directions from one point to another, reusing cached routes from nearby origins"""
+        locale = 'en' if language == 'en' else 'fr'  # Using French as proxy for Kinyarwanda
+        
+        try:
+            key = directions_cache.make_key(from_lat, from_lng, to_lat, to_lng, vehicle, locale, service_id=service_id)
         except Exception as e:
-            logger.error(f"Error finding nearest services: {e}")
-            return []
+            logger.error(f"Error building directions cache key: {e}")
+            return None
+        
+        directions = directions_cache.get(key)
+        if directions is not None:
+            return directions
+        
+        directions = None
+        if self.routing_backend in ('local', 'auto'):
+            directions = self._local_directions(from_lat, from_lng, to_lat, to_lng, vehicle)
+        if directions is None and self.routing_backend in ('graphhopper', 'auto'):
+            directions = self._fetch_graphhopper_directions(from_lat, from_lng, to_lat, to_lng, locale, vehicle)
+        
+        if directions is not None:
+            directions_cache.set(key, directions)
+        
+        return directions
     
-    def get_directions(self, from_lat, from_lng, to_lat, to_lng, language='en'):
+    def _local_directions(self, from_lat, from_lng, to_lat, to_lng, vehicle):
+        """Route on the offline road graph, or None when it is unavailable or has no route"""
+        graph = get_road_graph()
+        if graph is None or vehicle not in PROFILES:
+            return None
+        
+        try:
+            directions = graph.route(from_lat, from_lng, to_lat, to_lng, profile=vehicle, max_snap_m=self.max_snap_m)
+            if directions is None:
+                logger.warning("No route found on the local road graph")
+            return directions
+        except Exception as e:
+            logger.error(f"Error routing on the local road graph: {e}")
+            return None
+    
+    def _fetch_graphhopper_directions(self, from_lat, from_lng, to_lat, to_lng, locale, vehicle):
         """Get directions from one point to another using GraphHopper"""
         try:
             # Check if API key is available
@@ -93,18 +423,17 @@ class GeoService:
                 return None
             
             # Build the API request
-            url = "https://graphhopper.com/api/1/route"
             params = {
                 'point': [f"{from_lat},{from_lng}", f"{to_lat},{to_lng}"],
-                'vehicle': 'foot',  # Default to walking directions
-                'locale': 'en' if language == 'en' else 'fr',  # Using French as proxy for Kinyarwanda
+                'vehicle': vehicle,
+                'locale': locale,
                 'details': 'time|distance',
                 'instructions': 'true',
                 'key': self.graphhopper_api_key
             }
             
             # Make the API request
-            response = requests.get(url, params=params)
+            response = http_client.get(self.graphhopper_url, upstream='graphhopper', params=params)
             
             if response.status_code == 200:
                 data = response.json()
@@ -198,44 +527,9 @@ class GeoService:
         return text
     
     def geocode_location(self, location_name):
-        """Convert a location name to coordinates using Nominatim (OpenStreetMap)"""
+        """Convert a location name to coordinates using the layered geocoder"""
         try:
-            # Add Rwanda as default region
-            search_text = f"{location_name}, Rwanda"
-            
-            # Use Nominatim geocoding API
-            url = "https://nominatim.openstreetmap.org/search"
-            params = {
-                'q': search_text,
-                'format': 'json',
-                'limit': 1
-            }
-            
-            headers = {
-                'User-Agent': 'Tugendane-Service-Locator'
-            }
-            
-            response = requests.get(url, params=params, headers=headers)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if data and len(data) > 0:
-                    result = data[0]
-                    
-                    return {
-                        'latitude': float(result['lat']),
-                        'longitude': float(result['lon']),
-                        'display_name': result['display_name']
-                    }
-                
-                logger.warning(f"Location not found: {location_name}")
-                return None
-                
-            else:
-                logger.error(f"Geocoding API error: {response.status_code} - {response.text}")
-                return None
-                
+            return geocoder.geocode(location_name)
         except Exception as e:
             logger.error(f"Error geocoding location: {e}")
             return None
@@ -0,0 +1,192 @@
+import os
+import re
+import csv
+import logging
+import unicodedata
+from services.cache_store import LRUCache, SQLiteCacheStore
+from services.http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'rwanda_gazetteer.csv')
+
+# Administrative words people add around place names ("Huye district", "umurenge wa Remera")
+ADMIN_WORDS = {
+    'district', 'sector', 'cell', 'province', 'city', 'town', 'village',
+    'akarere', 'umurenge', 'akagari', 'intara', 'umujyi', 'ka', 'wa', 'ya',
+    'the', 'of', 'in', 'rwanda'
+}
+
+# Stand-in for a cached "not found" so it can be told apart from a cache miss
+NOT_FOUND = {}
+
+def normalize_place_name(name):
+    """Normalize a free-text place name into a cache/gazetteer key"""
+    if not name:
+        return ''
+    text = unicodedata.normalize('NFKD', name)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s,]", ' ', text.lower())
+
+    # "Nyamirambo, Kigali" -> "nyamirambo"; the first part is the most specific
+    text = text.split(',')[0]
+    words = [word for word in text.split() if word not in ADMIN_WORDS]
+    return ' '.join(words)
+
+def load_gazetteer(path=GAZETTEER_PATH):
+    """Load the offline gazetteer into a dict of normalized name -> place"""
+    places = {}
+    try:
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                names = [row['name']] + [alias for alias in (row.get('aliases') or '').split('|') if alias]
+                parent = row.get('parent')
+                place = {
+                    'latitude': float(row['latitude']),
+                    'longitude': float(row['longitude']),
+                    'display_name': ', '.join(part for part in (row['name'], parent, 'Rwanda') if part),
+                    'level': row['level'],
+                    'source': 'gazetteer'
+                }
+                for name in names:
+                    # Earlier (broader) rows win, so "Kigali" resolves to the city, not the sector
+                    places.setdefault(normalize_place_name(name), place)
+    except (OSError, KeyError, ValueError) as e:
+        logger.error(f"Failed to load gazetteer from {path}: {e}")
+    return places
+
+class Geocoder:
+    """Layered geocoder: in-memory LRU, on-disk TTL cache, offline gazetteer, then Nominatim"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.memory = LRUCache()
+        self.disk = None
+        self.gazetteer = {}
+        self.counters = {'memory': 0, 'disk': 0, 'gazetteer': 0, 'network': 0, 'stale': 0, 'not_found': 0, 'errors': 0}
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize with Flask app context"""
+        self.app = app
+        self.nominatim_url = app.config.get('NOMINATIM_URL', 'https://nominatim.openstreetmap.org/search')
+        self.timeout = app.config.get('GEOCODE_TIMEOUT_SECONDS', 5)
+        self.ttl_seconds = app.config.get('GEOCODE_CACHE_TTL_DAYS', 30) * 86400
+        self.negative_ttl_seconds = app.config.get('GEOCODE_NEGATIVE_TTL_HOURS', 6) * 3600
+        self.memory = LRUCache(maxsize=app.config.get('GEOCODE_LRU_SIZE', 2048), ttl_seconds=self.ttl_seconds)
+        self.gazetteer = load_gazetteer(app.config.get('GAZETTEER_PATH') or GAZETTEER_PATH)
+
+        cache_path = app.config.get('GEOCODE_CACHE_PATH')
+        if cache_path:
+            try:
+                self.disk = SQLiteCacheStore(cache_path, 'geocode')
+            except Exception as e:
+                logger.error(f"Failed to open geocode cache at {cache_path}: {e}")
+                self.disk = None
+
+        logger.info(f"Initialized geocoder with {len(self.gazetteer)} gazetteer names")
+
+    def geocode(self, location_name):
+        """Resolve a place name to {'latitude', 'longitude', 'display_name'} or None"""
+        key = normalize_place_name(location_name)
+        if not key:
+            return None
+
+        # Layer 1: in-process LRU
+        result = self.memory.get(key)
+        if result is not None:
+            self.counters['memory'] += 1
+            return result or None
+
+        # Layer 2: persistent cache shared by the workers on this host
+        if self.disk:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.counters['disk'] += 1
+                result = entry.get('result') or NOT_FOUND
+                # A cached "not found" must not outlive its negative TTL in memory
+                self.memory.set(key, result, ttl_seconds=self.negative_ttl_seconds if result is NOT_FOUND else self.ttl_seconds)
+                return result or None
+
+        # Layer 3: bundled offline gazetteer
+        result = self.gazetteer.get(key)
+        if result is not None:
+            self.counters['gazetteer'] += 1
+            self.memory.set(key, result)
+            return result
+
+        # Layer 4: Nominatim, falling back to an expired cache entry when the uplink is down
+        try:
+            result = self._query_nominatim(location_name)
+        except Exception as e:
+            self.counters['errors'] += 1
+            logger.error(f"Error geocoding location: {e}")
+            return self._stale(key)
+
+        if result:
+            self.counters['network'] += 1
+            self._store(key, result, self.ttl_seconds)
+            return result
+
+        self.counters['not_found'] += 1
+        logger.warning(f"Location not found: {location_name}")
+        self._store(key, NOT_FOUND, self.negative_ttl_seconds)
+        return None
+
+    def _store(self, key, result, ttl_seconds):
+        self.memory.set(key, result, ttl_seconds=ttl_seconds)
+        if self.disk:
+            self.disk.set(key, {'result': result or None}, ttl_seconds=ttl_seconds)
+
+    def _stale(self, key):
+        if not self.disk:
+            return None
+        entry = self.disk.get(key, include_expired=True)
+        if entry and entry.get('result'):
+            self.counters['stale'] += 1
+            return entry['result']
+        return None
+
+    def _query_nominatim(self, location_name):
+        """Query Nominatim; returns the place, None when not found, raises on transport errors"""
+        # Add Rwanda as default region
+        params = {
+            'q': f"{location_name}, Rwanda",
+            'format': 'json',
+            'limit': 1,
+            'countrycodes': 'rw'
+        }
+        headers = {
+            'User-Agent': 'Tugendane-Service-Locator'
+        }
+
+        response = http_client.get(
+            self.nominatim_url,
+            upstream='nominatim',
+            params=params,
+            headers=headers,
+            timeout=(http_client.connect_timeout, self.timeout)
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Geocoding API error: {response.status_code} - {response.text}")
+
+        data = response.json()
+        if not data:
+            return None
+
+        return {
+            'latitude': float(data[0]['lat']),
+            'longitude': float(data[0]['lon']),
+            'display_name': data[0]['display_name'],
+            'source': 'nominatim'
+        }
+
+    def stats(self):
+        return {
+            'layers': dict(self.counters),
+            'memory': self.memory.stats(),
+            'disk': self.disk.stats() if self.disk else None,
+            'gazetteer_names': len(self.gazetteer)
+        }
@@ -0,0 +1,171 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+# Latency samples kept per upstream for percentile estimates
+LATENCY_WINDOW = 1024
+
+class UpstreamMetrics:
+    """Request counters and a rolling latency window for one upstream"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.status_codes = {}
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms, status_code=None, error=False):
+        with self._lock:
+            self.requests += 1
+            self.latencies_ms.append(latency_ms)
+            if error:
+                self.errors += 1
+            if status_code is not None:
+                self.status_codes[status_code] = self.status_codes.get(status_code, 0) + 1
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self.latencies_ms)
+            status_codes = dict(self.status_codes)
+
+        def percentile(p):
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))], 1)
+
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'status_codes': status_codes,
+            'latency_ms': {
+                'p50': percentile(0.50),
+                'p95': percentile(0.95),
+                'p99': percentile(0.99),
+                'max': round(samples[-1], 1) if samples else None
+            }
+        }
+
+class HttpClient:
+    """Shared outbound HTTP client with pooled keep-alive connections, timeouts and retries"""
+
+    def __init__(self, app=None):
+        self.app = app
+        self.connect_timeout = 3.05
+        self.read_timeout = 10
+        self.max_retries = 2
+        self.backoff_base = 0.2
+        self.backoff_max = 2.0
+        self.pool_connections = 10
+        self.pool_maxsize = 10
+        self.metrics = {}
+        self._metrics_lock = threading.Lock()
+        self._local = threading.local()
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize with Flask app context"""
+        self.app = app
+        self.connect_timeout = app.config.get('HTTP_CONNECT_TIMEOUT', self.connect_timeout)
+        self.read_timeout = app.config.get('HTTP_READ_TIMEOUT', self.read_timeout)
+        self.max_retries = app.config.get('HTTP_MAX_RETRIES', self.max_retries)
+        self.backoff_base = app.config.get('HTTP_BACKOFF_BASE_SECONDS', self.backoff_base)
+        self.backoff_max = app.config.get('HTTP_BACKOFF_MAX_SECONDS', self.backoff_max)
+        self.pool_maxsize = app.config.get('HTTP_POOL_MAXSIZE', self.pool_maxsize)
+
+    def _session(self):
+        # Sessions hold sockets, so never reuse one across a fork or share it between threads
+        session = getattr(self._local, 'session', None)
+        if session is None or self._local.pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._local.session = session
+            self._local.pid = os.getpid()
+        return session
+
+    def _upstream_metrics(self, upstream):
+        metrics = self.metrics.get(upstream)
+        if metrics is None:
+            with self._metrics_lock:
+                metrics = self.metrics.setdefault(upstream, UpstreamMetrics())
+        return metrics
+
+    def _backoff(self, attempt, response=None):
+        """Full-jitter exponential backoff, honoring a numeric Retry-After header"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                delay = min(self.backoff_max, float(retry_after))
+        return delay
+
+    def request(self, method, url, upstream=None, timeout=None, retries=None, idempotent=None, **kwargs):
+        """Send a request, retrying idempotent ones on connection errors and 429/5xx responses.
+
+        Raises requests.RequestException when the last attempt fails to connect
+        or times out; HTTP error statuses are returned to the caller as-is.
+        """
+        method = method.upper()
+        upstream = upstream or urlparse(url).netloc
+        metrics = self._upstream_metrics(upstream)
+        timeout = timeout or (self.connect_timeout, self.read_timeout)
+        retries = self.max_retries if retries is None else retries
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        if not idempotent:
+            retries = 0
+
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self._session().request(method, url, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.record((time.perf_counter() - started) * 1000, error=True)
+                if attempt >= retries:
+                    raise
+                logger.warning(f"{upstream} request failed ({e}); retrying")
+                response = None
+            else:
+                metrics.record((time.perf_counter() - started) * 1000, status_code=response.status_code,
+                               error=response.status_code >= 500)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                    return response
+                logger.warning(f"{upstream} returned {response.status_code}; retrying")
+
+            metrics.record_retry()
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        return {upstream: metrics.snapshot() for upstream, metrics in list(self.metrics.items())}
+
+# Shared by every service in the process
+http_client = HttpClient()
@@ -0,0 +1,155 @@
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import update, delete
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import InboundMessageKey
+from services.cache_store import LRUCache
+
+logger = logging.getLogger(__name__)
+
+def inbound_key(form):
+    """Idempotency key of an inbound SMS callback, or None when retries cannot be told apart"""
+    provider_id = form.get('id')
+    if provider_id:
+        return f"id:{provider_id}"
+
+    # Without an id, the provider's timestamp separates a retry from the same text sent again
+    sender, text, date = form.get('from'), form.get('text'), form.get('date')
+    if not (sender and text and date):
+        return None
+    return 'h:' + hashlib.sha1(f"{sender}\0{text}\0{date}".encode('utf-8')).hexdigest()
+
+class InboundDeduplicator:
+    """Claims inbound callbacks once, so provider retries are acknowledged without reprocessing.
+
+    The unique index on InboundMessageKey.key is the source of truth: the
+    first request to insert a key processes the message and every retry's
+    insert fails. Keys this process claimed are kept in an LRU in front of
+    the table, so retries landing on the same worker are answered without a
+    database round trip. Keys are kept for retention_hours, pruned at most
+    once per prune_interval by whichever request claims next.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.enabled = True
+        self.recent = LRUCache(maxsize=10000, ttl_seconds=24 * 3600)
+        self.retention_hours = 24
+        self.prune_interval = 3600
+        self.counters = {
+            'claimed': 0, 'duplicates': 0, 'cache_duplicates': 0, 'released': 0, 'errors': 0, 'pruned': 0
+        }
+        self._lock = threading.Lock()
+        self._next_prune = 0
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize with Flask app context"""
+        self.app = app
+        self.enabled = app.config.get('INBOUND_DEDUP_ENABLED', self.enabled)
+        self.retention_hours = app.config.get('INBOUND_DEDUP_CACHE_TTL_HOURS', self.retention_hours)
+        self.prune_interval = app.config.get('INBOUND_DEDUP_PRUNE_INTERVAL_SECONDS', self.prune_interval)
+        self.recent = LRUCache(
+            maxsize=app.config.get('INBOUND_DEDUP_CACHE_SIZE', 10000),
+            ttl_seconds=self.retention_hours * 3600
+        )
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def prune(self):
+        """Delete keys older than the retention window; providers stop retrying long before it ends"""
+        cutoff = datetime.utcnow() - timedelta(hours=self.retention_hours)
+        try:
+            result = db.session.execute(delete(InboundMessageKey).where(InboundMessageKey.created_at < cutoff))
+            db.session.commit()
+            self._count('pruned', result.rowcount or 0)
+            return result.rowcount or 0
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to prune inbound message keys: {e}")
+            return 0
+
+    def _maybe_prune(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_prune:
+                return
+            self._next_prune = now + self.prune_interval
+        self.prune()
+
+    def claim(self, key):
+        """True if this request should process the message, False if it is a duplicate"""
+        if not self.enabled or key is None:
+            return True
+        self._maybe_prune()
+
+        if self.recent.get(key) is not None:
+            self._count('cache_duplicates')
+            return False
+
+        try:
+            db.session.add(InboundMessageKey(key=key))
+            db.session.commit()
+        except IntegrityError:
+            # Not cached: the worker that owns the key may still release it
+            db.session.rollback()
+            self._count('duplicates')
+            return False
+        except Exception as e:
+            # Without the table a retry may be processed twice, which beats dropping the message
+            db.session.rollback()
+            self._count('errors')
+            logger.error(f"Failed to claim inbound message {key}: {e}")
+            return True
+
+        self.recent.set(key, True)
+        self._count('claimed')
+        return True
+
+    def complete(self, key, message_id):
+        """Link a claimed key to the message it produced"""
+        if not self.enabled or key is None:
+            return
+        try:
+            db.session.execute(
+                update(InboundMessageKey).where(InboundMessageKey.key == key).values(message_id=message_id)
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to link inbound message {key} to message {message_id}: {e}")
+
+    def release(self, key):
+        """Forget a claim whose message was never stored or was discarded, so the provider's retry is processed"""
+        if not self.enabled or key is None:
+            return
+        self.recent.pop(key)
+        try:
+            result = db.session.execute(delete(InboundMessageKey).where(InboundMessageKey.key == key))
+            db.session.commit()
+            if result.rowcount:
+                self._count('released')
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Failed to release inbound message {key}: {e}")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            'enabled': self.enabled,
+            'retention_hours': self.retention_hours,
+            'counters': counters,
+            'cached_keys': len(self.recent)
+        }
+
+# Shared by every blueprint in the process
+inbound_dedup = InboundDeduplicator()
@@ -0,0 +1,108 @@
+import re
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+INLINE_IGNORECASE = '(?i)'
+
+def _lower_pattern(pattern):
+    """Lowercase a pattern's literals, leaving escape sequences such as \\D or \\W intact"""
+    out = []
+    escaped = False
+    for char in pattern:
+        out.append(char if escaped else char.lower())
+        escaped = not escaped and char == '\\'
+    return ''.join(out)
+
+class IntentMatcher:
+    """Scores every intent pattern in a single scan of the text.
+
+    One compiled union of all patterns finds each position where any of them
+    matches; a second regex of per-pattern lookahead groups, anchored there,
+    records what each pattern matches at that position. Replaying those
+    matches with each pattern's own non-overlapping rule reproduces the counts
+    of running re.findall once per pattern.
+
+    When every pattern is case-insensitive ASCII, ASCII messages are lowercased
+    and matched case-sensitively, which lets the regex engine skip ahead on
+    literal prefixes. Other text takes the IGNORECASE path; both give the same
+    counts.
+    """
+
+    def __init__(self, intent_patterns):
+        self.intents = list(intent_patterns)
+        self.pattern_intents = []
+        patterns = []
+
+        for intent, intent_pattern_list in intent_patterns.items():
+            for pattern in intent_pattern_list:
+                patterns.append(pattern)
+                self.pattern_intents.append(intent)
+
+        self.exact = self._compile([self._normalize(pattern) for pattern in patterns], re.IGNORECASE)
+
+        fast = all(pattern.startswith(INLINE_IGNORECASE) and pattern.isascii() for pattern in patterns)
+        self.fast = self._compile([_lower_pattern(pattern[len(INLINE_IGNORECASE):]) for pattern in patterns]) if fast else None
+
+    def _normalize(self, pattern):
+        """Move a leading (?i) flag to the compiled regex; keep other patterns case-sensitive"""
+        if pattern.startswith(INLINE_IGNORECASE):
+            return pattern[len(INLINE_IGNORECASE):]
+        return f"(?-i:{pattern})"
+
+    def _compile(self, alternatives, flags=0):
+        """Union regex to find candidate positions, and the anchored per-pattern capture regex"""
+        union = re.compile('|'.join(f"(?:{alternative})" for alternative in alternatives), flags)
+        capture = re.compile(
+            ''.join(f"(?:(?=(?P<p{i}>{alternative}))|)" for i, alternative in enumerate(alternatives)),
+            flags
+        )
+        groups = [(i, capture.groupindex[f"p{i}"]) for i in range(len(alternatives))]
+        return union.search, capture.match, groups
+
+    def counts(self, text):
+        """Number of re.findall matches of each pattern, in pattern order"""
+        if self.fast and text.isascii():
+            search, capture, groups = self.fast
+            text = text.lower()
+        else:
+            search, capture, groups = self.exact
+
+        counts = [0] * len(groups)
+        next_start = [0] * len(groups)
+        position = 0
+        while True:
+            found = search(text, position)
+            if found is None:
+                break
+            position = found.start()
+            regs = capture(text, position).regs
+
+            # Groups of patterns that do not match here are (-1, -1)
+            for i in [i for i, group in groups if regs[group][0] >= 0]:
+                if position >= next_start[i]:
+                    end = regs[groups[i][1]][1]
+                    counts[i] += 1
+                    next_start[i] = end if end > position else end + 1
+            position += 1
+
+        return counts
+
+    def scores(self, text):
+        """Match counts per intent, equal to summing len(re.findall(pattern, text)) per intent"""
+        scores = defaultdict(int)
+        for intent in self.intents:
+            scores[intent] = 0
+        for intent, count in zip(self.pattern_intents, self.counts(text)):
+            scores[intent] += count
+        return scores
+
+    def best(self, text, default=None):
+        """Highest scoring intent (first in pattern order on ties), or default when nothing matches"""
+        scores = self.scores(text)
+        if scores:
+            top_intent = max(scores.items(), key=lambda x: x[1])
+            if top_intent[1] > 0:
+                return top_intent[0]
+        return default
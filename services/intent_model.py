@@ -0,0 +1,169 @@
+import os
+import re
+import time
+import zlib
+import logging
+from functools import lru_cache
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+FORMAT_VERSION = 1
+
+# Hand-labelled messages; DB intents are regex output, so only these measure what users meant
+EVAL_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'intent_eval.tsv')
+
+@lru_cache(maxsize=65536)
+def _token_features(token, n_features):
+    """Hashed unigram and character trigram features of one token.
+
+    SMS vocabularies are small, so most tokens are served from the cache and
+    hashing costs little after warm-up. Trigrams make misspellings and
+    Kinyarwanda prefixes share evidence with the words they resemble.
+    """
+    mask = n_features - 1
+    features = [zlib.crc32(b'w:' + token.encode('utf-8')) & mask]
+    padded = f" {token} "
+    for i in range(len(padded) - 2):
+        features.append(zlib.crc32(b'c:' + padded[i:i + 3].encode('utf-8')) & mask)
+    return tuple(features)
+
+def hashed_features(text, n_features):
+    """Feature ids of a text: word unigrams, word bigrams and character trigrams"""
+    tokens = TOKEN_RE.findall(text.lower())
+    mask = n_features - 1
+    features = []
+    for token in tokens:
+        features.extend(_token_features(token, n_features))
+    for first, second in zip(tokens, tokens[1:]):
+        features.append(zlib.crc32(f"b:{first} {second}".encode('utf-8')) & mask)
+    return features
+
+def read_labeled(lines):
+    """(text, intent) pairs from 'intent<TAB>text' lines, skipping blanks and # comments"""
+    examples = []
+    for line in lines:
+        intent, _, text = line.rstrip('\n').partition('\t')
+        if intent and text and not intent.startswith('#'):
+            examples.append((text, intent))
+    return examples
+
+class IntentModel:
+    """Multinomial Naive Bayes over hashed n-gram features.
+
+    Weights are stored feature-major, so scoring a batch is one gather of the
+    rows its features touch followed by a cumulative sum split at document
+    boundaries; there is no Python loop over classes or features.
+    """
+
+    def __init__(self, classes, class_log_prior, feature_log_prob, built_at=None, metrics=None):
+        self.classes = [str(label) for label in classes]
+        self.class_log_prior = np.asarray(class_log_prior, dtype=np.float64)
+        self.feature_log_prob = np.asarray(feature_log_prob, dtype=np.float32)
+        self.n_features = self.feature_log_prob.shape[0]
+        self.built_at = built_at
+        self.metrics = metrics or {}
+
+        if self.n_features & (self.n_features - 1):
+            raise ValueError("n_features must be a power of two")
+
+    @property
+    def version(self):
+        return f"{self.n_features}-{self.built_at or 0:.0f}"
+
+    @classmethod
+    def train(cls, texts, labels, n_features=2 ** 17, alpha=0.1):
+        """Fit class priors and smoothed feature likelihoods from labeled texts"""
+        if n_features & (n_features - 1):
+            raise ValueError("n_features must be a power of two")
+        classes = sorted(set(labels))
+        if len(classes) < 2:
+            raise ValueError("Need at least two intents to train a model")
+        class_index = {label: i for i, label in enumerate(classes)}
+
+        counts = np.zeros((n_features, len(classes)), dtype=np.float64)
+        class_counts = np.zeros(len(classes), dtype=np.float64)
+        for text, label in zip(texts, labels):
+            column = class_index[label]
+            class_counts[column] += 1
+            features = hashed_features(text, n_features)
+            if features:
+                np.add.at(counts[:, column], features, 1)
+
+        smoothed = counts + alpha
+        feature_log_prob = np.log(smoothed) - np.log(smoothed.sum(axis=0))
+        class_log_prior = np.log(class_counts) - np.log(class_counts.sum())
+        return cls(classes, class_log_prior, feature_log_prob, built_at=time.time())
+
+    def _vectorize(self, texts):
+        """Concatenated feature ids and CSR-style document boundaries"""
+        indptr = [0]
+        indices = []
+        for text in texts:
+            indices.extend(hashed_features(text, self.n_features))
+            indptr.append(len(indices))
+        return np.asarray(indices, dtype=np.int64), np.asarray(indptr, dtype=np.int64)
+
+    def predict_log_proba(self, texts):
+        """Normalized log-probabilities, one row per text and one column per class"""
+        indices, indptr = self._vectorize(texts)
+        gathered = self.feature_log_prob[indices].astype(np.float64)
+        cumulative = np.vstack((np.zeros((1, len(self.classes))), np.cumsum(gathered, axis=0)))
+        joint = cumulative[indptr[1:]] - cumulative[indptr[:-1]] + self.class_log_prior
+
+        top = joint.max(axis=1, keepdims=True)
+        return joint - top - np.log(np.exp(joint - top).sum(axis=1, keepdims=True))
+
+    def predict(self, texts):
+        """(intent, confidence) per text; texts without any features get confidence 0"""
+        if not texts:
+            return []
+        log_proba = self.predict_log_proba(texts)
+        best = log_proba.argmax(axis=1)
+        confidence = np.exp(log_proba[np.arange(len(texts)), best])
+        empty = np.array([not TOKEN_RE.search(text) for text in texts])
+        confidence[empty] = 0.0
+        return [(self.classes[i], float(p)) for i, p in zip(best.tolist(), confidence.tolist())]
+
+    def evaluate(self, texts, labels):
+        """Share of texts whose predicted intent matches the label"""
+        if not texts:
+            return None
+        predictions = self.predict(texts)
+        return sum(1 for (intent, _), label in zip(predictions, labels) if intent == label) / len(texts)
+
+    def save(self, path):
+        """Write the model as a compressed .npz archive, replacing any previous file atomically"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                format_version=np.int64(FORMAT_VERSION),
+                classes=np.array(self.classes),
+                class_log_prior=self.class_log_prior,
+                feature_log_prob=self.feature_log_prob,
+                built_at=np.float64(self.built_at or time.time()),
+                metric_names=np.array(list(self.metrics), dtype=str),
+                metric_values=np.array(list(self.metrics.values()), dtype=np.float64)
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data['format_version']) != FORMAT_VERSION:
+                raise ValueError(f"{path} is not a version {FORMAT_VERSION} intent model")
+            metrics = dict(zip(data['metric_names'].tolist(), data['metric_values'].tolist()))
+            return cls(
+                data['classes'].tolist(), data['class_log_prior'], data['feature_log_prob'],
+                built_at=float(data['built_at']), metrics=metrics
+            )
+
+    def stats(self):
+        return {
+            'classes': len(self.classes),
+            'n_features': self.n_features,
+            'built_at': self.built_at,
+            'metrics': self.metrics
+        }
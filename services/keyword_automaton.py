@@ -0,0 +1,108 @@
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton that finds every keyword occurrence in one pass.
+
+    Keywords are added with a payload, then build() compiles the trie into a
+    transition table with failure links already folded in, so scanning costs
+    one dict lookup per character no matter how many keywords there are.
+    Matching is exact; lowercase both the keywords and the text for
+    case-insensitive search.
+    """
+
+    def __init__(self, keywords=None):
+        self._goto = [{}]
+        self._keywords = [[]]
+        self._delta = None
+        self._outputs = None
+        self._fail = None
+
+        for keyword, payload in (keywords or []):
+            self.add(keyword, payload)
+        if keywords:
+            self.build()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._keywords)
+
+    def add(self, keyword, payload=None):
+        """Add a keyword; call build() again before scanning"""
+        if not keyword:
+            raise ValueError("Keywords must be non-empty")
+
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._keywords.append([])
+            state = next_state
+        self._keywords[state].append((len(keyword), keyword, payload))
+        self._delta = None
+
+    def build(self):
+        """Compute failure links breadth-first and fold them into the transition table.
+
+        Transitions back through the root are not copied into every state;
+        scanning falls back to the root's table instead, which keeps memory
+        proportional to the trie.
+        """
+        goto = self._goto
+        root = goto[0]
+        fail = [0] * len(goto)
+        delta = [dict(transitions) for transitions in goto]
+        outputs = [list(entries) for entries in self._keywords]
+
+        queue = deque(root.values())
+        while queue:
+            state = queue.popleft()
+            # A state inherits its failure state's transitions and matches
+            if fail[state]:
+                for char, target in delta[fail[state]].items():
+                    delta[state].setdefault(char, target)
+                outputs[state].extend(outputs[fail[state]])
+
+            for char, child in goto[state].items():
+                target = delta[fail[state]].get(char)
+                fail[child] = target if target is not None else root.get(char, 0)
+                queue.append(child)
+
+        self._delta = delta
+        self._outputs = [tuple(entries) for entries in outputs]
+        self._fail = fail
+        return self
+
+    def tables(self):
+        """(trie transitions, failure links, matches per state) for serializing the automaton.
+
+        Transitions are the trie's own, per state; a scan follows failure
+        links when a state has none for a character. Matches already include
+        those inherited through failure links, in scan order.
+        """
+        if self._delta is None:
+            self.build()
+        return self._goto, self._fail, self._outputs
+
+    def iter_matches(self, text):
+        """Yield (start, end, keyword, payload) for every occurrence, including overlapping ones"""
+        if self._delta is None:
+            self.build()
+
+        delta = self._delta
+        root = delta[0]
+        outputs = self._outputs
+        state = 0
+        for position, char in enumerate(text):
+            state = delta[state].get(char) or root.get(char, 0)
+            if outputs[state]:
+                end = position + 1
+                for length, keyword, payload in outputs[state]:
+                    yield end - length, end, keyword, payload
+
+    def find_all(self, text):
+        return list(self.iter_matches(text))
@@ -0,0 +1,164 @@
+import os
+import math
+import glob
+import hashlib
+import logging
+import unicodedata
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'langid')
+
+# Characters are folded onto a 32-symbol alphabet: word boundary, a-z,
+# apostrophe and one bucket for any other letter. N-gram ids are then plain
+# base-32 numbers, so unigrams, bigrams and trigrams index one dense table.
+ALPHABET_SIZE = 32
+BOUNDARY = 0
+APOSTROPHE = 27
+OTHER_LETTER = 28
+END = 31  # Pads the last position so its bigram has a trigram slot of its own
+ORDERS = (1, 2, 3)
+ORDER_OFFSETS = {1: 0, 2: ALPHABET_SIZE, 3: ALPHABET_SIZE + ALPHABET_SIZE ** 2}
+TABLE_SIZE = ALPHABET_SIZE + ALPHABET_SIZE ** 2 + ALPHABET_SIZE ** 3
+
+# Byte value of each folded character to its alphabet index
+SYMBOLS = np.zeros(256, dtype=np.int64)
+SYMBOLS[np.frombuffer(b'abcdefghijklmnopqrstuvwxyz', dtype=np.uint8)] = np.arange(1, 27)
+SYMBOLS[ord("'")] = APOSTROPHE
+SYMBOLS[ord('#')] = OTHER_LETTER
+SYMBOLS[ord('$')] = END
+
+class _FoldTable(dict):
+    """str.translate table that folds accents and maps non-letters to spaces, filled lazily"""
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        if char in "'’`":
+            folded = "'"
+        elif char.isalpha():
+            base = unicodedata.normalize('NFKD', char)[0].lower()
+            folded = base if 'a' <= base <= 'z' else '#'
+        else:
+            folded = ' '
+        self[codepoint] = folded
+        return folded
+
+FOLD = _FoldTable()
+
+def symbols(text):
+    """Alphabet indices of a text with one boundary between and around words"""
+    words = text.lower().translate(FOLD).split()
+    if not words:
+        return None
+    return SYMBOLS[np.frombuffer(f" {' '.join(words)} ".encode('ascii'), dtype=np.uint8)]
+
+def trigram_ids(text):
+    """Trigram id at every position of a text, ending with one END-padded trigram"""
+    words = text.lower().translate(FOLD).split()
+    if not words:
+        return None
+    s = SYMBOLS[np.frombuffer(f" {' '.join(words)} $".encode('ascii'), dtype=np.uint8)]
+    return (s[:-2] * ALPHABET_SIZE + s[1:-1]) * ALPHABET_SIZE + s[2:]
+
+def ngram_ids(text):
+    """Table rows of every character unigram, bigram and trigram in a text"""
+    s = symbols(text)
+    if s is None:
+        return None
+    letters = s[s != BOUNDARY]
+    bigrams = s[:-1] * ALPHABET_SIZE + s[1:] + ORDER_OFFSETS[2]
+    trigrams = (s[:-2] * ALPHABET_SIZE + s[1:-1]) * ALPHABET_SIZE + s[2:] + ORDER_OFFSETS[3]
+    return np.concatenate((letters, bigrams, trigrams))
+
+class LanguageIdentifier:
+    """Character n-gram Naive Bayes language identifier.
+
+    The model is a (TABLE_SIZE, languages) array of smoothed log-probabilities.
+    It is precomputed into a position table that adds, for each trigram, the
+    log-probabilities of the trigram, its leading bigram and its first
+    letter, so classifying a message is one fancy-indexing gather over its
+    trigram ids and a column sum. Short messages are handled as well as long
+    ones because every word contributes its boundary-anchored prefixes and
+    suffixes.
+    """
+
+    def __init__(self, languages, log_prob, fingerprint=None, position_log_prob=None):
+        self.languages = list(languages)
+        self.log_prob = np.asarray(log_prob, dtype=np.float64)
+        self.fingerprint = fingerprint
+        if self.log_prob.shape != (TABLE_SIZE, len(self.languages)):
+            raise ValueError(f"Expected a ({TABLE_SIZE}, {len(self.languages)}) log-probability table")
+        self.position_log_prob = self._position_table() if position_log_prob is None else position_log_prob
+
+    def _position_table(self):
+        trigrams = np.arange(ALPHABET_SIZE ** 3)
+        first = trigrams // ALPHABET_SIZE ** 2
+        last = trigrams % ALPHABET_SIZE
+        table = self.log_prob[ORDER_OFFSETS[2] + trigrams // ALPHABET_SIZE].copy()
+        table += np.where((last != END)[:, None], self.log_prob[ORDER_OFFSETS[3] + trigrams], 0.0)
+        table += np.where((first != BOUNDARY)[:, None], self.log_prob[ORDER_OFFSETS[1] + first], 0.0)
+        return table
+
+    @classmethod
+    def train(cls, texts_by_language, alpha=0.5):
+        """Fit per-order smoothed n-gram log-probabilities from {language: [texts]}"""
+        languages = sorted(texts_by_language)
+        counts = np.zeros((TABLE_SIZE, len(languages)), dtype=np.float64)
+        digest = hashlib.sha1()
+        for column, language in enumerate(languages):
+            for text in texts_by_language[language]:
+                digest.update(f"{language}\t{text}\n".encode('utf-8'))
+                ids = ngram_ids(text)
+                if ids is not None:
+                    counts[:, column] += np.bincount(ids, minlength=TABLE_SIZE)
+
+        # Each n-gram order is its own distribution, smoothed over its own vocabulary
+        log_prob = np.empty_like(counts)
+        bounds = [ORDER_OFFSETS[order] for order in ORDERS] + [TABLE_SIZE]
+        for start, stop in zip(bounds, bounds[1:]):
+            smoothed = counts[start:stop] + alpha
+            log_prob[start:stop] = np.log(smoothed) - np.log(smoothed.sum(axis=0))
+        return cls(languages, log_prob, fingerprint=digest.hexdigest()[:12])
+
+    @classmethod
+    def from_corpus(cls, directory=CORPUS_DIR, languages=None):
+        """Train on {language}.txt files of one sentence per line; '#' lines are comments"""
+        texts_by_language = {}
+        for path in sorted(glob.glob(os.path.join(directory, '*.txt'))):
+            language = os.path.splitext(os.path.basename(path))[0]
+            if languages and language not in languages:
+                continue
+            with open(path, encoding='utf-8') as f:
+                texts_by_language[language] = [
+                    line.strip() for line in f if line.strip() and not line.startswith('#')
+                ]
+        if len(texts_by_language) < 2:
+            raise ValueError(f"Need seed text for at least two languages in {directory}")
+        return cls.train(texts_by_language)
+
+    def scores(self, text):
+        """Posterior probability of each language (uniform priors), or None for texts without letters"""
+        proba = self._posterior(text)
+        if proba is None:
+            return None
+        return dict(zip(self.languages, proba))
+
+    def classify(self, text):
+        """(language, confidence) of the most likely language, or (None, 0.0) without letters"""
+        proba = self._posterior(text)
+        if proba is None:
+            return None, 0.0
+        best = max(range(len(proba)), key=proba.__getitem__)
+        return self.languages[best], proba[best]
+
+    def _posterior(self, text):
+        ids = trigram_ids(text)
+        if ids is None:
+            return None
+        # A handful of languages normalize faster in Python than in NumPy
+        joint = self.position_log_prob.take(ids, axis=0).sum(axis=0).tolist()
+        top = max(joint)
+        proba = [math.exp(value - top) for value in joint]
+        total = sum(proba)
+        return [value / total for value in proba]
@@ -0,0 +1,498 @@
+import os
+import mmap
+import glob
+import time
+import zlib
+import struct
+import hashlib
+import bisect
+import logging
+import threading
+from flask import current_app, has_app_context
+from services.keyword_automaton import KeywordAutomaton
+
+logger = logging.getLogger(__name__)
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'lexicon')
+
+# File layout: fixed header, then uint32 sections and UTF-8 blobs, each aligned:
+#   string offsets + blob   lexicon names followed by distinct values
+#   lexicon starts          first term of each lexicon; terms are grouped by lexicon in source order
+#   term values             string id of each term's value, or SELF_VALUE when it is the term itself
+#   term offsets + blob     the lowercased terms
+#   slots                   open-addressing hash of (lexicon, term) to term index + 1, 0 when empty
+# followed by the keyword automaton over AUTOMATON_LEXICONS:
+#   automaton lexicons      ids of the lexicons it matches
+#   edge states, chars,     open-addressing hash of the trie's (state, code point) transitions to the
+#   targets                 target state, 0 when empty (the root is never a target)
+#   failure links           per state
+#   output offsets + terms  term indexes matched on reaching each state, inherited ones included
+MAGIC = b'LXCN'
+VERSION = 2
+HEADER = struct.Struct('<4sI12sdIIIIIIIIII')
+SECTION_ALIGNMENT = 8
+SELF_VALUE = 0xFFFFFFFF
+
+# Lexicons matched as lowercase substrings of a message rather than as whole words
+AUTOMATON_LEXICONS = ('service', 'rw', 'org')
+
+def _align(offset):
+    return (offset + SECTION_ALIGNMENT - 1) // SECTION_ALIGNMENT * SECTION_ALIGNMENT
+
+def _seed(lexicon):
+    return zlib.crc32(lexicon.encode('utf-8') + b'\0')
+
+def _hash(lexicon, term):
+    return zlib.crc32(term.encode('utf-8'), _seed(lexicon))
+
+def _edge_hash(state, code):
+    return ((state * 0x9E3779B1) ^ code) & 0xFFFFFFFF
+
+def _table_size(n):
+    """Open-addressing table size for n entries: a power of two at most half full"""
+    size = 1
+    while size < 2 * n:
+        size *= 2
+    return size
+
+def _u32(values):
+    return struct.pack(f'<{len(values)}I', *values)
+
+def read_sources(directory=SOURCE_DIR):
+    """{lexicon: [(term, value)]} from {lexicon}.txt files.
+
+    Each line is a term, or value<TAB>term when the lexicon maps terms to
+    something else (service keywords to service types). Terms are
+    lowercased; '#' lines are comments and repeated terms keep their first
+    value.
+    """
+    lexicons = {}
+    for path in sorted(glob.glob(os.path.join(directory, '*.txt'))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        entries = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                value, _, term = line.rpartition('\t')
+                term = term.strip().lower()
+                if term:
+                    entries.setdefault(term, value.strip() or term)
+        lexicons[name] = list(entries.items())
+    return lexicons
+
+def compile_lexicons(lexicons, built_at=None):
+    """Serialize {lexicon: [(term, value)]} into the binary lexicon format"""
+    names = list(lexicons)
+    strings = list(names)
+    string_ids = {}
+    for entries in lexicons.values():
+        for term, value in entries:
+            if value != term and value not in string_ids:
+                string_ids[value] = len(strings)
+                strings.append(value)
+
+    terms = []
+    starts = [0]
+    values = []
+    digest = hashlib.sha1()
+    for name in names:
+        for term, value in lexicons[name]:
+            terms.append(term)
+            values.append(SELF_VALUE if value == term else string_ids[value])
+            digest.update(f"{name}\t{value}\t{term}\n".encode('utf-8'))
+        starts.append(len(terms))
+
+    # At most half full, so probes stay short
+    n_slots = _table_size(len(terms))
+    slots = [0] * n_slots
+    for lexicon_id, name in enumerate(names):
+        for index in range(starts[lexicon_id], starts[lexicon_id + 1]):
+            slot = _hash(name, terms[index]) & (n_slots - 1)
+            while slots[slot]:
+                slot = (slot + 1) & (n_slots - 1)
+            slots[slot] = index + 1
+
+    def blob(items):
+        encoded = [item.encode('utf-8') for item in items]
+        offsets = [0]
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        return offsets, b''.join(encoded)
+
+    # The automaton is compiled here once, so workers map it instead of each building their own
+    automaton_ids = [names.index(name) for name in AUTOMATON_LEXICONS if name in lexicons]
+    automaton = KeywordAutomaton()
+    for lexicon_id in automaton_ids:
+        for index in range(starts[lexicon_id], starts[lexicon_id + 1]):
+            automaton.add(terms[index], index)
+    goto, fail, outputs = automaton.tables()
+
+    edges = [(state, ord(char), target) for state, transitions in enumerate(goto) for char, target in transitions.items()]
+    n_edge_slots = _table_size(len(edges))
+    edge_states, edge_chars, edge_targets = [0] * n_edge_slots, [0] * n_edge_slots, [0] * n_edge_slots
+    for state, code, target in edges:
+        slot = _edge_hash(state, code) & (n_edge_slots - 1)
+        while edge_targets[slot]:
+            slot = (slot + 1) & (n_edge_slots - 1)
+        edge_states[slot], edge_chars[slot], edge_targets[slot] = state, code, target
+
+    output_offsets = [0]
+    output_terms = []
+    for entries in outputs:
+        output_terms.extend(index for _, _, index in entries)
+        output_offsets.append(len(output_terms))
+
+    string_offsets, string_blob = blob(strings)
+    term_offsets, term_blob = blob(terms)
+    sections = [
+        _u32(string_offsets), string_blob, _u32(starts), _u32(values), _u32(term_offsets), term_blob, _u32(slots),
+        _u32(automaton_ids), _u32(edge_states), _u32(edge_chars), _u32(edge_targets), _u32(fail),
+        _u32(output_offsets), _u32(output_terms)
+    ]
+
+    header = HEADER.pack(
+        MAGIC, VERSION, digest.hexdigest()[:12].encode('ascii'), built_at or time.time(),
+        len(names), len(strings), len(string_blob), len(terms), len(term_blob), n_slots,
+        len(automaton_ids), len(goto), n_edge_slots, len(output_terms)
+    )
+    parts = [header]
+    offset = len(header)
+    for section in sections:
+        padding = _align(offset) - offset
+        parts.append(b'\0' * padding + section)
+        offset += padding + len(section)
+    return b''.join(parts)
+
+class Lexicon:
+    """Read-only keyword lexicons compiled into one binary file.
+
+    The file is memory-mapped, so opening it costs the same for ten terms or
+    a million and every worker process on the host reads the same pages.
+    Membership tests hash (lexicon, term) into an open-addressing table and
+    compare one term; nothing is decoded up front. Builds are renamed into
+    place, so a worker that still maps the previous file keeps a consistent
+    copy until it reopens.
+    """
+
+    def __init__(self, buffer, path=None):
+        self.path = path
+        self._buffer = buffer
+        header = HEADER.unpack_from(buffer, 0)
+        magic, version = header[:2]
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path or 'buffer'} is not a version {VERSION} lexicon")
+        (
+            fingerprint, built_at, n_lexicons, n_strings, string_bytes, n_terms, term_bytes, n_slots,
+            n_automaton_lexicons, n_states, n_edge_slots, n_outputs
+        ) = header[2:]
+        self.version = fingerprint.decode('ascii')
+        self.built_at = built_at
+        self.n_terms = n_terms
+
+        view = memoryview(buffer)
+        offset = HEADER.size
+
+        def section(length, is_blob=False):
+            nonlocal offset
+            offset = _align(offset)
+            data = view[offset:offset + length]
+            offset += length
+            return data if is_blob else data.cast('I')
+
+        string_offsets = section(4 * (n_strings + 1))
+        string_blob = section(string_bytes, is_blob=True)
+        # Names and distinct values are few; decode them once
+        strings = [
+            str(string_blob[string_offsets[i]:string_offsets[i + 1]], 'utf-8') for i in range(n_strings)
+        ]
+        self.lexicons = strings[:n_lexicons]
+        self._strings = strings
+        self._lexicon_ids = {name: i for i, name in enumerate(self.lexicons)}
+        self._seeds = [_seed(name) for name in self.lexicons]
+        self._starts = section(4 * (n_lexicons + 1))
+        self._values = section(4 * n_terms)
+        self._term_offsets = section(4 * (n_terms + 1))
+        self._term_blob = section(term_bytes, is_blob=True)
+        self._slots = section(4 * n_slots)
+        self._mask = n_slots - 1
+        self._terms = {}
+
+        self.automaton_lexicons = tuple(self.lexicons[i] for i in section(4 * n_automaton_lexicons))
+        self._edge_states = section(4 * n_edge_slots)
+        self._edge_chars = section(4 * n_edge_slots)
+        self._edge_targets = section(4 * n_edge_slots)
+        self._edge_mask = n_edge_slots - 1
+        self._fail = section(4 * n_states)
+        self._output_offsets = section(4 * (n_states + 1))
+        self._output_terms = section(4 * n_outputs)
+        self.n_states = n_states
+        self._automaton = None
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), path=path)
+
+    @classmethod
+    def from_sources(cls, directory=SOURCE_DIR):
+        """Compile the source files in memory, for when no built file is available"""
+        return cls(compile_lexicons(read_sources(directory)))
+
+    @classmethod
+    def build(cls, directory, path):
+        """Compile the source files to path, replacing any previous build atomically"""
+        data = compile_lexicons(read_sources(directory))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return cls.open(path)
+
+    def __len__(self):
+        return self.n_terms
+
+    def _term(self, index):
+        return str(self._term_blob[self._term_offsets[index]:self._term_offsets[index + 1]], 'utf-8')
+
+    def _value(self, index):
+        value_id = self._values[index]
+        return self._term(index) if value_id == SELF_VALUE else self._strings[value_id]
+
+    def _find(self, lexicon, term):
+        """Index of term in lexicon, or None"""
+        lexicon_id = self._lexicon_ids.get(lexicon)
+        if lexicon_id is None:
+            return None
+        return self._probe(lexicon_id, term.encode('utf-8'))
+
+    def _probe(self, lexicon_id, encoded):
+        start, stop = self._starts[lexicon_id], self._starts[lexicon_id + 1]
+        offsets = self._term_offsets
+        slot = zlib.crc32(encoded, self._seeds[lexicon_id]) & self._mask
+        while True:
+            entry = self._slots[slot]
+            if not entry:
+                return None
+            index = entry - 1
+            if start <= index < stop and self._term_blob[offsets[index]:offsets[index + 1]] == encoded:
+                return index
+            slot = (slot + 1) & self._mask
+
+    def contains(self, lexicon, term):
+        """Whether the lowercased term is in the lexicon"""
+        return self._find(lexicon, term) is not None
+
+    def value(self, lexicon, term, default=None):
+        index = self._find(lexicon, term)
+        return default if index is None else self._value(index)
+
+    def word_set(self, lexicon):
+        """A set-like view of one lexicon for `word in ...` tests"""
+        return LexiconWords(self, lexicon)
+
+    def terms(self, lexicon):
+        """[(term, value)] of a lexicon in source order; empty for unknown lexicons"""
+        if lexicon not in self._terms:
+            lexicon_id = self._lexicon_ids.get(lexicon)
+            if lexicon_id is None:
+                return []
+            self._terms[lexicon] = [
+                (self._term(index), self._value(index))
+                for index in range(self._starts[lexicon_id], self._starts[lexicon_id + 1])
+            ]
+        return self._terms[lexicon]
+
+    def automaton(self):
+        """The mapped keyword automaton over automaton_lexicons; payloads are (lexicon, value)"""
+        if self._automaton is None:
+            self._automaton = LexiconAutomaton(self)
+        return self._automaton
+
+    def _lexicon_of(self, index):
+        return self.lexicons[bisect.bisect_right(self._starts, index) - 1]
+
+    def _goto(self, state, code):
+        """The trie's own transition from state on a code point, or 0"""
+        slot = _edge_hash(state, code) & self._edge_mask
+        while True:
+            target = self._edge_targets[slot]
+            if not target or (self._edge_states[slot] == state and self._edge_chars[slot] == code):
+                return target
+            slot = (slot + 1) & self._edge_mask
+
+    def values(self, lexicon):
+        """Distinct values of a lexicon in first-seen order"""
+        return list(dict.fromkeys(value for _, value in self.terms(lexicon)))
+
+    def stats(self):
+        return {
+            'version': self.version,
+            'path': self.path,
+            'terms': self.n_terms,
+            'lexicons': {
+                name: self._starts[i + 1] - self._starts[i] for i, name in enumerate(self.lexicons)
+            },
+            'automaton': {
+                'lexicons': list(self.automaton_lexicons),
+                'states': self.n_states,
+                'memo_states': self._automaton.memo_states if self._automaton else 0
+            },
+            'built_at': self.built_at
+        }
+
+class LexiconWords:
+    """Membership view of one lexicon, usable where a frozenset of words was.
+
+    Answers are memoized: message vocabularies are small, so after warm-up
+    most tests are one dict lookup and the memo stays far smaller than a
+    large lexicon.
+    """
+
+    MAX_MEMO = 65536
+
+    def __init__(self, lexicon, name):
+        self.lexicon = lexicon
+        self.name = name
+        self._lexicon_id = lexicon._lexicon_ids.get(name)
+        self._memo = {}
+
+    def __contains__(self, term):
+        found = self._memo.get(term)
+        if found is None:
+            found = self._lexicon_id is not None and self.lexicon._probe(self._lexicon_id, term.encode('utf-8')) is not None
+            if len(self._memo) >= self.MAX_MEMO:
+                self._memo.clear()
+            self._memo[term] = found
+        return found
+
+    def __iter__(self):
+        return (term for term, _ in self.lexicon.terms(self.name))
+
+    def __len__(self):
+        return len(self.lexicon.terms(self.name))
+
+class LexiconAutomaton:
+    """Aho-Corasick scan over the automaton tables of a lexicon file.
+
+    Finds what KeywordAutomaton built from the same terms would, in the
+    same order, without building anything: states are resolved from the
+    mapped transition hash and failure links the first time a scan reaches
+    them, and memoized as nodes holding their resolved transitions and
+    decoded matches. Hot paths are then one dict lookup per character, and
+    the memo only holds the states messages actually visit.
+    """
+
+    MAX_MEMO = 65536
+
+    def __init__(self, lexicon):
+        self.lexicon = lexicon
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._nodes = {}
+        self._root = self._node(0)
+
+    @property
+    def memo_states(self):
+        return len(self._nodes)
+
+    def _node(self, state):
+        """[state, {char: node}, matches] for a state, decoded on first use"""
+        node = self._nodes.get(state)
+        if node is None:
+            lexicon = self.lexicon
+            matches = []
+            for i in range(lexicon._output_offsets[state], lexicon._output_offsets[state + 1]):
+                index = lexicon._output_terms[i]
+                term = lexicon._term(index)
+                matches.append((len(term), term, (lexicon._lexicon_of(index), lexicon._value(index))))
+            node = [state, {}, tuple(matches)]
+            self._nodes[state] = node
+        return node
+
+    def _next(self, node, char):
+        """Follow failure links from node until a transition on char exists, as KeywordAutomaton.build folds them"""
+        lexicon = self.lexicon
+        code = ord(char)
+        state = node[0]
+        while True:
+            target = lexicon._goto(state, code)
+            if target or not state:
+                break
+            state = lexicon._fail[state]
+        with self._lock:
+            # Start a fresh graph rather than grow without bound; scans under way keep the old one
+            if len(self._nodes) >= self.MAX_MEMO:
+                self._reset()
+            target_node = self._node(target)
+            node[1][char] = target_node
+        return target_node
+
+    def iter_matches(self, text):
+        """Yield (start, end, keyword, payload) for every occurrence, including overlapping ones"""
+        node = self._root
+        for position, char in enumerate(text):
+            target = node[1].get(char)
+            node = target if target is not None else self._next(node, char)
+            if node[2]:
+                end = position + 1
+                for length, keyword, payload in node[2]:
+                    yield end - length, end, keyword, payload
+
+    def find_all(self, text):
+        return list(self.iter_matches(text))
+
+# Built lexicons by path, as (mtime, lexicon, checked at); reopened whenever the build command replaces the file
+_built_lexicons = {}
+_source_lexicons = {}
+
+# Seconds between checks for a rebuilt lexicon file
+CHECK_INTERVAL_SECONDS = 5
+
+def get_lexicon(path=None, source_dir=None, check_interval=CHECK_INTERVAL_SECONDS):
+    """The lexicon built at path, or one compiled from the source files if there is no build.
+
+    Each path is cached separately and its file stat'ed at most once per
+    check_interval seconds, so a rebuild is picked up that long after it
+    lands.
+    """
+    now = time.monotonic()
+    entry = _built_lexicons.get(path)
+    if entry is None or now - entry[2] >= check_interval:
+        try:
+            mtime = os.path.getmtime(path) if path else None
+        except OSError:
+            mtime = None
+
+        lexicon = entry[1] if entry is not None and entry[0] == mtime else None
+        if lexicon is None and mtime is not None:
+            try:
+                lexicon = Lexicon.open(path)
+                logger.info(f"Loaded lexicon {lexicon.version} with {len(lexicon)} terms from {path}")
+            except Exception as e:
+                logger.error(f"Failed to load lexicon from {path}: {e}")
+        entry = _built_lexicons[path] = (mtime, lexicon, now)
+    if entry[1] is not None:
+        return entry[1]
+
+    source_dir = source_dir or SOURCE_DIR
+    if source_dir not in _source_lexicons:
+        _source_lexicons[source_dir] = Lexicon.from_sources(source_dir)
+        logger.info(f"Compiled lexicon from {source_dir}; run `flask build-lexicon` to share one copy between workers")
+    return _source_lexicons[source_dir]
+
+def configured_lexicon(config):
+    """get_lexicon() with the LEXICON_* settings of an app config"""
+    return get_lexicon(
+        config.get('LEXICON_PATH'), config.get('LEXICON_SOURCE_DIR'),
+        config.get('LEXICON_CHECK_INTERVAL_SECONDS', CHECK_INTERVAL_SECONDS)
+    )
+
+def current_lexicon():
+    """The app's configured lexicon, or the source files outside an app context"""
+    if has_app_context():
+        return configured_lexicon(current_app.config)
+    return get_lexicon()
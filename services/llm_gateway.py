@@ -0,0 +1,445 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+import requests
+from services.cache_store import LRUCache, SQLiteCacheStore
+from services.http_client import http_client, UpstreamMetrics
+
+logger = logging.getLogger(__name__)
+
+# Rough prompt size before the provider reports real usage
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(messages, max_tokens):
+    """Upper-bound token estimate for a chat request: prompt characters plus the completion limit"""
+    return sum(len(message['content']) for message in messages) // CHARS_PER_TOKEN + len(messages) * 4 + max_tokens
+
+class MinuteBudget:
+    """Sliding one-minute window of requests and tokens spent by this process"""
+
+    def __init__(self, max_requests=None, max_tokens=None):
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self.rejected = 0
+        self._events = deque()
+        self._tokens = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._events and self._events[0][0] <= now - 60:
+            self._tokens -= self._events.popleft()[1]
+
+    def try_acquire(self, tokens):
+        """Reserve tokens for one request; returns a reservation, or None when over budget"""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            if (self.max_requests and len(self._events) >= self.max_requests) or \
+                    (self.max_tokens and self._tokens + tokens > self.max_tokens):
+                self.rejected += 1
+                return None
+            reservation = [now, tokens]
+            self._events.append(reservation)
+            self._tokens += tokens
+            return reservation
+
+    def settle(self, reservation, tokens):
+        """Replace a reservation's estimate with the tokens actually used"""
+        with self._lock:
+            if self._events and reservation[0] > time.monotonic() - 60:
+                self._tokens += tokens - reservation[1]
+            reservation[1] = tokens
+
+    def snapshot(self):
+        with self._lock:
+            self._prune(time.monotonic())
+            return {
+                'requests_last_minute': len(self._events),
+                'tokens_last_minute': self._tokens,
+                'max_requests_per_minute': self.max_requests,
+                'max_tokens_per_minute': self.max_tokens,
+                'rejected': self.rejected
+            }
+
+class SemanticCache:
+    """Responses keyed on unit-normalized prompt embeddings, matched by cosine similarity.
+
+    Entries live in a fixed-size ring, so a lookup is one matrix-vector
+    product over at most maxsize rows. Each entry belongs to a scope (model,
+    system prompt and limits) and only matches lookups in the same scope.
+    """
+
+    def __init__(self, maxsize=1000, threshold=0.95):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._vectors = None
+        self._scopes = np.zeros(maxsize, dtype=np.int64)
+        self._values = [None] * maxsize
+        self._count = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def lookup(self, scope, vector):
+        with self._lock:
+            if self._count and self._vectors.shape[1] == len(vector):
+                similarity = self._vectors[:self._count] @ vector
+                similarity[self._scopes[:self._count] != scope] = -1.0
+                best = int(similarity.argmax())
+                if similarity[best] >= self.threshold:
+                    self.hits += 1
+                    return self._values[best], float(similarity[best])
+            self.misses += 1
+            return None, None
+
+    def add(self, scope, vector, value):
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                self._vectors = np.zeros((self.maxsize, len(vector)), dtype=np.float32)
+                self._count = self._next = 0
+            self._vectors[self._next] = vector
+            self._scopes[self._next] = scope
+            self._values[self._next] = value
+            self._next = (self._next + 1) % self.maxsize
+            self._count = min(self._count + 1, self.maxsize)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': self._count,
+            'maxsize': self.maxsize,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+class _Flight:
+    """One in-progress completion that identical concurrent prompts wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+class LLMGateway:
+    """Managed path for chat completions against an OpenAI-compatible API.
+
+    Requests go through, in order: an exact response cache (memory, then a
+    SQLite file shared by workers), single-flight coalescing of identical
+    in-flight prompts, an embedding-similarity cache, per-minute request and
+    token budgets, and finally the upstream call with a timeout and an
+    optional hedged duplicate. Every step is counted in stats().
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.base_url = 'https://openrouter.ai/api/v1'
+        self.api_key = None
+        self.model = 'openai/gpt-4o-mini'
+        self.embedding_model = None
+        self.timeout = 15
+        self.embedding_timeout = 3
+        self.hedge_after = None
+        self.max_tokens = 200
+        self.ttl_seconds = 24 * 3600
+        self.prompt_price = 0.0
+        self.completion_price = 0.0
+        self.max_concurrency = 8
+        self.memory = LRUCache(maxsize=2000)
+        self.embeddings = LRUCache(maxsize=2000)
+        self.store = None
+        self.semantic = SemanticCache()
+        self.budget = MinuteBudget()
+        self.latency = UpstreamMetrics()
+        self.counters = {
+            'requests': 0, 'exact_hits': 0, 'semantic_hits': 0, 'coalesced': 0,
+            'upstream_calls': 0, 'hedges': 0, 'hedge_wins': 0, 'errors': 0, 'timeouts': 0,
+            'budget_rejections': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cost_usd': 0.0
+        }
+        self._counters_lock = threading.Lock()
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._executor = None
+        self._executor_pid = None
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize with Flask app context"""
+        self.app = app
+        if not http_client.app:
+            http_client.init_app(app)
+        self.base_url = app.config.get('LLM_BASE_URL', self.base_url).rstrip('/')
+        self.api_key = app.config.get('LLM_API_KEY') or app.config.get('OPENROUTER_API_KEY')
+        self.model = app.config.get('LLM_MODEL', self.model)
+        self.embedding_model = app.config.get('LLM_EMBEDDING_MODEL')
+        self.timeout = app.config.get('LLM_TIMEOUT_SECONDS', self.timeout)
+        self.embedding_timeout = app.config.get('LLM_EMBEDDING_TIMEOUT_SECONDS', self.embedding_timeout)
+        self.hedge_after = app.config.get('LLM_HEDGE_AFTER_SECONDS')
+        self.max_tokens = app.config.get('LLM_MAX_COMPLETION_TOKENS', self.max_tokens)
+        self.ttl_seconds = app.config.get('LLM_CACHE_TTL_HOURS', 24) * 3600
+        self.prompt_price = app.config.get('LLM_PROMPT_PRICE_PER_1K_TOKENS', 0.0)
+        self.completion_price = app.config.get('LLM_COMPLETION_PRICE_PER_1K_TOKENS', 0.0)
+        self.max_concurrency = app.config.get('LLM_MAX_CONCURRENCY', self.max_concurrency)
+        self.memory = LRUCache(maxsize=app.config.get('LLM_CACHE_MAX_ENTRIES', 2000), ttl_seconds=self.ttl_seconds)
+        self.embeddings = LRUCache(maxsize=app.config.get('LLM_CACHE_MAX_ENTRIES', 2000), ttl_seconds=self.ttl_seconds)
+        self.semantic = SemanticCache(
+            maxsize=app.config.get('LLM_SEMANTIC_CACHE_MAX_ENTRIES', 1000),
+            threshold=app.config.get('LLM_SEMANTIC_THRESHOLD', 0.95)
+        )
+        self.budget = MinuteBudget(
+            max_requests=app.config.get('LLM_MAX_REQUESTS_PER_MINUTE'),
+            max_tokens=app.config.get('LLM_MAX_TOKENS_PER_MINUTE')
+        )
+
+        store_path = app.config.get('LLM_CACHE_PATH')
+        if store_path:
+            try:
+                self.store = SQLiteCacheStore(store_path, 'llm')
+            except Exception as e:
+                logger.error(f"Failed to open LLM cache at {store_path}: {e}")
+                self.store = None
+
+    @property
+    def enabled(self):
+        return bool(self.app and self.api_key and self.base_url)
+
+    def _count(self, name, amount=1):
+        with self._counters_lock:
+            self.counters[name] += amount
+
+    def _pool(self):
+        # Worker threads do not survive a fork, so each process starts its own pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='llm')
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def _headers(self):
+        return {'Authorization': f"Bearer {self.api_key}", 'Content-Type': 'application/json'}
+
+    def complete(self, prompt, system=None, max_tokens=None, temperature=0.0, semantic=True):
+        """Answer a prompt, or return None when disabled, over budget, timed out or failing.
+
+        Returns a dict with 'text', 'model', 'usage', 'cached' (None, 'exact',
+        'semantic' or 'coalesced') and 'latency_ms'.
+        """
+        if not self.enabled:
+            return None
+
+        started = time.perf_counter()
+        self._count('requests')
+        max_tokens = max_tokens or self.max_tokens
+        messages = ([{'role': 'system', 'content': system}] if system else []) + [{'role': 'user', 'content': prompt}]
+        payload = {'model': self.model, 'messages': messages, 'max_tokens': max_tokens, 'temperature': temperature}
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+        # Exact repeats never leave the process, or at worst the host
+        result = self.memory.get(key)
+        if result is None and self.store:
+            result = self.store.get(key)
+            if result is not None:
+                self.memory.set(key, result)
+        if result is not None:
+            self._count('exact_hits')
+            return self._answer(result, 'exact', started)
+
+        # Identical prompts already in flight wait for that call instead of making their own
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            self._count('coalesced')
+            if not flight.done.wait(self.timeout * 2) or flight.result is None:
+                return None
+            return self._answer(flight.result, 'coalesced', started)
+
+        try:
+            cached = None
+            result = None
+            vector = self._embed(prompt) if semantic and temperature == 0 else None
+            scope = int.from_bytes(hashlib.sha256(json.dumps([self.model, system, max_tokens]).encode('utf-8')).digest()[:8], 'little', signed=True)
+            if vector is not None:
+                result, similarity = self.semantic.lookup(scope, vector)
+                if result is not None:
+                    self._count('semantic_hits')
+                    cached = 'semantic'
+                    logger.debug(f"Semantic cache hit at similarity {similarity:.3f}")
+
+            if result is None:
+                result = self._call(payload)
+                if result is not None and vector is not None:
+                    self.semantic.add(scope, vector, result)
+
+            if result is not None:
+                self.memory.set(key, result)
+                if self.store and cached is None:
+                    self.store.set(key, result, ttl_seconds=self.ttl_seconds)
+            flight.result = result
+        finally:
+            flight.done.set()
+            with self._flights_lock:
+                self._flights.pop(key, None)
+
+        if result is None:
+            return None
+        return self._answer(result, cached, started)
+
+    def _answer(self, result, cached, started):
+        latency_ms = (time.perf_counter() - started) * 1000
+        if cached is None:
+            self.latency.record(latency_ms)
+        return {**result, 'usage': dict(result.get('usage') or {}), 'cached': cached, 'latency_ms': round(latency_ms, 1)}
+
+    def _call(self, payload):
+        """Send the completion upstream within the budget, hedging slow calls"""
+        estimate = estimate_tokens(payload['messages'], payload['max_tokens'])
+        reservation = self.budget.try_acquire(estimate)
+        if reservation is None:
+            self._count('budget_rejections')
+            logger.warning("LLM budget exhausted for this minute; skipping completion")
+            return None
+
+        pool = self._pool()
+        deadline = time.monotonic() + self.timeout
+        pending = {pool.submit(self._post_completion, payload): reservation}
+        hedge = None
+
+        if self.hedge_after and self.hedge_after < self.timeout:
+            done, _ = wait(pending, timeout=self.hedge_after)
+            if not done:
+                # A duplicate request usually beats a slow one; it spends budget like any other
+                hedge_reservation = self.budget.try_acquire(estimate)
+                if hedge_reservation is not None:
+                    self._count('hedges')
+                    hedge = pool.submit(self._post_completion, payload)
+                    pending[hedge] = hedge_reservation
+
+        while pending:
+            done, _ = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                self._count('timeouts')
+                logger.warning(f"LLM completion timed out after {self.timeout} s")
+                return None
+            for future in done:
+                reservation = pending.pop(future)
+                result = future.result()
+                if result is None:
+                    continue
+                self.budget.settle(reservation, result['usage'].get('total_tokens', estimate))
+                if future is hedge:
+                    self._count('hedge_wins')
+                return result
+        return None
+
+    def _post_completion(self, payload):
+        """One chat completion request; returns None on any upstream failure"""
+        self._count('upstream_calls')
+        try:
+            response = http_client.post(
+                f"{self.base_url}/chat/completions",
+                json=payload,
+                headers=self._headers(),
+                upstream='llm',
+                timeout=(http_client.connect_timeout, self.timeout),
+                retries=0
+            )
+            if response.status_code != 200:
+                self._count('errors')
+                logger.error(f"LLM completion failed with status {response.status_code}: {response.text[:200]}")
+                return None
+            data = response.json()
+            usage = data.get('usage') or {}
+        except (requests.RequestException, ValueError) as e:
+            self._count('errors')
+            logger.error(f"LLM completion failed: {e}")
+            return None
+
+        prompt_tokens = usage.get('prompt_tokens', 0)
+        completion_tokens = usage.get('completion_tokens', 0)
+        self._count('prompt_tokens', prompt_tokens)
+        self._count('completion_tokens', completion_tokens)
+        self._count('cost_usd', (prompt_tokens * self.prompt_price + completion_tokens * self.completion_price) / 1000)
+
+        try:
+            text = data['choices'][0]['message']['content']
+        except (KeyError, IndexError, TypeError):
+            self._count('errors')
+            logger.error("LLM completion response had no message content")
+            return None
+        return {
+            'text': text.strip(),
+            'model': data.get('model', payload['model']),
+            'usage': {
+                'prompt_tokens': prompt_tokens,
+                'completion_tokens': completion_tokens,
+                'total_tokens': usage.get('total_tokens', prompt_tokens + completion_tokens)
+            }
+        }
+
+    def _embed(self, text):
+        """Unit-normalized embedding of a prompt, or None when unavailable"""
+        if not self.embedding_model:
+            return None
+        key = hashlib.sha256(f"{self.embedding_model}\n{text}".encode('utf-8')).hexdigest()
+        vector = self.embeddings.get(key)
+        if vector is not None:
+            return vector
+
+        if self.budget.try_acquire(len(text) // CHARS_PER_TOKEN + 1) is None:
+            return None
+        try:
+            response = http_client.post(
+                f"{self.base_url}/embeddings",
+                json={'model': self.embedding_model, 'input': text},
+                headers=self._headers(),
+                upstream='llm_embeddings',
+                timeout=(http_client.connect_timeout, self.embedding_timeout),
+                retries=0
+            )
+            if response.status_code != 200:
+                logger.warning(f"LLM embedding failed with status {response.status_code}")
+                return None
+            vector = np.asarray(response.json()['data'][0]['embedding'], dtype=np.float32)
+        except (requests.RequestException, ValueError, KeyError, IndexError) as e:
+            logger.warning(f"LLM embedding failed: {e}")
+            return None
+
+        norm = float(np.linalg.norm(vector))
+        if not norm:
+            return None
+        vector /= norm
+        self.embeddings.set(key, vector)
+        return vector
+
+    def stats(self):
+        with self._counters_lock:
+            counters = dict(self.counters)
+        counters['cost_usd'] = round(counters['cost_usd'], 6)
+        return {
+            'enabled': self.enabled,
+            'model': self.model,
+            'counters': counters,
+            'latency': self.latency.snapshot(),
+            'budget': self.budget.snapshot(),
+            'exact_cache': self.memory.stats(),
+            'semantic_cache': self.semantic.stats(),
+            'store': self.store.stats() if self.store else None
+        }
+
+# Shared by every service in the process
+llm_gateway = LLMGateway()
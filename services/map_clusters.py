@@ -0,0 +1,173 @@
+import math
+import time
+import logging
+from collections import defaultdict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Points are keyed by their Morton (Z-order) code at this web-mercator zoom,
+# so every tile and every sub-cell of a tile is a contiguous range of codes
+CODE_ZOOM = 24
+MAX_LATITUDE = 85.05112878
+
+# Each tile is split into 2**CLUSTER_LEVELS x 2**CLUSTER_LEVELS cells (64 px on a 256 px tile)
+CLUSTER_LEVELS = 2
+
+# Service fields returned for unclustered points
+SERVICE_FIELDS = ('id', 'name', 'category', 'address', 'phone_number', 'opening_hours', 'latitude', 'longitude')
+
+def _spread_bits(values):
+    """Insert a zero bit between each of the low 32 bits of every value"""
+    values = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+def morton_codes(tile_x, tile_y):
+    """Interleave tile x (even bits) and y (odd bits) into Z-order codes"""
+    return (_spread_bits(np.asarray(tile_x)) | (_spread_bits(np.asarray(tile_y)) << np.uint64(1))).astype(np.int64)
+
+def project(latitudes, longitudes, zoom):
+    """Fractional web-mercator tile coordinates of points at a zoom level"""
+    latitudes = np.clip(np.asarray(latitudes, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    scale = 2.0 ** zoom
+    x = (longitudes + 180.0) / 360.0 * scale
+    phi = np.radians(latitudes)
+    y = (1.0 - np.log(np.tan(phi) + 1.0 / np.cos(phi)) / math.pi) / 2.0 * scale
+    return x, y
+
+def tile_bounds(z, x, y):
+    """(south, west, north, east) of a web-mercator tile"""
+    scale = 2.0 ** z
+
+    def latitude(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / scale))))
+
+    return latitude(y + 1), x / scale * 360.0 - 180.0, latitude(y), (x + 1) / scale * 360.0 - 180.0
+
+def tiles_for_bbox(south, west, north, east, z):
+    """Tile (x, y) pairs covering a bounding box at zoom z"""
+    x, y = project([north, south], [west, east], z)
+    last = 2 ** z - 1
+    x0, x1 = max(0, int(x[0])), min(last, int(x[1]))
+    y0, y1 = max(0, int(y[0])), min(last, int(y[1]))
+    return [(tile_x, tile_y) for tile_y in range(y0, y1 + 1) for tile_x in range(x0, x1 + 1)]
+
+class ClusterIndex:
+    """Zoom-dependent grid clustering of service points over web-mercator tiles.
+
+    Points are sorted by Morton code with prefix sums of their coordinates, so
+    the count and centroid of any tile cell come from two binary searches.
+    Building a tile costs the same whether the catalog holds a hundred
+    services or a million.
+    """
+
+    def __init__(self, max_cluster_zoom=16):
+        # Sub-cells cannot be finer than the code resolution
+        self.max_cluster_zoom = min(max_cluster_zoom, CODE_ZOOM - CLUSTER_LEVELS)
+        self.built_at = None
+        self._layers = {}
+
+    def __len__(self):
+        layer = self._layers.get(None)
+        return len(layer['rows']) if layer else 0
+
+    def build(self, rows):
+        """Replace the indexed rows; each row is a dict with 'latitude', 'longitude' and 'category'"""
+        started = time.perf_counter()
+        by_category = defaultdict(list)
+        for row in rows:
+            if row.get('latitude') is None or row.get('longitude') is None:
+                continue
+            by_category[None].append(row)
+            by_category[row.get('category')].append(row)
+
+        layers = {category: self._build_layer(category_rows) for category, category_rows in by_category.items()}
+        layers.setdefault(None, self._build_layer([]))
+
+        self._layers = layers
+        self.built_at = time.time()
+        logger.info(f"Built cluster index over {len(self)} services in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def _build_layer(self, rows):
+        latitudes = np.array([row['latitude'] for row in rows], dtype=np.float64)
+        longitudes = np.array([row['longitude'] for row in rows], dtype=np.float64)
+        tile_x, tile_y = self._code_tiles(latitudes, longitudes)
+        codes = morton_codes(tile_x, tile_y)
+
+        order = np.argsort(codes, kind='stable')
+        return {
+            'rows': [rows[i] for i in order],
+            'codes': codes[order],
+            'tile_x': tile_x[order],
+            'tile_y': tile_y[order],
+            'cum_lat': np.concatenate(([0.0], np.cumsum(latitudes[order]))),
+            'cum_lng': np.concatenate(([0.0], np.cumsum(longitudes[order])))
+        }
+
+    def _code_tiles(self, latitudes, longitudes):
+        """Integer tile coordinates at CODE_ZOOM"""
+        x, y = project(latitudes, longitudes, CODE_ZOOM)
+        last = 2 ** CODE_ZOOM - 1
+        return np.clip(x, 0, last).astype(np.int64), np.clip(y, 0, last).astype(np.int64)
+
+    def tiles_containing(self, latitudes, longitudes, z):
+        """Distinct (x, y) tiles at zoom z that contain the given points"""
+        tile_x, tile_y = self._code_tiles(np.atleast_1d(latitudes), np.atleast_1d(longitudes))
+        shift = CODE_ZOOM - z
+        return set(zip((tile_x >> shift).tolist(), (tile_y >> shift).tolist()))
+
+    def occupied_tiles(self, z, category=None):
+        """Distinct (x, y) tiles at zoom z holding at least one service"""
+        layer = self._layers.get(category)
+        if layer is None:
+            return set()
+        shift = CODE_ZOOM - z
+        return set(zip((layer['tile_x'] >> shift).tolist(), (layer['tile_y'] >> shift).tolist()))
+
+    def tile(self, z, x, y, category=None, levels=CLUSTER_LEVELS):
+        """Clusters and single services inside a tile, as a list of feature dicts.
+
+        Below max_cluster_zoom the tile is split into 2**levels x 2**levels
+        cells and every cell holding more than one service becomes a cluster.
+        """
+        layer = self._layers.get(category)
+        if layer is None or z < 0 or z > CODE_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return []
+
+        tile_code = int(morton_codes(x, y))
+        if z >= self.max_cluster_zoom:
+            # At street level every point stands alone
+            span = 2 * (CODE_ZOOM - z)
+            start, stop = np.searchsorted(layer['codes'], [tile_code << span, (tile_code + 1) << span])
+            return [self._service(row) for row in layer['rows'][start:stop]]
+
+        # Split the tile into sub-cells; each one is a contiguous run of codes
+        levels = min(levels, CODE_ZOOM - z)
+        cells = 4 ** levels
+        shift = 2 * (CODE_ZOOM - z - levels)
+        bounds = (np.arange(cells + 1, dtype=np.int64) + tile_code * cells) << shift
+        edges = np.searchsorted(layer['codes'], bounds, side='left')
+
+        features = []
+        occupied = np.nonzero(edges[1:] > edges[:-1])[0]
+        for start, stop in zip(edges[occupied].tolist(), edges[occupied + 1].tolist()):
+            count = stop - start
+            if count == 1:
+                features.append(self._service(layer['rows'][start]))
+            else:
+                features.append({
+                    'type': 'cluster',
+                    'count': count,
+                    'latitude': round((layer['cum_lat'][stop] - layer['cum_lat'][start]) / count, 6),
+                    'longitude': round((layer['cum_lng'][stop] - layer['cum_lng'][start]) / count, 6)
+                })
+        return features
+
+    def _service(self, row):
+        feature = {field: row.get(field) for field in SERVICE_FIELDS}
+        feature['type'] = 'service'
+        return feature
@@ -0,0 +1,114 @@
+import re
+import copy
+import json
+import hashlib
+import logging
+from services.cache_store import LRUCache, SQLiteCacheStore
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+def normalize_text(text):
+    """Canonical form of a message: trimmed, with whitespace runs collapsed to one space"""
+    return WHITESPACE_RE.sub(' ', text).strip()
+
+def lexicon_version(*parts):
+    """Short fingerprint of the patterns and lexicons an NLP result depends on"""
+    payload = json.dumps(parts, sort_keys=True, default=repr)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:12]
+
+class NLPResultCache:
+    """Bounded LRU/TTL cache of NLP results keyed on normalized message text.
+
+    Keys carry a fingerprint of the intent patterns and lexicons, so editing
+    any of them invalidates every earlier result without a flush. Entries can
+    persist in a SQLite file shared by every worker on the host.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.version = None
+        self.memory = LRUCache()
+        self.store = None
+        self.ttl_seconds = 24 * 3600
+        self.max_text_length = 160
+        self.hits = 0
+        self.misses = 0
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize with Flask app context"""
+        self.app = app
+        self.ttl_seconds = app.config.get('NLP_CACHE_TTL_HOURS', 24) * 3600
+        self.max_text_length = app.config.get('NLP_CACHE_MAX_TEXT_LENGTH', 160)
+        self.memory = LRUCache(
+            maxsize=app.config.get('NLP_CACHE_MAX_ENTRIES', 5000),
+            ttl_seconds=self.ttl_seconds
+        )
+
+        store_path = app.config.get('NLP_CACHE_PATH')
+        if store_path:
+            try:
+                self.store = SQLiteCacheStore(store_path, 'nlp')
+            except Exception as e:
+                logger.error(f"Failed to open NLP cache at {store_path}: {e}")
+                self.store = None
+
+    def set_version(self, version):
+        """Switch to a new pattern/lexicon fingerprint; results cached under the old one are dropped"""
+        if version != self.version:
+            if self.version is not None:
+                logger.info(f"NLP lexicon version changed from {self.version} to {version}, invalidating cached results")
+            self.version = version
+            self.memory.clear()
+
+    def make_key(self, normalized):
+        # Hash the text so persistent keys stay short however long the message
+        digest = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+        return f"{self.version}:{digest}"
+
+    def cacheable(self, normalized):
+        """Long messages are almost always unique, so they are not worth storing"""
+        return 0 < len(normalized) <= self.max_text_length
+
+    def get(self, normalized):
+        if not self.cacheable(normalized):
+            return None
+
+        key = self.make_key(normalized)
+        result = self.memory.get(key)
+        if result is None and self.store:
+            result = self.store.get(key)
+            if result is not None:
+                self.memory.set(key, result)
+
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # Callers may modify the entities they get back
+        return copy.deepcopy(result)
+
+    def set(self, normalized, result):
+        if not self.cacheable(normalized):
+            return
+        key = self.make_key(normalized)
+        result = copy.deepcopy(result)
+        self.memory.set(key, result)
+        if self.store:
+            self.store.set(key, result, ttl_seconds=self.ttl_seconds)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'max_text_length': self.max_text_length,
+            'memory': self.memory.stats(),
+            'store': self.store.stats() if self.store else None
+        }
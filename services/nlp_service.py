@@ -1,13 +1,112 @@
 import logging
 import json
+import os
 import re
+import copy
+import time
 from collections import defaultdict
 from flask import current_app
+from sqlalchemy import update
 from app import db
 from models import Message
+from services.intent_matcher import IntentMatcher
+from services.nlp_cache import NLPResultCache, normalize_text, lexicon_version
+from services.intent_model import IntentModel
+from services.language_id import LanguageIdentifier, CORPUS_DIR
+from services.lexicon import get_lexicon, configured_lexicon
 
 logger = logging.getLogger(__name__)
 
+DATE_PATTERNS = [
+    re.compile(r'\b\d{1,2}/\d{1,2}/\d{2,4}\b', re.IGNORECASE),  # DD/MM/YYYY or MM/DD/YYYY
+    re.compile(r'\b\d{1,2}-\d{1,2}-\d{2,4}\b', re.IGNORECASE),  # DD-MM-YYYY or MM-DD-YYYY
+    re.compile(r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{1,2}(?:st|nd|rd|th)?,? \d{4}\b', re.IGNORECASE)  # Month DD, YYYY
+]
+
+class LexiconMatchers:
+    """Matchers for one lexicon build: its mapped keyword automaton and organization regexes"""
+    
+    def __init__(self, lexicon):
+        self.lexicon = lexicon
+        self.version = lexicon.version
+        self.service_types = lexicon.values('service')
+        self.org_suffixes = [suffix for suffix, _ in lexicon.terms('org')]
+        self.org_patterns = {
+            suffix: re.compile(r'\b([A-Z][a-z]+ )+' + re.escape(suffix) + r'\b', re.IGNORECASE)
+            for suffix in self.org_suffixes
+        }
+        self.location_keywords = lexicon.word_set('location')
+        self.person_prefixes = lexicon.word_set('person')
+        
+        # Compiled into the lexicon file over the service, rw and org terms; payloads are (lexicon, value) pairs
+        self.automaton = lexicon.automaton()
+
+_lexicon_matchers = None
+
+def get_lexicon_matchers(config):
+    """Matchers for the current lexicon, rebuilt when a new lexicon is installed"""
+    global _lexicon_matchers
+    lexicon = configured_lexicon(config)
+    if _lexicon_matchers is None or _lexicon_matchers.lexicon is not lexicon:
+        _lexicon_matchers = LexiconMatchers(lexicon)
+    return _lexicon_matchers
+
+# Shared by every NLPService instance in the process
+nlp_cache = NLPResultCache()
+
+# Trained intent model, reloaded whenever the training job replaces the file
+_intent_model = None
+_intent_model_mtime = None
+
+def get_intent_model(path):
+    """Return the intent model stored at path, or None if unavailable"""
+    global _intent_model, _intent_model_mtime
+    try:
+        mtime = os.path.getmtime(path) if path else None
+    except OSError:
+        mtime = None
+    
+    if mtime != _intent_model_mtime:
+        _intent_model_mtime = mtime
+        _intent_model = None
+        if mtime is not None:
+            try:
+                _intent_model = IntentModel.load(path)
+                logger.info(f"Loaded intent model with {len(_intent_model.classes)} intents from {path}")
+            except Exception as e:
+                logger.error(f"Failed to load intent model from {path}: {e}")
+    return _intent_model
+
+# Language identifiers trained from the seed corpus, one per (directory, languages)
+_language_identifiers = {}
+
+def get_language_identifier(directory, languages):
+    """Return the identifier trained on the seed corpus, or None if it cannot be built"""
+    key = (directory, tuple(languages))
+    if key not in _language_identifiers:
+        try:
+            identifier = LanguageIdentifier.from_corpus(directory, languages=languages)
+            logger.info(f"Trained language identifier for {', '.join(identifier.languages)} from {directory}")
+        except Exception as e:
+            logger.error(f"Failed to train language identifier from {directory}: {e}")
+            identifier = None
+        _language_identifiers[key] = identifier
+    return _language_identifiers[key]
+
+def install_models(config, intent_model=None, language_identifier=None):
+    """Use models that are already loaded, e.g. from shared memory, instead of building them again"""
+    global _intent_model, _intent_model_mtime
+    path = config.get('INTENT_MODEL_PATH')
+    if intent_model is not None and path:
+        try:
+            _intent_model_mtime = os.path.getmtime(path)
+            _intent_model = intent_model
+        except OSError:
+            pass
+    if language_identifier is not None:
+        key = (config.get('LANGID_CORPUS_DIR') or CORPUS_DIR, tuple(config.get('LANGID_LANGUAGES', ['en', 'rw'])))
+        _language_identifiers[key] = language_identifier
+
 class NLPService:
     """Service for natural language processing to understand user intents and entities"""
     
@@ -15,15 +114,55 @@ class NLPService:
         self.app = app
         self.openai_client = None
         self.intent_patterns = self._define_intent_patterns()
+        self.intent_matcher = IntentMatcher(self.intent_patterns)
+        self.lexicon_version = lexicon_version(self.intent_patterns, [pattern.pattern for pattern in DATE_PATTERNS])
+        self.matchers = None
+        self.cache = nlp_cache
+        self.min_model_confidence = 0.7
+        self.language_identifier = None
+        self.min_language_confidence = 0.9
         
         if app:
             self.init_app(app)
+        else:
+            self.matchers = get_lexicon_matchers({})
     
     def init_app(self, app):
         """Initialize with Flask app context"""
         self.app = app
+        
+        # The result cache is shared by every NLPService instance in the process
+        if not nlp_cache.app:
+            nlp_cache.init_app(app)
+        self.min_model_confidence = app.config.get('INTENT_MODEL_MIN_CONFIDENCE', 0.7)
+        self.min_language_confidence = app.config.get('LANGID_MIN_CONFIDENCE', 0.9)
+        self.language_identifier = get_language_identifier(
+            app.config.get('LANGID_CORPUS_DIR') or CORPUS_DIR,
+            app.config.get('LANGID_LANGUAGES', ['en', 'rw'])
+        )
+        self.intent_model()
+        
         logger.info("Initialized NLP service with keyword-based extraction")
     
+    def intent_model(self):
+        """The trained intent model, if one has been built.
+        
+        Also picks up a rebuilt lexicon and keeps the result cache keyed to
+        both; every analysis entry point calls this first.
+        """
+        model = get_intent_model(self.app.config.get('INTENT_MODEL_PATH')) if self.app else None
+        if self.app:
+            self.matchers = get_lexicon_matchers(self.app.config)
+        
+        # Cached results are only valid for the patterns, lexicons and model that produced them
+        config_version = self.app.config.get('NLP_CACHE_VERSION', 1) if self.app else 1
+        model_version = model.version if model else 'patterns'
+        language_version = self.language_identifier.fingerprint if self.language_identifier else 'keywords'
+        self.cache.set_version(
+            f"{config_version}-{self.lexicon_version}-{self.matchers.version}-{model_version}-{language_version}"
+        )
+        return model
+    
     def _define_intent_patterns(self):
         """Define regex patterns for intent recognition"""
         patterns = {
@@ -65,21 +204,27 @@ class NLPService:
         }
         return patterns
     
-    def detect_language(self, text):
-        """Detect if the text is in English or Kinyarwanda"""
-        # Simple rules for language detection
-        # In a real implementation, use a proper language detection library
-        
-        # Common Kinyarwanda words
-        kinyarwanda_words = [
-            'muraho', 'amakuru', 'yego', 'oya', 'murakoze', 'ndashaka', 
-            'mfasha', 'kubona', 'serivisi', 'aho', 'kugera'
-        ]
+    def keyword_hits(self, text):
+        """Every lexicon keyword found in the lowercased text, as (start, end, keyword, (lexicon, value))"""
+        return self.matchers.automaton.find_all(text.lower())
+    
+    def detect_language(self, text, hits=None):
+        """Detect the language of the text, by default English or Kinyarwanda"""
+        # Character n-gram model first; texts it is unsure about use the keyword rule
+        if self.language_identifier:
+            language, confidence = self.language_identifier.classify(text)
+            if language and confidence >= self.min_language_confidence:
+                return language
         
-        text_lower = text.lower()
+        return self.keyword_language(text, hits=hits)
+    
+    def keyword_language(self, text, hits=None):
+        """Kinyarwanda if at least two known Kinyarwanda words occur, otherwise English"""
+        if hits is None:
+            hits = self.keyword_hits(text)
         
-        # Count Kinyarwanda words in the text
-        kinyarwanda_count = sum(1 for word in kinyarwanda_words if word in text_lower)
+        # Count distinct Kinyarwanda words in the text
+        kinyarwanda_count = len({value for _, _, _, (lexicon, value) in hits if lexicon == 'rw'})
         
         # If multiple Kinyarwanda words found, assume it's Kinyarwanda
         if kinyarwanda_count >= 2:
@@ -90,94 +235,130 @@ class NLPService:
     
     def detect_intent(self, text):
         """Detect the user's intent from the text"""
-        intent_scores = defaultdict(int)
-        
-        # Check each intent pattern
-        for intent, patterns in self.intent_patterns.items():
-            for pattern in patterns:
-                matches = re.findall(pattern, text)
-                intent_scores[intent] += len(matches)
+        return self.detect_intents([text])[0]
+    
+    def detect_intents(self, texts, model=None):
+        """Detect intents for a batch of texts.
         
-        # Get the intent with the highest score
-        if intent_scores:
-            top_intent = max(intent_scores.items(), key=lambda x: x[1])
-            if top_intent[1] > 0:
-                return top_intent[0]
+        The trained model scores the whole batch at once; texts it is not
+        confident about fall back to the regex patterns.
+        """
+        model = model or self.intent_model()
+        if model is None:
+            predictions = [(None, 0.0)] * len(texts)
+        else:
+            predictions = model.predict(texts)
         
-        # Default intent if no patterns match
-        return "general_inquiry"
+        # All patterns are scored in one pass; defaults to general_inquiry if none match
+        return [
+            intent if confidence >= self.min_model_confidence
+            else self.intent_matcher.best(text, default="general_inquiry")
+            for text, (intent, confidence) in zip(texts, predictions)
+        ]
     
-    def extract_entities(self, text, language='en'):
+    def extract_entities(self, text, language='en', hits=None):
         """Extract named entities from text using keyword-based approaches"""
         entities = {}
-        text_lower = text.lower()
         words = text.split()
+        if hits is None:
+            hits = self.keyword_hits(text)
         
-        # Extract service types using keywords
-        service_keywords = {
-            'health': ['hospital', 'clinic', 'health center', 'doctor', 'medical', 'healthcare'],
-            'education': ['school', 'university', 'college', 'education', 'academic'],
-            'identification': ['ID', 'passport', 'identification', 'identity card', 'birth certificate'],
-            'taxation': ['tax', 'taxes', 'revenue', 'payment', 'financial'],
-            'social': ['social security', 'welfare', 'unemployment', 'benefits', 'assistance']
-        }
-        
-        service_types = []
-        for service_type, keywords in service_keywords.items():
-            for keyword in keywords:
-                if keyword.lower() in text_lower:
-                    service_types.append(service_type)
-                    break
+        # Extract service types using keywords, in lexicon order
+        found_services = {value for _, _, _, (lexicon, value) in hits if lexicon == 'service'}
+        service_types = [service_type for service_type in self.matchers.service_types if service_type in found_services]
         
         if service_types:
             entities['SERVICE_TYPE'] = service_types
         
         # Simple location extraction
-        location_keywords = ['in', 'at', 'near', 'around', 'by']
         for i, word in enumerate(words):
-            if word.lower() in location_keywords and i < len(words) - 1:
+            if word.lower() in self.matchers.location_keywords and i < len(words) - 1:
                 potential_location = words[i+1]
                 if potential_location not in ['the', 'a', 'an'] and len(potential_location) > 2:
                     entities['LOC'] = [potential_location]
                     break
         
         # Person extraction - simple name detection
-        person_prefixes = ['mr', 'mrs', 'ms', 'dr', 'prof']
         for i, word in enumerate(words):
-            if i < len(words) - 1 and word.lower().rstrip('.') in person_prefixes:
+            if i < len(words) - 1 and word.lower().rstrip('.') in self.matchers.person_prefixes:
                 potential_name = words[i+1]
                 if len(potential_name) > 1 and potential_name[0].isupper():
                     entities['PERSON'] = [f"{word} {potential_name}"]
                     break
         
-        # Organization extraction - detect capital words followed by common org suffixes
-        org_suffixes = ['ministry', 'department', 'office', 'agency', 'authority', 'center', 'commission']
-        for suffix in org_suffixes:
-            pattern = re.compile(r'\b([A-Z][a-z]+ )+' + suffix + r'\b', re.IGNORECASE)
-            matches = pattern.findall(text)
+        # Organization extraction - capital words followed by a suffix that occurs in the text.
+        # Case-insensitive regex matching differs from lower() for some non-ASCII letters,
+        # so those texts try every suffix.
+        if text.isascii():
+            present_suffixes = {value for _, _, _, (lexicon, value) in hits if lexicon == 'org'}
+        else:
+            present_suffixes = self.matchers.org_patterns.keys()
+        for suffix in self.matchers.org_suffixes:
+            if suffix not in present_suffixes:
+                continue
+            matches = self.matchers.org_patterns[suffix].findall(text)
             if matches:
                 entities['ORG'] = matches
                 break
         
         # Date extraction - simple pattern for dates
-        date_patterns = [
-            r'\b\d{1,2}/\d{1,2}/\d{2,4}\b',  # DD/MM/YYYY or MM/DD/YYYY
-            r'\b\d{1,2}-\d{1,2}-\d{2,4}\b',  # DD-MM-YYYY or MM-DD-YYYY
-            r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]* \d{1,2}(?:st|nd|rd|th)?,? \d{4}\b'  # Month DD, YYYY
-        ]
-        
         date_matches = []
-        for pattern in date_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            date_matches.extend(matches)
+        for pattern in DATE_PATTERNS:
+            date_matches.extend(pattern.findall(text))
         
         if date_matches:
             entities['DATE'] = date_matches
             
         return entities
     
-    def process_message(self, message_id):
-        """Process a message using OpenAI to extract intent and entities"""
+    def analyze(self, text):
+        """Language, intent and entities of a message text, memoized on its normalized form"""
+        return self.analyze_many([text])[0]
+    
+    def analyze_many(self, texts):
+        """analyze() for a batch of texts; intents of uncached texts are scored together"""
+        model = self.intent_model()
+        normalized_texts = [normalize_text(text) for text in texts]
+        results = [self.cache.get(normalized) for normalized in normalized_texts]
+        
+        # Score each distinct uncached text once
+        pending = list(dict.fromkeys(
+            normalized for normalized, result in zip(normalized_texts, results) if result is None
+        ))
+        computed = {}
+        for normalized, intent in zip(pending, self.detect_intents(pending, model=model) if pending else []):
+            # One keyword scan feeds both language detection and entity extraction
+            hits = self.keyword_hits(normalized)
+            language = self.detect_language(normalized, hits=hits)
+            computed[normalized] = {
+                'language': language,
+                'intent': intent,
+                'entities': self.extract_entities(normalized, language, hits=hits)
+            }
+            self.cache.set(normalized, computed[normalized])
+        
+        return [
+            result if result is not None else copy.deepcopy(computed[normalized])
+            for normalized, result in zip(normalized_texts, results)
+        ]
+    
+    def stats(self):
+        """Counters for the NLP result cache, lexicon and intent model"""
+        model = self.intent_model()
+        lexicon = configured_lexicon(self.app.config) if self.app else get_lexicon()
+        return {
+            'lexicon_version': self.lexicon_version,
+            'lexicon': lexicon.stats(),
+            'cache': self.cache.stats(),
+            'intent_model': model.stats() if model else None
+        }
+    
+    def process_message(self, message_id, analysis=None):
+        """Process a message using OpenAI to extract intent and entities
+        
+        Pass analysis when analyze() already ran elsewhere, e.g. in an executor
+        worker, to only store its result.
+        """
         import openai
         try:
             # Get the message from the database
@@ -186,14 +367,13 @@ class NLPService:
                 logger.error(f"Message with ID {message_id} not found")
                 return None
             
-            # Detect language if not already set
-            language = message.language or self.detect_language(message.content)
+            # Detect language, intent and entities, reusing results for repeated texts
+            result = analysis or self.analyze(message.content)
             
-            # Detect intent
-            intent = self.detect_intent(message.content)
-            
-            # Extract entities
-            entities = self.extract_entities(message.content, language)
+            # Keep the language if already set
+            language = message.language or result['language']
+            intent = result['intent']
+            entities = result['entities']
             
             # Update the message with NLP results
             message.intent = intent
@@ -215,6 +395,79 @@ class NLPService:
             logger.error(f"Error processing message: {e}")
             return None
     
+    def process_messages(self, ids=None, query=None, chunk_size=1000, redetect_language=False):
+        """Annotate many messages with intent, entities and language, one transaction per chunk.
+        
+        Pass ids, or a Message query to filter on (all messages by default).
+        Rows are read in id order with keyset pagination, so memory stays flat
+        and each chunk costs one SELECT and one bulk UPDATE. Messages keep an
+        existing language unless redetect_language is set. Returns counters
+        and throughput.
+        """
+        started = time.perf_counter()
+        processed = failed_chunks = 0
+        last_id = None
+        
+        for chunk in self._message_chunks(ids, query, chunk_size):
+            updates = []
+            results = self.analyze_many([content or '' for _, content, _ in chunk])
+            for (message_id, content, language), result in zip(chunk, results):
+                updates.append({
+                    'id': message_id,
+                    'intent': result['intent'],
+                    'entities': json.dumps(result['entities']),
+                    'language': result['language'] if redetect_language else (language or result['language'])
+                })
+            
+            try:
+                db.session.execute(update(Message), updates)
+                db.session.commit()
+                processed += len(updates)
+            except Exception as e:
+                db.session.rollback()
+                failed_chunks += 1
+                logger.error(f"Error annotating messages {updates[0]['id']}-{updates[-1]['id']}: {e}")
+            
+            last_id = updates[-1]['id']
+            elapsed = time.perf_counter() - started
+            logger.info(f"Annotated {processed} messages up to id {last_id} ({processed / elapsed:.0f} msg/s)")
+        
+        elapsed = time.perf_counter() - started
+        return {
+            'processed': processed,
+            'failed_chunks': failed_chunks,
+            'last_id': last_id,
+            'seconds': round(elapsed, 3),
+            'messages_per_second': round(processed / elapsed, 1) if elapsed > 0 else 0.0,
+            'cache_hit_rate': self.cache.stats()['hit_rate']
+        }
+    
+    def _message_chunks(self, ids, query, chunk_size):
+        """Yield lists of (id, content, language) rows, in id order"""
+        columns = (Message.id, Message.content, Message.language)
+        
+        if ids is not None:
+            ids = sorted(set(ids))
+            for start in range(0, len(ids), chunk_size):
+                chunk = db.session.query(*columns).filter(
+                    Message.id.in_(ids[start:start + chunk_size])
+                ).order_by(Message.id).all()
+                if chunk:
+                    yield chunk
+            return
+        
+        query = query if query is not None else Message.query
+        last_id = None
+        while True:
+            page = query.with_entities(*columns)
+            if last_id is not None:
+                page = page.filter(Message.id > last_id)
+            chunk = page.order_by(Message.id).limit(chunk_size).all()
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1][0]
+    
     def get_service_type_from_entities(self, entities):
         """Extract service type from entities dictionary"""
         if not entities or 'SERVICE_TYPE' not in entities:
@@ -0,0 +1,195 @@
+import os
+import time
+import logging
+import threading
+import itertools
+from collections import deque
+from services.http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+class AfricasTalkingGateway:
+    """Africa's Talking SMS and Voice REST client on the shared pooled HTTP client.
+
+    Speaks the same API as the SDK's SMS.send and Voice.call, but keeps
+    connections alive between calls instead of opening one per request.
+    Sends are POSTs and are never retried, so a timeout cannot turn into a
+    duplicate SMS.
+    """
+
+    name = 'africastalking'
+
+    def __init__(self, username, api_key, timeout=None):
+        if not username or not api_key:
+            raise ValueError("AT_USERNAME and AT_API_KEY are required")
+        self.username = username
+        self.api_key = api_key
+        self.timeout = timeout
+        sandbox = username == 'sandbox'
+        self.api_url = 'https://api.sandbox.africastalking.com' if sandbox else 'https://api.africastalking.com'
+        self.voice_url = 'https://voice.sandbox.africastalking.com' if sandbox else 'https://voice.africastalking.com'
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.get('AT_USERNAME'), config.get('AT_API_KEY'), timeout=config.get('AT_TIMEOUT_SECONDS'))
+
+    def _post(self, url, upstream, data):
+        response = http_client.post(
+            url, upstream=upstream, timeout=self.timeout, data=data,
+            headers={'apiKey': self.api_key, 'Accept': 'application/json'}
+        )
+        if response.status_code >= 400:
+            raise RuntimeError(f"{upstream} returned {response.status_code}: {response.text[:200]}")
+        return response.json()
+
+    def send(self, message, recipients, sender_id=None):
+        """Send one body to many recipients; returns the SMSMessageData response"""
+        data = {'username': self.username, 'to': ','.join(recipients), 'message': message}
+        if sender_id:
+            data['from'] = sender_id
+        return self._post(f"{self.api_url}/version1/messaging", 'africastalking_sms', data)
+
+    def call(self, call_from, call_to, callback_url=None):
+        """Start outbound calls; returns the response with one entry per number"""
+        data = {'username': self.username, 'from': call_from, 'to': ','.join(call_to)}
+        if callback_url:
+            data['callbackUrl'] = callback_url
+        return self._post(f"{self.voice_url}/call", 'africastalking_voice', data)
+
+    def health_check(self):
+        """Account lookup: proves the credentials work and the API is reachable"""
+        response = http_client.get(
+            f"{self.api_url}/version1/user", upstream='africastalking_user', timeout=self.timeout,
+            params={'username': self.username},
+            headers={'apiKey': self.api_key, 'Accept': 'application/json'}
+        )
+        if response.status_code >= 400:
+            raise RuntimeError(f"africastalking returned {response.status_code}")
+        return {'balance': response.json().get('UserData', {}).get('balance')}
+
+class FakeGateway:
+    """Local stand-in for the provider in tests and load tests: accepts everything, sends nothing"""
+
+    name = 'fake'
+
+    def __init__(self, latency_ms=0, keep=1000):
+        self.latency = latency_ms / 1000
+        self.sent = deque(maxlen=keep)
+        self.calls = deque(maxlen=keep)
+        self._ids = itertools.count(1)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(latency_ms=config.get('FAKE_GATEWAY_LATENCY_MS', 0))
+
+    def send(self, message, recipients, sender_id=None):
+        if self.latency:
+            time.sleep(self.latency)
+        self.sent.append((message, list(recipients), sender_id))
+        return {'SMSMessageData': {
+            'Message': f"Sent to {len(recipients)}/{len(recipients)}",
+            'Recipients': [
+                {'number': number, 'status': 'Success', 'statusCode': 101, 'messageId': f"fake-{next(self._ids)}"}
+                for number in recipients
+            ]
+        }}
+
+    def call(self, call_from, call_to, callback_url=None):
+        if self.latency:
+            time.sleep(self.latency)
+        self.calls.append((call_from, list(call_to), callback_url))
+        return {'entries': [{'phoneNumber': number, 'status': 'Queued'} for number in call_to], 'errorMessage': 'None'}
+
+    def health_check(self):
+        return {'sent': len(self.sent), 'calls': len(self.calls)}
+
+PROVIDERS = {
+    AfricasTalkingGateway.name: AfricasTalkingGateway,
+    FakeGateway.name: FakeGateway
+}
+
+class ProviderRegistry:
+    """Process-wide messaging provider clients.
+
+    Each provider is built once per process on first use and shared by every
+    service and task; a forked gunicorn or Celery worker builds its own
+    instead of inheriting the parent's. install() puts a ready client, such
+    as a FakeGateway, in place of the configured one.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.default = 'africastalking'
+        self.health_ttl = 30
+        self._clients = {}
+        self._installed = {}
+        self._health = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize with Flask app context"""
+        self.app = app
+        self.default = app.config.get('SMS_PROVIDER', self.default)
+        self.health_ttl = app.config.get('PROVIDER_HEALTH_TTL_SECONDS', self.health_ttl)
+
+    def install(self, client, name=None):
+        """Use client for name (default: the configured provider) in this and any forked process"""
+        with self._lock:
+            self._installed[name or self.default] = client
+            self._health.pop(name or self.default, None)
+
+    def get(self, name=None):
+        """The shared client for a provider, or None if it cannot be built"""
+        name = name or self.default
+        with self._lock:
+            if self._pid != os.getpid():
+                self._clients = {}
+                self._health = {}
+                self._pid = os.getpid()
+            if name in self._installed:
+                return self._installed[name]
+            if name not in self._clients:
+                self._clients[name] = self._build(name)
+            return self._clients[name]
+
+    def _build(self, name):
+        try:
+            client = PROVIDERS[name].from_config(self.app.config if self.app else {})
+            logger.info(f"Initialized {name} messaging client")
+            return client
+        except Exception as e:
+            logger.error(f"Failed to initialize {name} messaging client: {e}")
+            return None
+
+    def health(self, name=None):
+        """Provider reachability, cached for health_ttl seconds so probes do not hammer the API"""
+        name = name or self.default
+        cached = self._health.get(name)
+        if cached and time.monotonic() - cached[0] < self.health_ttl:
+            return cached[1]
+
+        client = self.get(name)
+        started = time.perf_counter()
+        if client is None:
+            result = {'provider': name, 'ok': False, 'error': 'client not initialized'}
+        else:
+            try:
+                result = {'provider': name, 'ok': True, 'detail': client.health_check()}
+            except Exception as e:
+                result = {'provider': name, 'ok': False, 'error': str(e)}
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        self._health[name] = (time.monotonic(), result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            built = sorted(name for name, client in self._clients.items() if client is not None)
+            installed = sorted(self._installed)
+        return {'default': self.default, 'built': built, 'installed': installed, 'pid': self._pid}
+
+# Shared by every service and task in the process
+provider_registry = ProviderRegistry()
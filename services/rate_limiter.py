@@ -0,0 +1,189 @@
+import os
+import time
+import struct
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('local', 'file', 'redis')
+
+# Bucket file layout: tokens left and the time they were counted
+BUCKET = struct.Struct('<dd')
+
+# Refill and take tokens atomically; returns the seconds to wait, 0 when the tokens were taken
+REDIS_ACQUIRE = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local wanted = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= wanted then
+    tokens = tokens - wanted
+else
+    wait = (wanted - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+return tostring(wait)
+"""
+
+def refill(tokens, updated, now, rate, burst, wanted):
+    """(tokens left, seconds to wait) after refilling a bucket and trying to take wanted tokens"""
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= wanted:
+        return tokens - wanted, 0.0
+    return tokens, (wanted - tokens) / rate
+
+def parse_limits(value):
+    """{key: (per_second, burst)} from 'key=per_second/burst,...'"""
+    if isinstance(value, dict):
+        return value
+    limits = {}
+    for item in (value or '').split(','):
+        key, _, limit = item.strip().partition('=')
+        if key and limit:
+            per_second, _, burst = limit.partition('/')
+            limits[key] = _positive(key, float(per_second), float(burst or per_second))
+    return limits
+
+def _positive(key, per_second, burst):
+    """(per_second, burst) if both are positive; a zero rate would never refill"""
+    if per_second <= 0 or burst <= 0:
+        raise ValueError(f"SMS rate limit of {key} must be positive, got {per_second}/{burst}")
+    return per_second, burst
+
+class LocalBuckets:
+    """Buckets held by this process only"""
+
+    def __init__(self):
+        self._state = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key, rate, burst, wanted):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._state.get(key, (burst, now))
+            tokens, wait = refill(tokens, updated, now, rate, burst, wanted)
+            self._state[key] = (tokens, now)
+        return wait
+
+class FileBuckets:
+    """Buckets in small files under flock, shared by every worker process on the host"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def acquire(self, key, rate, burst, wanted):
+        import fcntl
+
+        path = os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + '.bucket')
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            now = time.time()
+            data = os.pread(fd, BUCKET.size, 0)
+            tokens, updated = BUCKET.unpack(data) if len(data) == BUCKET.size else (burst, now)
+            tokens, wait = refill(tokens, updated, now, rate, burst, wanted)
+            os.pwrite(fd, BUCKET.pack(tokens, now), 0)
+            return wait
+        finally:
+            os.close(fd)
+
+class RedisBuckets:
+    """Buckets in Redis, shared by every worker on every host"""
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(REDIS_ACQUIRE)
+
+    def acquire(self, key, rate, burst, wanted):
+        return float(self.script(keys=[f"sms-rate:{key}"], args=[rate, burst, time.time(), wanted]))
+
+class TokenBucketLimiter:
+    """Token buckets per sender (sender ID or shortcode) with shared state.
+
+    acquire() takes tokens if the bucket has them and otherwise returns how
+    long to wait; it never sleeps, so the caller decides what to do in the
+    meantime. If the shared backend fails, the process falls back to its own
+    buckets rather than stop sending.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.backend = 'local'
+        self.per_second = 10.0
+        self.burst = 50.0
+        self.limits = {}
+        self.buckets = LocalBuckets()
+        self.counters = {'granted': 0, 'throttled': 0, 'backend_errors': 0}
+        self._lock = threading.Lock()
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize with Flask app context"""
+        self.app = app
+        self.per_second, self.burst = _positive(
+            'default',
+            float(app.config.get('SMS_RATE_LIMIT_PER_SECOND', self.per_second)),
+            float(app.config.get('SMS_RATE_LIMIT_BURST', self.burst))
+        )
+        self.limits = parse_limits(app.config.get('SMS_RATE_LIMITS'))
+        self.backend = app.config.get('SMS_RATE_LIMIT_BACKEND', self.backend)
+
+        try:
+            if self.backend == 'redis':
+                self.buckets = RedisBuckets(app.config.get('SMS_RATE_LIMIT_URL') or app.config['CELERY_BROKER_URL'])
+            elif self.backend == 'file':
+                self.buckets = FileBuckets(app.config.get('SMS_RATE_LIMIT_DIR', 'instance/sms_rate_limits'))
+            elif self.backend != 'local':
+                raise ValueError(f"unknown backend {self.backend}")
+        except Exception as e:
+            logger.error(f"SMS rate limiter backend {self.backend} unavailable, using per-process buckets: {e}")
+            self.backend = 'local'
+            self.buckets = LocalBuckets()
+
+    def limit(self, key):
+        """(per_second, burst) of a sender"""
+        return self.limits.get(key, (self.per_second, self.burst))
+
+    def acquire(self, key, tokens=1):
+        """Take tokens from a sender's bucket; returns 0.0 when taken, else the seconds until they could be"""
+        per_second, burst = self.limit(key)
+        # A request larger than the bucket could never be granted
+        tokens = min(tokens, burst)
+        try:
+            wait = self.buckets.acquire(key, per_second, burst, tokens)
+        except Exception as e:
+            logger.error(f"SMS rate limiter backend failed, using per-process buckets: {e}")
+            with self._lock:
+                self.counters['backend_errors'] += 1
+            self.backend = 'local'
+            self.buckets = LocalBuckets()
+            wait = self.buckets.acquire(key, per_second, burst, tokens)
+
+        with self._lock:
+            self.counters['granted' if wait <= 0 else 'throttled'] += 1
+        return max(0.0, wait)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            'backend': self.backend,
+            'default_limit': {'per_second': self.per_second, 'burst': self.burst},
+            'limits': {key: {'per_second': rate, 'burst': burst} for key, (rate, burst) in self.limits.items()},
+            'counters': counters
+        }
+
+# Shared by every sender in the process
+sms_rate_limiter = TokenBucketLimiter()
@@ -0,0 +1,463 @@
+import math
+import heapq
+import logging
+import xml.etree.ElementTree as ET
+import numpy as np
+from utils import EARTH_RADIUS_KM
+
+logger = logging.getLogger(__name__)
+
+# Travel speeds in km/h; highway types missing from CAR_SPEEDS_KMH are closed to cars
+FOOT_SPEED_KMH = 5.0
+CAR_SPEEDS_KMH = {
+    'motorway': 90, 'motorway_link': 50,
+    'trunk': 80, 'trunk_link': 40,
+    'primary': 60, 'primary_link': 40,
+    'secondary': 50, 'secondary_link': 35,
+    'tertiary': 40, 'tertiary_link': 30,
+    'unclassified': 30, 'residential': 25,
+    'living_street': 10, 'service': 15, 'track': 15, 'road': 25
+}
+FOOT_ONLY_HIGHWAYS = {'footway', 'path', 'pedestrian', 'steps', 'cycleway', 'bridleway'}
+FOOT_EXCLUDED_HIGHWAYS = {'motorway', 'motorway_link'}
+
+# Instruction signs, matching the GraphHopper response format
+SIGN_SHARP_LEFT = -3
+SIGN_LEFT = -2
+SIGN_SLIGHT_LEFT = -1
+SIGN_CONTINUE = 0
+SIGN_SLIGHT_RIGHT = 1
+SIGN_RIGHT = 2
+SIGN_SHARP_RIGHT = 3
+SIGN_FINISH = 4
+
+SIGN_TEXT = {
+    SIGN_SHARP_LEFT: "Turn sharp left",
+    SIGN_LEFT: "Turn left",
+    SIGN_SLIGHT_LEFT: "Turn slight left",
+    SIGN_CONTINUE: "Continue",
+    SIGN_SLIGHT_RIGHT: "Turn slight right",
+    SIGN_RIGHT: "Turn right",
+    SIGN_SHARP_RIGHT: "Turn sharp right"
+}
+
+PROFILES = ('foot', 'car')
+
+# Grid used to snap coordinates onto the nearest routable node
+SNAP_CELL_DEGREES = 0.005
+
+def _bearing(lat1, lng1, lat2, lng2):
+    """Initial compass bearing in degrees from point 1 to point 2"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_lambda = math.radians(lng2 - lng1)
+    x = math.sin(d_lambda) * math.cos(phi2)
+    y = math.cos(phi1) * math.sin(phi2) - math.sin(phi1) * math.cos(phi2) * math.cos(d_lambda)
+    return math.degrees(math.atan2(x, y)) % 360
+
+def _turn_sign(angle):
+    """Map a signed turn angle (positive = right) to an instruction sign"""
+    magnitude = abs(angle)
+    if magnitude < 25:
+        return SIGN_CONTINUE
+    if magnitude < 60:
+        sign = SIGN_SLIGHT_RIGHT
+    elif magnitude < 130:
+        sign = SIGN_RIGHT
+    else:
+        sign = SIGN_SHARP_RIGHT
+    return sign if angle > 0 else -sign
+
+class RoadGraph:
+    """Compact array-backed road network (CSR adjacency) with A* routing.
+
+    Nodes are stored as float64 coordinate arrays. Directed edges are grouped
+    by source node: the edges leaving node u are targets[indptr[u]:indptr[u + 1]],
+    with parallel arrays for length, foot access, car speed and street name.
+    """
+
+    def __init__(self, node_lat, node_lng, indptr, targets, length_m, foot, car_speed, name_id, names):
+        self.node_lat = np.ascontiguousarray(node_lat, dtype=np.float64)
+        self.node_lng = np.ascontiguousarray(node_lng, dtype=np.float64)
+        self.indptr = np.ascontiguousarray(indptr, dtype=np.int64)
+        self.targets = np.ascontiguousarray(targets, dtype=np.int32)
+        self.length_m = np.ascontiguousarray(length_m, dtype=np.float32)
+        self.foot = np.ascontiguousarray(foot, dtype=np.bool_)
+        self.car_speed = np.ascontiguousarray(car_speed, dtype=np.float32)
+        self.name_id = np.ascontiguousarray(name_id, dtype=np.int32)
+        self.names = list(names)
+
+        self._profiles = {}
+        self._snap_grids = {}
+        self._lat_list = None
+        self._lng_list = None
+
+    @property
+    def node_count(self):
+        return self.node_lat.shape[0]
+
+    @property
+    def edge_count(self):
+        return self.targets.shape[0]
+
+    @classmethod
+    def from_edges(cls, node_lat, node_lng, sources, targets, foot, car_speed, name_id, names):
+        """Build the CSR layout from an unordered directed edge list"""
+        node_lat = np.asarray(node_lat, dtype=np.float64)
+        node_lng = np.asarray(node_lng, dtype=np.float64)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+
+        # Edge lengths use the same haversine as the A* heuristic, which keeps it admissible
+        lat1 = np.radians(node_lat[sources])
+        lat2 = np.radians(node_lat[targets])
+        d_lng = np.radians(node_lng[targets] - node_lng[sources])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(d_lng / 2) ** 2
+        length_m = 2 * EARTH_RADIUS_KM * 1000 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        order = np.argsort(sources, kind='stable')
+        counts = np.bincount(sources, minlength=node_lat.shape[0])
+        indptr = np.concatenate(([0], np.cumsum(counts)))
+
+        return cls(
+            node_lat, node_lng, indptr,
+            targets[order], length_m[order],
+            np.asarray(foot, dtype=np.bool_)[order],
+            np.asarray(car_speed, dtype=np.float32)[order],
+            np.asarray(name_id, dtype=np.int32)[order],
+            names
+        )
+
+    @classmethod
+    def from_osm_xml(cls, path):
+        """Build a graph from an OpenStreetMap XML extract (.osm)"""
+        coords = {}
+        ways = []
+        for _, element in ET.iterparse(path, events=('end',)):
+            if element.tag == 'node':
+                coords[int(element.get('id'))] = (float(element.get('lat')), float(element.get('lon')))
+                element.clear()
+            elif element.tag == 'way':
+                tags = {tag.get('k'): tag.get('v') for tag in element.findall('tag')}
+                highway = tags.get('highway')
+                if highway in CAR_SPEEDS_KMH or highway in FOOT_ONLY_HIGHWAYS:
+                    refs = [int(nd.get('ref')) for nd in element.findall('nd')]
+                    ways.append((refs, tags))
+                element.clear()
+
+        node_ids = {}
+        node_lat = []
+        node_lng = []
+        names = []
+        name_ids = {}
+        sources, targets, foot, car_speed, name_id = [], [], [], [], []
+
+        def node_index(osm_id):
+            index = node_ids.get(osm_id)
+            if index is None:
+                index = node_ids[osm_id] = len(node_lat)
+                lat, lng = coords[osm_id]
+                node_lat.append(lat)
+                node_lng.append(lng)
+            return index
+
+        for refs, tags in ways:
+            refs = [ref for ref in refs if ref in coords]
+            if len(refs) < 2:
+                continue
+
+            highway = tags['highway']
+            name = tags.get('name') or tags.get('ref') or ''
+            if name not in name_ids:
+                name_ids[name] = len(names)
+                names.append(name)
+
+            walkable = highway not in FOOT_EXCLUDED_HIGHWAYS and tags.get('foot') != 'no'
+            speed = float(CAR_SPEEDS_KMH.get(highway, 0))
+            if tags.get('motor_vehicle') == 'no' or tags.get('access') == 'no':
+                speed = 0.0
+            oneway = tags.get('oneway') in ('yes', '1', 'true') or highway in ('motorway', 'motorway_link')
+
+            for u_ref, v_ref in zip(refs, refs[1:]):
+                u = node_index(u_ref)
+                v = node_index(v_ref)
+                # Walking ignores oneway restrictions; driving honors them
+                for a, b, backward in ((u, v, False), (v, u, True)):
+                    sources.append(a)
+                    targets.append(b)
+                    foot.append(walkable)
+                    car_speed.append(0.0 if (backward and oneway) else speed)
+                    name_id.append(name_ids[name])
+
+        logger.info(f"Parsed {len(node_lat)} routable nodes and {len(sources)} directed edges from {path}")
+        return cls.from_edges(node_lat, node_lng, sources, targets, foot, car_speed, name_id, names)
+
+    def save(self, path):
+        """Write the graph as an uncompressed .npz archive"""
+        names_blob = np.frombuffer('\n'.join(self.names).encode('utf-8'), dtype=np.uint8)
+        np.savez(
+            path,
+            node_lat=self.node_lat, node_lng=self.node_lng,
+            indptr=self.indptr, targets=self.targets, length_m=self.length_m,
+            foot=self.foot, car_speed=self.car_speed, name_id=self.name_id,
+            names=names_blob
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            names = bytes(data['names']).decode('utf-8').split('\n')
+            return cls(
+                data['node_lat'], data['node_lng'], data['indptr'], data['targets'],
+                data['length_m'], data['foot'], data['car_speed'], data['name_id'], names
+            )
+
+    def _profile(self, profile):
+        """Per-profile edge weights (seconds) as Python lists for the search loop"""
+        prepared = self._profiles.get(profile)
+        if prepared is not None:
+            return prepared
+
+        if profile == 'foot':
+            seconds = np.where(self.foot, self.length_m / (FOOT_SPEED_KMH / 3.6), np.inf)
+            max_speed_mps = FOOT_SPEED_KMH / 3.6
+        elif profile == 'car':
+            with np.errstate(divide='ignore'):
+                seconds = np.where(self.car_speed > 0, self.length_m / (self.car_speed / 3.6), np.inf)
+            max_speed_mps = float(self.car_speed.max(initial=1.0)) / 3.6
+        else:
+            raise ValueError(f"Unknown routing profile: {profile}")
+
+        if self._lat_list is None:
+            self._lat_list = self.node_lat.tolist()
+            self._lng_list = self.node_lng.tolist()
+
+        prepared = {
+            'indptr': self.indptr.tolist(),
+            'targets': self.targets.tolist(),
+            'seconds': seconds.tolist(),
+            'max_speed_mps': max_speed_mps,
+            'usable': np.isfinite(seconds)
+        }
+        self._profiles[profile] = prepared
+        return prepared
+
+    def _snap_grid(self, profile):
+        """Sorted cell keys of nodes with at least one usable edge for the profile"""
+        grid = self._snap_grids.get(profile)
+        if grid is not None:
+            return grid
+
+        usable = self._profile(profile)['usable']
+        sources = np.repeat(np.arange(self.node_count), np.diff(self.indptr))
+        nodes = np.unique(sources[usable])
+
+        keys = self._cell_keys(
+            np.floor(self.node_lat[nodes] / SNAP_CELL_DEGREES).astype(np.int64),
+            np.floor(self.node_lng[nodes] / SNAP_CELL_DEGREES).astype(np.int64)
+        )
+        order = np.argsort(keys, kind='stable')
+        grid = (keys[order], nodes[order])
+        self._snap_grids[profile] = grid
+        return grid
+
+    def _cell_keys(self, i, j):
+        return (i + (1 << 20)) * (1 << 21) + (j + (1 << 20))
+
+    def snap(self, latitude, longitude, profile='foot', max_distance_m=1000):
+        """Nearest node reachable by the profile, as (node, distance_m), or None"""
+        keys, nodes = self._snap_grid(profile)
+        if nodes.shape[0] == 0:
+            return None
+
+        ci = math.floor(latitude / SNAP_CELL_DEGREES)
+        cj = math.floor(longitude / SNAP_CELL_DEGREES)
+        cell_m = SNAP_CELL_DEGREES * math.radians(1) * EARTH_RADIUS_KM * 1000 * math.cos(math.radians(latitude))
+        max_ring = int(math.ceil(max_distance_m / max(cell_m, 1.0))) + 1
+
+        best = None
+        for r in range(max_ring + 1):
+            ring_i, ring_j = [], []
+            for di in range(-r, r + 1):
+                for dj in range(-r, r + 1):
+                    if max(abs(di), abs(dj)) == r:
+                        ring_i.append(ci + di)
+                        ring_j.append(cj + dj)
+
+            ring_keys = self._cell_keys(np.array(ring_i, dtype=np.int64), np.array(ring_j, dtype=np.int64))
+            lo = np.searchsorted(keys, ring_keys, side='left')
+            hi = np.searchsorted(keys, ring_keys, side='right')
+            candidates = [nodes[start:stop] for start, stop in zip(lo, hi) if stop > start]
+            if candidates:
+                candidates = np.concatenate(candidates)
+                phi = np.radians(self.node_lat[candidates])
+                phi0 = math.radians(latitude)
+                a = np.sin((phi - phi0) / 2) ** 2 + math.cos(phi0) * np.cos(phi) * np.sin(np.radians(self.node_lng[candidates] - longitude) / 2) ** 2
+                distances = 2 * EARTH_RADIUS_KM * 1000 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+                nearest = int(np.argmin(distances))
+                if best is None or distances[nearest] < best[1]:
+                    best = (int(candidates[nearest]), float(distances[nearest]))
+
+            # Anything in the next ring is at least r full cells away
+            if best is not None and best[1] <= r * cell_m:
+                break
+
+        if best is None or best[1] > max_distance_m:
+            return None
+        return best
+
+    def shortest_path(self, source, target, profile='foot'):
+        """A* search; returns (nodes, edges, seconds) or None when unreachable"""
+        prepared = self._profile(profile)
+        indptr = prepared['indptr']
+        targets = prepared['targets']
+        seconds = prepared['seconds']
+        inv_speed = 1.0 / prepared['max_speed_mps']
+        lat = self._lat_list
+        lng = self._lng_list
+
+        target_lat = lat[target]
+        target_lng = lng[target]
+        target_phi = math.radians(target_lat)
+        cos_target = math.cos(target_phi)
+        earth_m = 2 * EARTH_RADIUS_KM * 1000
+
+        def heuristic(node):
+            phi = math.radians(lat[node])
+            a = math.sin((target_phi - phi) / 2) ** 2 + math.cos(phi) * cos_target * math.sin(math.radians(target_lng - lng[node]) / 2) ** 2
+            return earth_m * math.asin(min(1.0, math.sqrt(a))) * inv_speed
+
+        best = {source: 0.0}
+        parent_edge = {source: -1}
+        heap = [(heuristic(source), 0.0, source)]
+        settled = set()
+
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if node in settled:
+                continue
+            settled.add(node)
+
+            for edge in range(indptr[node], indptr[node + 1]):
+                weight = seconds[edge]
+                if weight == math.inf:
+                    continue
+                neighbor = targets[edge]
+                new_cost = cost + weight
+                if new_cost < best.get(neighbor, math.inf):
+                    best[neighbor] = new_cost
+                    parent_edge[neighbor] = edge
+                    heapq.heappush(heap, (new_cost + heuristic(neighbor), new_cost, neighbor))
+        else:
+            return None
+
+        if target not in best:
+            return None
+
+        # Walk parent edges back to the source; an edge's source is found through indptr
+        edges = []
+        nodes = [target]
+        node = target
+        while node != source:
+            edge = parent_edge[node]
+            edges.append(edge)
+            node = int(np.searchsorted(self.indptr, edge, side='right') - 1)
+            nodes.append(node)
+        edges.reverse()
+        nodes.reverse()
+        return nodes, edges, best[target]
+
+    def travel_times(self, source, profile='foot', max_seconds=math.inf):
+        """Dijkstra from one node; returns a float64 array of seconds per node (inf when unreached)"""
+        prepared = self._profile(profile)
+        indptr = prepared['indptr']
+        targets = prepared['targets']
+        seconds = prepared['seconds']
+
+        best = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = set()
+        while heap:
+            cost, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+
+            for edge in range(indptr[node], indptr[node + 1]):
+                new_cost = cost + seconds[edge]
+                if new_cost > max_seconds:
+                    continue
+                neighbor = targets[edge]
+                if new_cost < best.get(neighbor, math.inf):
+                    best[neighbor] = new_cost
+                    heapq.heappush(heap, (new_cost, neighbor))
+
+        result = np.full(self.node_count, np.inf)
+        result[np.fromiter(best.keys(), dtype=np.int64, count=len(best))] = np.fromiter(best.values(), dtype=np.float64, count=len(best))
+        return result
+
+    def route(self, from_lat, from_lng, to_lat, to_lng, profile='foot', max_snap_m=1000):
+        """Route between two coordinates in the {distance, time, instructions} format"""
+        start = self.snap(from_lat, from_lng, profile, max_snap_m)
+        end = self.snap(to_lat, to_lng, profile, max_snap_m)
+        if start is None or end is None:
+            return None
+
+        result = self.shortest_path(start[0], end[0], profile)
+        if result is None:
+            return None
+        nodes, edges, _ = result
+
+        # The legs to and from the snapped nodes are walked in a straight line
+        speed_mps = FOOT_SPEED_KMH / 3.6
+        instructions = self._instructions(nodes, edges, profile)
+        first = instructions[0]
+        last = instructions[-2] if len(instructions) > 1 else first
+        first['distance'] += start[1]
+        first['time'] += int(start[1] / speed_mps * 1000)
+        last['distance'] += end[1]
+        last['time'] += int(end[1] / speed_mps * 1000)
+
+        for instruction in instructions:
+            instruction['distance'] = round(instruction['distance'], 1)
+
+        return {
+            'distance': round(sum(instruction['distance'] for instruction in instructions), 1),
+            'time': sum(instruction['time'] for instruction in instructions),
+            'instructions': instructions
+        }
+
+    def _instructions(self, nodes, edges, profile):
+        """Group path edges into turn-by-turn instructions"""
+        seconds = self._profile(profile)['seconds']
+        lat = self._lat_list
+        lng = self._lng_list
+
+        instructions = []
+        current = None
+        current_name = None
+        previous_bearing = None
+        for i, edge in enumerate(edges):
+            u, v = nodes[i], nodes[i + 1]
+            bearing = _bearing(lat[u], lng[u], lat[v], lng[v])
+            name = self.names[self.name_id[edge]] if self.name_id[edge] >= 0 else ''
+
+            sign = SIGN_CONTINUE
+            if previous_bearing is not None:
+                sign = _turn_sign((bearing - previous_bearing + 540) % 360 - 180)
+
+            # Bends along the same street are not worth an instruction; real turns are
+            if current is None or name != current_name or abs(sign) >= SIGN_RIGHT:
+                text = SIGN_TEXT[sign] + (f" onto {name}" if name else "")
+                current = {'text': text, 'distance': 0.0, 'time': 0, 'sign': sign}
+                current_name = name
+                instructions.append(current)
+
+            current['distance'] += float(self.length_m[edge])
+            current['time'] += int(seconds[edge] * 1000)
+            previous_bearing = bearing
+
+        instructions.append({'text': "Arrive at destination", 'distance': 0.0, 'time': 0, 'sign': SIGN_FINISH})
+        return instructions
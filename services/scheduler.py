@@ -1,12 +1,18 @@
 import logging
 from datetime import datetime, timedelta
 from celery import shared_task
-from app import db, create_app
+from flask import current_app
+from app import db, task_app_context
 from models import UserInteraction, User, Conversation, Message
 from services.sms_service import SMSService
+from services.sms_queue import FOLLOW_UP
+from services.lexicon import current_lexicon
 
 logger = logging.getLogger(__name__)
 
+# Shared by the scheduler and follow-up tasks in this process
+sms_service = SMSService()
+
 class SchedulerService:
     """Service for scheduling follow-up messages and tasks"""
     
@@ -20,7 +26,9 @@ class SchedulerService:
     def init_app(self, app):
         """Initialize with Flask app context"""
         self.app = app
-        self.sms_service = SMSService(app)
+        if not sms_service.app:
+            sms_service.init_app(app)
+        self.sms_service = sms_service
     
     def schedule_follow_up(self, interaction_id, delay_hours=24):
         """Schedule a follow-up SMS for a user interaction"""
@@ -69,7 +77,7 @@ class SchedulerService:
             
             # Update the interaction status based on the response
             lowercase_text = message_text.lower()
-            if any(word in lowercase_text for word in ['yes', 'yego', 'completed', 'done', 'received']):
+            if any(word in lowercase_text for word, _ in current_lexicon().terms('confirm')):
                 interaction.status = 'completed'
             else:
                 interaction.status = 'issue_reported'
@@ -87,9 +95,7 @@ class SchedulerService:
 @shared_task
 def send_follow_up_task(interaction_id):
     """Celery task to send a follow-up SMS"""
-    app = create_app()
-    
-    with app.app_context():
+    with task_app_context():
         try:
             # Get the interaction
             interaction = UserInteraction.query.get(interaction_id)
@@ -115,47 +121,36 @@ def send_follow_up_task(interaction_id):
             else:  # Kinyarwanda
                 message = f"Mwaramutse Tugendane! Wabonye service wari gushaka kuri {service.name}? Subiza YEGO cyangwa OYA."
             
-            # Initialize SMS service
-            sms_service = SMSService(app)
+            if not sms_service.app:
+                sms_service.init_app(current_app)
             
-            # Send the follow-up SMS
-            success, response = sms_service.send_sms(user.phone_number, message)
+            # Continue the user's active conversation, or open one for the follow-up
+            conversation = Conversation.query.filter_by(
+                user_id=user.id,
+                status='active'
+            ).order_by(Conversation.last_message_at.desc()).first()
             
-            if success:
-                # Update the interaction
-                interaction.follow_up_sent = True
-                interaction.follow_up_sent_at = datetime.utcnow()
-                
-                # Create a new conversation for the follow-up if needed
-                conversation = Conversation.query.filter_by(
+            if not conversation:
+                conversation = Conversation(
                     user_id=user.id,
-                    status='active'
-                ).order_by(Conversation.last_message_at.desc()).first()
-                
-                if not conversation:
-                    conversation = Conversation(
-                        user_id=user.id,
-                        channel='sms',
-                        status='active',
-                        current_state='follow_up'
-                    )
-                    db.session.add(conversation)
-                    db.session.flush()
-                
-                # Record the message
-                message_record = Message(
-                    conversation_id=conversation.id,
-                    sender_type='system',
-                    message_type='sms',
-                    content=message
+                    channel='sms',
+                    status='active',
+                    current_state='follow_up'
                 )
-                db.session.add(message_record)
+                db.session.add(conversation)
+                db.session.flush()
+            
+            # Record and queue the follow-up behind live replies; identical follow-ups share provider calls
+            if sms_service.send_response(user, conversation, message, lane=FOLLOW_UP):
+                interaction.follow_up_sent = True
+                interaction.follow_up_sent_at = datetime.utcnow()
                 db.session.commit()
                 
-                logger.info(f"Sent follow-up SMS for interaction {interaction_id}")
+                logger.info(f"Queued follow-up SMS for interaction {interaction_id}")
                 return True
             else:
-                logger.error(f"Failed to send follow-up SMS: {response}")
+                db.session.rollback()
+                logger.error(f"Failed to send follow-up SMS for interaction {interaction_id}")
                 return False
                 
         except Exception as e:
@@ -0,0 +1,208 @@
+import re
+import logging
+import threading
+import unicodedata
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+GSM_7 = 'GSM-7'
+UCS_2 = 'UCS-2'
+
+# GSM 03.38 default alphabet (one septet each) and extension table (escape + septet)
+GSM_BASIC = frozenset(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM_EXTENSION = frozenset("^{}\\[~]|€\f")
+
+# Units per segment: a single SMS, and each part of a concatenated one after its header
+SEGMENT_UNITS = {GSM_7: (160, 153), UCS_2: (70, 67)}
+
+# Look-alikes that would otherwise switch a whole message to UCS-2
+TRANSLITERATIONS = str.maketrans({
+    '‘': "'", '’': "'", '‚': "'", 'ʼ': "'", 'ʻ': "'", '`': "'", '´': "'",
+    '“': '"', '”': '"', '„': '"', '«': '"', '»': '"',
+    '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '−': '-',
+    '•': '-', '·': '-',
+    '…': '...',
+    '\u00a0': ' ', '\u2009': ' ', '\u202f': ' ', '\t': ' ',
+    '\u200b': '', '\ufeff': ''
+})
+
+# Applied only to messages over budget, longest first so 'minutes' is not cut to 'min' + 'utes'
+ABBREVIATIONS = [
+    (re.compile(r'\b' + re.escape(word) + r'\b'), short) for word, short in [
+        ('approximately', 'approx.'), ('government', 'govt'), ('kilometres', 'km'), ('kilometers', 'km'),
+        ('Telefone', 'Tel'), ('Address', 'Addr'), ('minutes', 'min'), ('Phone', 'Tel'), ('Hours', 'Hrs')
+    ]
+]
+
+ComposedSMS = namedtuple('ComposedSMS', ['text', 'encoding', 'segments', 'units', 'transliterated'])
+
+def encoding_of(text):
+    """GSM-7 if every character is in the GSM alphabet, else UCS-2"""
+    for char in text:
+        if char not in GSM_BASIC and char not in GSM_EXTENSION:
+            return UCS_2
+    return GSM_7
+
+def _units(text, encoding):
+    if encoding == GSM_7:
+        return [2 if char in GSM_EXTENSION else 1 for char in text]
+    # UTF-16 code units: characters outside the BMP take a surrogate pair
+    return [2 if ord(char) > 0xFFFF else 1 for char in text]
+
+def segment_count(text, encoding=None):
+    """(encoding, segments, units) of text as the network will send it.
+
+    Concatenated parts lose room to their header, and an escaped GSM
+    character or a surrogate pair is never split across two parts.
+    """
+    encoding = encoding or encoding_of(text)
+    units = _units(text, encoding)
+    total = sum(units)
+    single, multi = SEGMENT_UNITS[encoding]
+    if total <= single:
+        return encoding, 1 if text else 0, total
+
+    segments, used = 1, 0
+    for size in units:
+        if used + size > multi:
+            segments += 1
+            used = 0
+        used += size
+    return encoding, segments, total
+
+def transliterate(text):
+    """Replace characters outside the GSM alphabet with GSM look-alikes where one exists"""
+    text = text.translate(TRANSLITERATIONS)
+    if encoding_of(text) == GSM_7:
+        return text
+
+    # Accented letters the alphabet lacks lose their accent; anything else (other scripts, emoji) stays
+    chars = []
+    for char in text:
+        if char not in GSM_BASIC and char not in GSM_EXTENSION:
+            stripped = ''.join(c for c in unicodedata.normalize('NFKD', char) if not unicodedata.combining(c))
+            if stripped and all(c in GSM_BASIC for c in stripped):
+                char = stripped
+        chars.append(char)
+    return ''.join(chars)
+
+def abbreviate(text):
+    for pattern, short in ABBREVIATIONS:
+        text = pattern.sub(short, text)
+    return text
+
+def compact(text):
+    """Drop blank lines and repeated spaces"""
+    text = re.sub(r'[ ]{2,}', ' ', text)
+    text = re.sub(r' *\n[ \n]*', '\n', text)
+    return text.strip()
+
+class SMSComposer:
+    """Encoding-aware SMS text: counts segments before a message is sent.
+
+    Text is transliterated to GSM-7 where a look-alike exists, so one smart
+    quote does not turn a 3-part message into an 8-part UCS-2 one. A message
+    over max_segments is abbreviated, then compacted; fit() additionally
+    drops list items from the end until the message fits. Content is never
+    truncated: a message that still does not fit goes out as is and is
+    counted as over budget.
+    """
+
+    def __init__(self, app=None):
+        self.app = app
+        self.max_segments = 3
+        self.transliterate = True
+        self.counters = {
+            'messages': 0, 'segments': 0, GSM_7: 0, UCS_2: 0,
+            'transliterated': 0, 'shortened': 0, 'items_dropped': 0, 'over_budget': 0
+        }
+        self._lock = threading.Lock()
+
+        if app:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Initialize with Flask app context"""
+        self.app = app
+        self.max_segments = app.config.get('SMS_MAX_SEGMENTS', self.max_segments)
+        self.transliterate = app.config.get('SMS_TRANSLITERATE', self.transliterate)
+
+    def _candidates(self, text):
+        """Successively shorter renderings of text"""
+        yield text
+        shorter = abbreviate(text)
+        if shorter != text:
+            yield shorter
+        compacted = compact(shorter)
+        if compacted != shorter:
+            yield compacted
+
+    def _measure(self, text, max_segments):
+        """The first rendering of text within max_segments, or the shortest one; and whether it was shortened"""
+        transliterated = False
+        if self.transliterate:
+            converted = transliterate(text)
+            transliterated = converted != text
+            text = converted
+
+        composed = None
+        for i, candidate in enumerate(self._candidates(text)):
+            composed = ComposedSMS(candidate, *segment_count(candidate), transliterated)
+            if composed.segments <= max_segments:
+                break
+        return composed, i > 0
+
+    def compose(self, text, max_segments=None):
+        """The cheapest rendering of text, as a ComposedSMS"""
+        composed, shortened = self._measure(text, max_segments or self.max_segments)
+        self._count(composed, max_segments or self.max_segments, shortened=shortened)
+        return composed
+
+    def fit(self, header, items, footer='', max_segments=None, min_items=1, separator='\n'):
+        """Compose header, as many leading items as fit within max_segments, and footer.
+
+        header may be a function of the number of items included, for
+        headers that state it. Returns (ComposedSMS, number of items
+        included); never fewer than min_items even when they do not fit.
+        """
+        max_segments = max_segments or self.max_segments
+        items = list(items)
+        count = len(items)
+        while True:
+            text = separator.join([header(count) if callable(header) else header] + items[:count] + ([footer] if footer else []))
+            composed, shortened = self._measure(text, max_segments)
+            if composed.segments <= max_segments or count <= min(min_items, len(items)):
+                break
+            count -= 1
+
+        self._count(composed, max_segments, shortened=shortened, items_dropped=len(items) - count)
+        return composed, count
+
+    def _count(self, composed, max_segments, shortened=False, items_dropped=0):
+        if composed.segments > max_segments:
+            logger.warning(f"SMS needs {composed.segments} {composed.encoding} segments, over the budget of {max_segments}")
+        with self._lock:
+            self.counters['messages'] += 1
+            self.counters['segments'] += composed.segments
+            self.counters[composed.encoding] += 1
+            self.counters['transliterated'] += composed.transliterated
+            self.counters['shortened'] += shortened
+            self.counters['items_dropped'] += items_dropped
+            self.counters['over_budget'] += composed.segments > max_segments
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            'max_segments': self.max_segments,
+            'transliterate': self.transliterate,
+            'counters': counters,
+            'segments_per_message': round(counters['segments'] / counters['messages'], 2) if counters['messages'] else None
+        }
+
+# Shared by every SMSService in the process
+sms_composer = SMSComposer()
@@ -0,0 +1,106 @@
+import logging
+from datetime import datetime
+from celery import shared_task
+from flask import current_app
+from app import db, task_app_context
+from models import Message, Conversation, User
+
+logger = logging.getLogger(__name__)
+
+# Marks a message whose NLP failed, so later tasks do not process it again
+NLP_FAILED_INTENT = 'nlp_error'
+
+def _conversation_lock(conversation_id):
+    """Redis lock serializing the pipeline for one conversation, or None if Redis is unavailable"""
+    try:
+        import redis
+        client = redis.Redis.from_url(
+            current_app.config.get('SMS_PIPELINE_LOCK_URL') or current_app.config['CELERY_BROKER_URL']
+        )
+        return client.lock(
+            f"sms-pipeline:conversation:{conversation_id}",
+            timeout=current_app.config.get('SMS_PIPELINE_LOCK_TIMEOUT_SECONDS', 120),
+            blocking_timeout=current_app.config.get('SMS_PIPELINE_LOCK_WAIT_SECONDS', 10)
+        )
+    except Exception as e:
+        logger.warning(f"Conversation lock unavailable, processing without it: {e}")
+        return None
+
+def mark_answered(message):
+    """Record that an inbound message got its reply, so the pipeline does not answer it again"""
+    message.answered_at = datetime.utcnow()
+    db.session.commit()
+
+def enqueue_incoming_sms(message):
+    """Queue an inbound message for NLP and reply; returns False if the broker rejected it"""
+    try:
+        # Fail fast instead of holding the webhook while the broker reconnects
+        process_incoming_sms_task.apply_async(args=[message.id], retry=False)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to queue message {message.id}: {e}")
+        return False
+
+@shared_task(bind=True, acks_late=True, max_retries=30)
+def process_incoming_sms_task(self, message_id):
+    """Run NLP, intent dispatch and the reply for an inbound SMS.
+
+    Each task takes its conversation's lock and answers every unanswered user
+    message up to and including its own, oldest first, whether or not NLP
+    already ran on it. A task that runs before an earlier one therefore
+    answers both in order, and the earlier task finds nothing left to do.
+    A message whose reply failed stays unanswered for the next task.
+    """
+    with task_app_context():
+        message = db.session.get(Message, message_id)
+        if not message:
+            logger.error(f"Message with ID {message_id} not found")
+            return False
+
+        lock = _conversation_lock(message.conversation_id)
+        try:
+            acquired = lock.acquire() if lock is not None else True
+        except Exception as e:
+            logger.warning(f"Conversation lock failed, processing without it: {e}")
+            lock, acquired = None, True
+        if not acquired:
+            # Another worker is answering this conversation; come back once it is done
+            raise self.retry(countdown=current_app.config.get('SMS_PIPELINE_RETRY_SECONDS', 2))
+
+        try:
+            pending = Message.query.filter(
+                Message.conversation_id == message.conversation_id,
+                Message.sender_type == 'user',
+                Message.answered_at.is_(None),
+                Message.id <= message_id
+            ).order_by(Message.id).all()
+
+            for pending_message in pending:
+                _process(pending_message)
+            return True
+        finally:
+            if lock is not None:
+                try:
+                    lock.release()
+                except Exception as e:
+                    logger.warning(f"Failed to release conversation lock: {e}")
+
+def _process(message):
+    """NLP and reply for one message, as the webhook does in inline mode"""
+    from routes.api import initialize_services, nlp_service, process_user_intent
+
+    initialize_services()
+    conversation = db.session.get(Conversation, message.conversation_id)
+    user = db.session.get(User, conversation.user_id)
+
+    nlp_result = nlp_service.process_message(message.id)
+    if nlp_result is None:
+        message.intent = NLP_FAILED_INTENT
+        db.session.commit()
+
+    try:
+        process_user_intent(user, conversation, message, nlp_result)
+        mark_answered(message)
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error replying to message {message.id}: {e}")
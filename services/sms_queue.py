@@ -0,0 +1,332 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from sqlalchemy import update
+from app import db
+from models import Message
+from services.http_client import UpstreamMetrics
+from services.rate_limiter import sms_rate_limiter
+from services.providers import provider_registry
+
+logger = logging.getLogger(__name__)
+
+# Message.delivery_status values
+QUEUED = 'queued'
+SENT = 'sent'
+FAILED = 'failed'
+
+# Lanes in strict priority order: a lane only sends while every higher lane has nothing ready
+INTERACTIVE = 'interactive'
+FOLLOW_UP = 'follow_up'
+BULK = 'bulk'
+LANES = (INTERACTIVE, FOLLOW_UP, BULK)
+
+class _Group:
+    """Pending sends of one message body in one lane"""
+
+    __slots__ = ('lane', 'body', 'entries', 'queued_at')
+
+    def __init__(self, lane, body, entries=None):
+        self.lane = lane
+        self.body = body
+        self.entries = entries if entries is not None else []
+        self.queued_at = time.monotonic()
+
+def parse_send_response(response, recipients):
+    """{number: (success, status, provider message id)} from an Africa's Talking send response"""
+    results = {}
+    entries = []
+    if response and 'SMSMessageData' in response:
+        entries = response['SMSMessageData'].get('Recipients') or []
+    for entry in entries:
+        results[entry.get('number')] = (entry.get('status') == 'Success', entry.get('status'), entry.get('messageId'))
+
+    # A single recipient's number may come back normalized differently from how it was sent
+    if len(recipients) == 1 and len(entries) == 1 and recipients[0] not in results:
+        results[recipients[0]] = next(iter(results.values()))
+    return results
+
+class OutboundSMSQueue:
+    """Coalesces outbound SMS into multi-recipient provider calls, within rate limits.
+
+    Sends are grouped by lane and body. A group is ready as soon as it
+    reaches max_recipients, and every group is ready once the oldest pending
+    send has waited max_delay seconds, so each provider call carries every
+    recipient of one body queued in that window. A flusher thread sends
+    ready groups in strict lane priority, taking one token per recipient
+    from the sending sender's bucket first; while a sender is throttled its
+    lanes wait and a reply queued meanwhile goes out before older bulk
+    sends. Per-recipient statuses are written back to the Message rows in
+    one bulk update and returned through each send's future. When
+    disabled, sends go out one by one in the caller.
+    """
+
+    def __init__(self, app=None, client=None):
+        self.app = app
+        self.client = None
+        self.enabled = True
+        self.max_recipients = 100
+        self.max_delay = 0.25
+        self.senders = {}
+        self.limiter = sms_rate_limiter
+        self.latency = UpstreamMetrics()
+        self.wait_times = {lane: UpstreamMetrics() for lane in LANES}
+        self.counters = {
+            'queued': 0, 'sent': 0, 'failed': 0, 'provider_calls': 0,
+            'size_flushes': 0, 'time_flushes': 0, 'throttled': 0, 'errors': 0, 'flusher_restarts': 0
+        }
+        self._groups = {}
+        self._ready = {lane: deque() for lane in LANES}
+        self._throttled_until = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+        if app:
+            self.init_app(app, client)
+
+    def init_app(self, app, client=None):
+        """Initialize with Flask app context; client defaults to the registry's provider"""
+        # The flusher thread records statuses outside any request, where current_app is unbound
+        self.app = app._get_current_object() if hasattr(app, '_get_current_object') else app
+        self.client = client
+        self.enabled = app.config.get('SMS_QUEUE_ENABLED', self.enabled)
+        self.max_recipients = app.config.get('SMS_QUEUE_MAX_RECIPIENTS', self.max_recipients)
+        self.max_delay = app.config.get('SMS_QUEUE_MAX_DELAY_MS', self.max_delay * 1000) / 1000
+        self.senders = app.config.get('SMS_LANE_SENDERS') or {}
+        if not self.limiter.app:
+            self.limiter.init_app(app)
+        atexit.register(self.flush)
+
+    def _sender_key(self, lane):
+        """Rate-limit bucket of a lane: its sender ID or shortcode, or the account default"""
+        return self.senders.get(lane) or 'default'
+
+    def submit(self, recipient, body, message_id=None, lane=INTERACTIVE):
+        """Queue one SMS; the future resolves to (success, status) once the provider answers"""
+        if lane not in LANES:
+            raise ValueError(f"Unknown SMS lane {lane}")
+        future = Future()
+        entry = (recipient, message_id, future, time.monotonic())
+        if not self.enabled:
+            self._send_now(lane, body, [entry])
+            return future
+
+        with self._cond:
+            self._ensure_flusher()
+            self.counters['queued'] += 1
+            group = self._groups.get((lane, body))
+            if group is None:
+                group = self._groups[(lane, body)] = _Group(lane, body)
+            group.entries.append(entry)
+
+            # A full group is ready now instead of waiting for the window to close
+            if len(group.entries) >= self.max_recipients:
+                self.counters['size_flushes'] += 1
+                self._ready[lane].append(self._groups.pop((lane, body)))
+            self._cond.notify()
+        return future
+
+    def _ensure_flusher(self):
+        """Start the flusher thread, or restart it if it died; threads and pending sends do not survive a fork"""
+        if self._pid != os.getpid():
+            self._groups = {}
+            self._ready = {lane: deque() for lane in LANES}
+            self._throttled_until = {}
+            self._pid = os.getpid()
+            self._thread = None
+        if self._thread is None or not self._thread.is_alive():
+            if self._thread is not None:
+                logger.error("SMS queue flusher thread died; restarting it")
+                self.counters['flusher_restarts'] += 1
+            self._thread = threading.Thread(target=self._run, name='sms-queue', daemon=True)
+            self._thread.start()
+
+    def _chunk_size(self, lane):
+        return max(1, int(min(self.max_recipients, self.limiter.limit(self._sender_key(lane))[1])))
+
+    def _next_batch(self, now):
+        """Pop (lane, body, entries) for the next provider call, or return the seconds to wait for one"""
+        if self._groups:
+            oldest = min(group.queued_at for group in self._groups.values())
+            if now >= oldest + self.max_delay:
+                self.counters['time_flushes'] += 1
+                for group in self._groups.values():
+                    self._ready[group.lane].append(group)
+                self._groups = {}
+
+        timeout = None
+        for lane in LANES:
+            ready = self._ready[lane]
+            if not ready:
+                continue
+            throttled_until = self._throttled_until.get(self._sender_key(lane), 0)
+            if throttled_until > now:
+                wait = throttled_until - now
+                timeout = wait if timeout is None else min(timeout, wait)
+                continue
+
+            group = ready[0]
+            size = self._chunk_size(lane)
+            entries, group.entries = group.entries[:size], group.entries[size:]
+            if not group.entries:
+                ready.popleft()
+            return lane, group.body, entries
+
+        if self._groups:
+            remaining = oldest + self.max_delay - now
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def _run(self):
+        while True:
+            with self._cond:
+                batch = self._next_batch(time.monotonic())
+                while not isinstance(batch, tuple):
+                    self._cond.wait(batch)
+                    batch = self._next_batch(time.monotonic())
+            lane, body, entries = batch
+            try:
+                self._flush_batch(lane, body, entries)
+            except Exception as e:
+                # One bad batch must not stop the thread every later send depends on
+                logger.error(f"Failed to send a batch of {len(entries)} SMS: {e}")
+                with self._cond:
+                    self.counters['errors'] += 1
+                for _, _, future, _ in entries:
+                    if not future.done():
+                        future.set_result((False, str(e)))
+
+    def _flush_batch(self, lane, body, entries):
+        numbers = list(dict.fromkeys(recipient for recipient, _, _, _ in entries))
+        sender_key = self._sender_key(lane)
+        wait = self.limiter.acquire(sender_key, len(numbers))
+        if wait > 0:
+            # Put the batch back and check again once a token has dripped in, by which
+            # time a higher lane may have something ready
+            per_second = self.limiter.limit(sender_key)[0]
+            with self._cond:
+                self.counters['throttled'] += 1
+                self._ready[lane].appendleft(_Group(lane, body, entries))
+                self._throttled_until[sender_key] = time.monotonic() + (min(wait, 1 / per_second) if per_second > 0 else wait)
+            return
+
+        self._send(lane, body, entries)
+
+    def _send_now(self, lane, body, entries):
+        """Send in the calling thread, sleeping while the sender is throttled"""
+        sender_key = self._sender_key(lane)
+        wait = self.limiter.acquire(sender_key, len(entries))
+        while wait > 0:
+            with self._cond:
+                self.counters['throttled'] += 1
+            time.sleep(wait)
+            wait = self.limiter.acquire(sender_key, len(entries))
+        self._send(lane, body, entries)
+
+    def flush(self):
+        """Send everything pending now, in the calling thread and ignoring rate limits.
+
+        Runs at interpreter exit and, in Celery workers, when a pool process
+        shuts down, where atexit handlers do not run.
+        """
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            ready = [group for lane in LANES for group in self._ready[lane]] + list(self._groups.values())
+            self._ready, self._groups = {lane: deque() for lane in LANES}, {}
+        for group in ready:
+            self._send(group.lane, group.body, group.entries)
+
+    def _send(self, lane, body, entries):
+        """One provider call per max_recipients distinct numbers, then record every entry's result"""
+        started = time.monotonic()
+        for _, _, _, queued_at in entries:
+            self.wait_times[lane].record((started - queued_at) * 1000)
+
+        numbers = list(dict.fromkeys(recipient for recipient, _, _, _ in entries))
+        results = {}
+        for start in range(0, len(numbers), self.max_recipients):
+            chunk = numbers[start:start + self.max_recipients]
+            results.update(self._call(body, chunk, self.senders.get(lane)))
+
+        updates = []
+        for recipient, message_id, future, _ in entries:
+            success, status, provider_message_id = results.get(recipient, (False, "No status for recipient", None))
+            if message_id is not None:
+                updates.append({
+                    'id': message_id,
+                    'delivery_status': SENT if success else FAILED,
+                    'provider_message_id': provider_message_id
+                })
+            future.set_result((success, status))
+
+        sent = sum(1 for _, _, future, _ in entries if future.result()[0])
+        with self._cond:
+            self.counters['sent'] += sent
+            self.counters['failed'] += len(entries) - sent
+        if sent < len(entries):
+            logger.error(f"Failed to send {len(entries) - sent} of {len(entries)} SMS")
+        self._record(updates)
+
+    def _call(self, body, numbers, sender_id=None):
+        client = self.client or provider_registry.get()
+        if not client:
+            logger.error("SMS client not initialized")
+            return {number: (False, "SMS client not initialized", None) for number in numbers}
+
+        started = time.perf_counter()
+        try:
+            if sender_id:
+                response = client.send(body, numbers, sender_id=sender_id)
+            else:
+                response = client.send(body, numbers)
+            logger.info(f"SMS sent to {len(numbers)} recipients: {response}")
+            return parse_send_response(response, numbers)
+        except Exception as e:
+            logger.error(f"Error sending SMS to {len(numbers)} recipients: {e}")
+            return {number: (False, str(e), None) for number in numbers}
+        finally:
+            self.latency.record((time.perf_counter() - started) * 1000)
+            with self._cond:
+                self.counters['provider_calls'] += 1
+
+    def _record(self, updates):
+        """Store delivery statuses on their Message rows"""
+        if not updates:
+            return
+        if self.app is None:
+            logger.error(f"Cannot record delivery status of {len(updates)} messages: queue has no app")
+            return
+        try:
+            with self.app.app_context():
+                db.session.execute(update(Message), updates)
+                db.session.commit()
+        except Exception as e:
+            logger.error(f"Failed to record delivery status of {len(updates)} messages: {e}")
+
+    def stats(self):
+        with self._cond:
+            counters = dict(self.counters)
+            depth = {lane: sum(len(group.entries) for group in self._ready[lane]) for lane in LANES}
+            for group in self._groups.values():
+                depth[group.lane] += len(group.entries)
+        sent = counters['sent'] + counters['failed']
+        return {
+            'enabled': self.enabled,
+            'pending': sum(depth.values()),
+            'lanes': {
+                lane: {'depth': depth[lane], 'wait': self.wait_times[lane].snapshot()} for lane in LANES
+            },
+            'counters': counters,
+            'messages_per_call': round(sent / counters['provider_calls'], 2) if counters['provider_calls'] else None,
+            'latency': self.latency.snapshot(),
+            'rate_limit': self.limiter.stats()
+        }
+
+# Shared by every SMSService in the process, so concurrent replies coalesce
+sms_queue = OutboundSMSQueue()
@@ -1,8 +1,10 @@
 import logging
-import africastalking
 from flask import current_app
 from app import db
 from models import User, Conversation, Message
+from services.sms_queue import sms_queue, QUEUED, INTERACTIVE
+from services.sms_composer import sms_composer, ComposedSMS
+from services.providers import provider_registry
 
 logger = logging.getLogger(__name__)
 
@@ -11,7 +13,6 @@ class SMSService:
     
     def __init__(self, app=None):
         self.app = app
-        self.sms = None
         
         if app:
             self.init_app(app)
@@ -20,17 +21,20 @@ class SMSService:
         """Initialize with Flask app context"""
         self.app = app
         
-        # Initialize Africa's Talking SDK
-        username = app.config.get('AT_USERNAME')
-        api_key = app.config.get('AT_API_KEY')
-        
-        try:
-            africastalking.initialize(username, api_key)
-            self.sms = africastalking.SMS
-            logger.info("Africa's Talking SMS client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Africa's Talking SMS client: {e}")
-            self.sms = None
+        # The provider client, outbound queue and composer are shared by every SMSService in the process
+        if not provider_registry.app:
+            provider_registry.init_app(app)
+        if not sms_queue.app:
+            sms_queue.init_app(app)
+        if not sms_composer.app:
+            sms_composer.init_app(app)
+        if self.sms:
+            logger.info(f"SMS service initialized with the {provider_registry.default} client")
+    
+    @property
+    def sms(self):
+        """The process's shared SMS client, or None if it could not be initialized"""
+        return provider_registry.get() if self.app else None
     
     def send_sms(self, recipient, message):
         """Send SMS to a single recipient"""
@@ -59,7 +63,7 @@ class SMSService:
             logger.error(f"Error sending SMS: {e}")
             return False, str(e)
     
-    def handle_incoming_sms(self, sender, message_text, session_id=None):
+    def handle_incoming_sms(self, sender, message_text, session_id=None, provider_message_id=None):
         """Process incoming SMS message"""
         try:
             # Find or create user
@@ -93,7 +97,8 @@ class SMSService:
                 conversation_id=conversation.id,
                 sender_type='user',
                 message_type='sms',
-                content=message_text
+                content=message_text,
+                provider_message_id=provider_message_id
             )
             db.session.add(message)
             
@@ -111,26 +116,46 @@ class SMSService:
             logger.error(f"Error handling incoming SMS: {e}")
             return None, None, None
     
-    def send_response(self, user, conversation, response_text):
-        """Send response SMS and record it in the database"""
-        success, message = self.send_sms(user.phone_number, response_text)
+    def send_response(self, user, conversation, response_text, lane=INTERACTIVE):
+        """Record a response SMS and queue it for sending in a priority lane.
+        
+        response_text is composed to fit the segment budget unless it is
+        already a ComposedSMS, e.g. from sms_composer.fit(); the message
+        records the text actually sent and its segments. Returns True once
+        queued; the queue stores the provider's status on the message. With
+        the queue disabled the SMS is sent before returning and the result
+        of the send is returned.
+        """
+        if not self.sms:
+            logger.error("Failed to send response SMS: SMS client not initialized")
+            return False
+        
+        composed = response_text if isinstance(response_text, ComposedSMS) else sms_composer.compose(response_text)
+        
+        # Record the response first so its delivery status has a row to land on
+        response_message = Message(
+            conversation_id=conversation.id,
+            sender_type='system',
+            message_type='sms',
+            content=composed.text,
+            delivery_status=QUEUED,
+            segment_count=composed.segments,
+            encoding=composed.encoding
+        )
+        db.session.add(response_message)
+        
+        # Update conversation last activity time
+        conversation.last_message_at = db.func.now()
+        db.session.commit()
+        
+        future = sms_queue.submit(user.phone_number, composed.text, message_id=response_message.id, lane=lane)
+        if not future.done():
+            logger.info(f"Response SMS to {user.phone_number} recorded and queued")
+            return True
         
+        success, status = future.result()
         if success:
-            # Record the response in the database
-            response_message = Message(
-                conversation_id=conversation.id,
-                sender_type='system',
-                message_type='sms',
-                content=response_text
-            )
-            db.session.add(response_message)
-            
-            # Update conversation last activity time
-            conversation.last_message_at = db.func.now()
-            db.session.commit()
-            
             logger.info(f"Response SMS sent to {user.phone_number} and recorded")
-            return True
         else:
-            logger.error(f"Failed to send response SMS: {message}")
-            return False
+            logger.error(f"Failed to send response SMS: {status}")
+        return success
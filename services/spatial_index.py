@@ -0,0 +1,214 @@
+import math
+import time
+import logging
+from collections import defaultdict
+import numpy as np
+from utils import EARTH_RADIUS_KM
+from services.distance import HaversineEngine
+
+logger = logging.getLogger(__name__)
+
+# Above this many candidate rows, batch lookups use the grid instead of a full distance matrix
+BRUTE_FORCE_MAX_ROWS = 2048
+
+class SpatialIndex:
+    """In-memory grid index over service coordinates for k-nearest and radius queries"""
+
+    def __init__(self, cell_degrees=0.01):
+        self.cell_degrees = cell_degrees
+        self.built_at = None
+        self.stale = True
+
+        # All query state lives in one dict so a rebuild can swap it atomically
+        self._state = self._empty_state()
+
+    def _empty_state(self):
+        return {
+            'rows': [],
+            'engine': HaversineEngine(),
+            'grids': {None: {}},
+            'category_rows': {None: np.empty(0, dtype=np.intp)},
+            'max_abs_lat': 0.0
+        }
+
+    def __len__(self):
+        return len(self._state['rows'])
+
+    def _cell(self, latitude, longitude):
+        """Grid cell containing a coordinate"""
+        return (
+            math.floor(latitude / self.cell_degrees),
+            math.floor(longitude / self.cell_degrees)
+        )
+
+    def build(self, rows):
+        """Replace the indexed rows; each row is a dict with 'latitude', 'longitude' and 'category'"""
+        started = time.perf_counter()
+        state = self._empty_state()
+        latitudes = []
+        longitudes = []
+        grids = defaultdict(lambda: defaultdict(list))
+        category_rows = defaultdict(list)
+
+        for row in rows:
+            latitude = row.get('latitude')
+            longitude = row.get('longitude')
+            if latitude is None or longitude is None:
+                continue
+
+            position = len(state['rows'])
+            state['rows'].append(row)
+            latitudes.append(latitude)
+            longitudes.append(longitude)
+
+            cell = self._cell(latitude, longitude)
+            grids[None][cell].append(position)
+            grids[row.get('category')][cell].append(position)
+            category_rows[None].append(position)
+            category_rows[row.get('category')].append(position)
+
+        # Coordinates live in the engine's contiguous arrays; cells hold row positions
+        state['engine'] = HaversineEngine(latitudes, longitudes)
+        state['max_abs_lat'] = max((abs(latitude) for latitude in latitudes), default=0.0)
+        state['grids'] = {
+            category: {cell: np.array(positions, dtype=np.intp) for cell, positions in cells.items()}
+            for category, cells in grids.items()
+        }
+        state['grids'].setdefault(None, {})
+        state['category_rows'] = {
+            category: np.array(positions, dtype=np.intp) for category, positions in category_rows.items()
+        }
+        state['category_rows'].setdefault(None, np.empty(0, dtype=np.intp))
+
+        self._state = state
+        self.built_at = time.monotonic()
+        self.stale = False
+
+        logger.info(f"Built spatial index over {len(state['rows'])} services in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def invalidate(self):
+        """Mark the index for rebuilding on the next lookup"""
+        self.stale = True
+
+    def needs_rebuild(self, max_age_seconds=None):
+        """Whether the index is stale or older than max_age_seconds"""
+        if self.stale or self.built_at is None:
+            return True
+        if max_age_seconds:
+            return time.monotonic() - self.built_at > max_age_seconds
+        return False
+
+    def _ring(self, ci, cj, r):
+        """Cells on the square ring at Chebyshev distance r around (ci, cj)"""
+        if r == 0:
+            yield (ci, cj)
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield (ci - r, j)
+            yield (ci + r, j)
+        for i in range(ci - r + 1, ci + r):
+            yield (i, cj - r)
+            yield (i, cj + r)
+
+    def _ring_lower_bound_km(self, r, cos_max):
+        """Smallest possible distance to any point outside rings 0..r"""
+        half_angle = math.radians(r * self.cell_degrees) / 2
+        return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, cos_max * math.sin(half_angle)))
+
+    def _scan(self, latitude, longitude, category, max_km, k):
+        """Collect candidate (positions, distances) ring by ring until the result set is final"""
+        state = self._state
+        grid = state['grids'].get(category)
+        if not grid:
+            return state, np.empty(0, dtype=np.intp), np.empty(0)
+
+        engine = state['engine']
+
+        # Longitude spacing shrinks toward the poles, so bound it at the widest latitude involved
+        widest = min(90.0, max(state['max_abs_lat'], abs(latitude)) + self.cell_degrees)
+        cos_max = math.cos(math.radians(widest))
+
+        ci, cj = self._cell(latitude, longitude)
+        found_positions = []
+        found_distances = []
+        count = 0
+        r = 0
+        while True:
+            # Walking empty rings is wasteful once they outnumber the occupied cells
+            if 8 * r > len(grid):
+                positions = state['category_rows'][category]
+                distances = engine.distances(latitude, longitude, rows=positions)
+                found_positions = [positions]
+                found_distances = [distances]
+                break
+
+            ring = [grid[cell] for cell in self._ring(ci, cj, r) if cell in grid]
+            if ring:
+                positions = np.concatenate(ring) if len(ring) > 1 else ring[0]
+                found_positions.append(positions)
+                found_distances.append(engine.distances(latitude, longitude, rows=positions))
+                count += positions.shape[0]
+
+            bound = self._ring_lower_bound_km(r, cos_max)
+            if max_km is not None and bound > max_km:
+                break
+            if k is not None and count >= k:
+                distances = np.concatenate(found_distances)
+                if np.partition(distances, k - 1)[k - 1] <= bound:
+                    break
+            r += 1
+
+        positions = np.concatenate(found_positions) if found_positions else np.empty(0, dtype=np.intp)
+        distances = np.concatenate(found_distances) if found_distances else np.empty(0)
+        if max_km is not None:
+            within = distances <= max_km
+            positions = positions[within]
+            distances = distances[within]
+
+        if k is not None and k < distances.shape[0]:
+            nearest = np.argpartition(distances, k - 1)[:k]
+            positions = positions[nearest]
+            distances = distances[nearest]
+
+        order = np.argsort(distances, kind='stable')
+        return state, positions[order], distances[order]
+
+    def nearest(self, latitude, longitude, k=5, category=None, max_km=None):
+        """Return up to k (distance_km, row) pairs ordered by distance"""
+        if k <= 0:
+            return []
+        state, positions, distances = self._scan(latitude, longitude, category, max_km, k)
+        return [(float(distance), state['rows'][position]) for position, distance in zip(positions, distances)]
+
+    def within_radius(self, latitude, longitude, radius_km, category=None):
+        """Return every (distance_km, row) pair within radius_km ordered by distance"""
+        state, positions, distances = self._scan(latitude, longitude, category, radius_km, None)
+        return [(float(distance), state['rows'][position]) for position, distance in zip(positions, distances)]
+
+    def nearest_many(self, latitudes, longitudes, k=5, category=None, max_km=None):
+        """Nearest k rows for many origins.
+
+        Small catalogs are scored in one vectorized pass over all origins; past
+        BRUTE_FORCE_MAX_ROWS the per-origin grid scan touches far fewer rows.
+        Returns one list of (distance_km, row) pairs per origin.
+        """
+        state = self._state
+        rows = state['category_rows'].get(category)
+        if rows is None:
+            return [[] for _ in range(len(latitudes))]
+
+        if rows.shape[0] > BRUTE_FORCE_MAX_ROWS:
+            return [
+                self.nearest(latitude, longitude, k=k, category=category, max_km=max_km)
+                for latitude, longitude in zip(latitudes, longitudes)
+            ]
+
+        positions, distances = state['engine'].top_k(latitudes, longitudes, k, rows=rows, max_km=max_km)
+        results = []
+        for origin_positions, origin_distances in zip(positions, distances):
+            results.append([
+                (float(distance), state['rows'][position])
+                for position, distance in zip(origin_positions, origin_distances)
+                if position >= 0
+            ])
+        return results
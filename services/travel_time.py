@@ -0,0 +1,163 @@
+import os
+import math
+import time
+import struct
+import logging
+import numpy as np
+from services.road_graph import FOOT_SPEED_KMH
+
+logger = logging.getLogger(__name__)
+
+# File layout: fixed header, int64 service ids, then a row-major uint16 matrix
+# of minutes with one row per grid cell and one column per service
+MAGIC = b'TTMX'
+VERSION = 1
+HEADER = struct.Struct('<4sI8sdddIIId')
+MATRIX_ALIGNMENT = 64
+
+UNREACHABLE = 0xFFFF
+MAX_STORED_MINUTES = 0xFFFE
+
+# South, west, north, east
+RWANDA_BBOX = (-2.85, 28.85, -1.04, 30.90)
+
+def estimate_walking_minutes(distance_km, detour_factor=1.3):
+    """Walking minutes for a straight-line distance, inflated for road detours"""
+    return int(math.ceil(distance_km * detour_factor / FOOT_SPEED_KMH * 60))
+
+class TravelTimeMatrix:
+    """Read-only, memory-mapped travel minutes from grid cells to services.
+
+    A lookup is one row read: the cell containing the origin selects a row and
+    each service id selects a column. Rows are contiguous, so ranking every
+    service near a user touches a single page of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = HEADER.unpack(f.read(HEADER.size))
+        magic, version, profile, south, west, cell_degrees, n_lat, n_lng, n_services, built_at = header
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} travel-time matrix")
+
+        self.profile = profile.rstrip(b'\0').decode('ascii')
+        self.south = south
+        self.west = west
+        self.cell_degrees = cell_degrees
+        self.n_lat = n_lat
+        self.n_lng = n_lng
+        self.built_at = built_at
+
+        self.service_ids = np.memmap(path, dtype='<i8', mode='r', offset=HEADER.size, shape=(n_services,))
+        self.columns = {int(service_id): column for column, service_id in enumerate(self.service_ids)}
+        self.matrix = np.memmap(
+            path, dtype='<u2', mode='r',
+            offset=_matrix_offset(n_services),
+            shape=(n_lat * n_lng, n_services)
+        )
+
+    def __len__(self):
+        return len(self.columns)
+
+    def cell(self, latitude, longitude):
+        """Row index of the cell containing a coordinate, or None outside the grid"""
+        i = math.floor((latitude - self.south) / self.cell_degrees)
+        j = math.floor((longitude - self.west) / self.cell_degrees)
+        if 0 <= i < self.n_lat and 0 <= j < self.n_lng:
+            return i * self.n_lng + j
+        return None
+
+    def minutes(self, latitude, longitude, service_ids):
+        """Travel minutes to each service id; None where unknown or unreachable"""
+        row = self.cell(latitude, longitude)
+        if row is None:
+            return [None] * len(service_ids)
+
+        values = self.matrix[row]
+        result = []
+        for service_id in service_ids:
+            column = self.columns.get(service_id)
+            value = int(values[column]) if column is not None else UNREACHABLE
+            result.append(None if value == UNREACHABLE else value)
+        return result
+
+    def stats(self):
+        return {
+            'services': len(self.columns),
+            'cells': self.n_lat * self.n_lng,
+            'cell_degrees': self.cell_degrees,
+            'profile': self.profile,
+            'built_at': self.built_at
+        }
+
+    @classmethod
+    def build(cls, path, graph, services, bbox=RWANDA_BBOX, cell_degrees=0.01, profile='foot',
+              max_minutes=180, max_snap_m=2000):
+        """Compute the matrix for (id, latitude, longitude) services and write it to path.
+
+        Runs one bounded Dijkstra per service over the road graph. The file is
+        written next to path and renamed into place, so workers that already
+        mapped the previous build keep reading a consistent copy.
+        """
+        services = list(services)
+        if not services:
+            raise ValueError("No services to build travel times for")
+        south, west, north, east = bbox
+        n_lat = int(math.ceil((north - south) / cell_degrees))
+        n_lng = int(math.ceil((east - west) / cell_degrees))
+        speed_mps = FOOT_SPEED_KMH / 3.6
+        max_seconds = max_minutes * 60
+
+        # Snap every cell center to the road network once; the legs off the road are walked
+        cell_nodes = np.full(n_lat * n_lng, -1, dtype=np.int64)
+        cell_snap_s = np.zeros(n_lat * n_lng)
+        for i in range(n_lat):
+            lat = south + (i + 0.5) * cell_degrees
+            for j in range(n_lng):
+                snapped = graph.snap(lat, west + (j + 0.5) * cell_degrees, profile, max_snap_m)
+                if snapped is not None:
+                    cell_nodes[i * n_lng + j] = snapped[0]
+                    cell_snap_s[i * n_lng + j] = snapped[1] / speed_mps
+        covered = cell_nodes >= 0
+        logger.info(f"Snapped {int(covered.sum())} of {n_lat * n_lng} cells to the road network")
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(
+                MAGIC, VERSION, profile.encode('ascii'), south, west, cell_degrees,
+                n_lat, n_lng, len(services), time.time()
+            ))
+            f.write(np.asarray([service[0] for service in services], dtype='<i8').tobytes())
+            f.truncate(_matrix_offset(len(services)) + 2 * n_lat * n_lng * len(services))
+
+        matrix = np.memmap(tmp_path, dtype='<u2', mode='r+', offset=_matrix_offset(len(services)),
+                           shape=(n_lat * n_lng, len(services)))
+        started = time.perf_counter()
+        for column, (service_id, latitude, longitude) in enumerate(services):
+            minutes = np.full(n_lat * n_lng, UNREACHABLE, dtype=np.uint16)
+            snapped = graph.snap(latitude, longitude, profile, max_snap_m)
+            if snapped is not None:
+                # Walking ignores oneway restrictions, so times from the service equal times to it
+                node_seconds = graph.travel_times(snapped[0], profile, max_seconds)
+                seconds = node_seconds[cell_nodes[covered]] + cell_snap_s[covered] + snapped[1] / speed_mps
+                with np.errstate(invalid='ignore'):
+                    values = np.ceil(seconds / 60)
+                values[~(values <= min(max_minutes, MAX_STORED_MINUTES))] = UNREACHABLE
+                minutes[covered] = values.astype(np.uint16)
+            else:
+                logger.warning(f"Service {service_id} is more than {max_snap_m} m from the road network")
+            matrix[:, column] = minutes
+
+            if (column + 1) % 100 == 0:
+                logger.info(f"Computed travel times for {column + 1}/{len(services)} services")
+
+        matrix.flush()
+        del matrix
+        os.replace(tmp_path, path)
+        logger.info(f"Built travel-time matrix for {len(services)} services in {time.perf_counter() - started:.1f} s")
+        return cls(path)
+
+def _matrix_offset(n_services):
+    offset = HEADER.size + 8 * n_services
+    return (offset + MATRIX_ALIGNMENT - 1) // MATRIX_ALIGNMENT * MATRIX_ALIGNMENT
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+from services.map_clusters import ClusterIndex, project
+
+logger = logging.getLogger(__name__)
+
+EXTENT = 4096
+LAYER_NAME = 'services'
+
+# 64 x 64 cluster cells per tile, i.e. 64 extent units each
+TILE_CLUSTER_LEVELS = 6
+
+# Mapbox Vector Tile 2.1 protobuf field numbers
+TILE_LAYERS = 3
+LAYER_VERSION, LAYER_NAME_FIELD, LAYER_FEATURES, LAYER_KEYS, LAYER_VALUES, LAYER_EXTENT = 15, 1, 2, 3, 4, 5
+FEATURE_ID, FEATURE_TAGS, FEATURE_TYPE, FEATURE_GEOMETRY = 1, 2, 3, 4
+VALUE_STRING, VALUE_UINT = 1, 5
+GEOM_POINT = 1
+CMD_MOVE_TO_ONE = (1 << 3) | 1
+
+WIRE_VARINT = 0
+WIRE_BYTES = 2
+
+def _varint(value):
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+def _field(number, wire_type):
+    return _varint((number << 3) | wire_type)
+
+def _varint_field(number, value):
+    return _field(number, WIRE_VARINT) + _varint(value)
+
+def _bytes_field(number, payload):
+    return _field(number, WIRE_BYTES) + _varint(len(payload)) + payload
+
+def _packed_field(number, values):
+    return _bytes_field(number, b''.join(_varint(value) for value in values))
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+def encode_tile(features, z, x, y, layer_name=LAYER_NAME, extent=EXTENT):
+    """Encode cluster and service feature dicts as a single-layer MVT tile"""
+    keys = {}
+    values = {}
+
+    def tag(key, value):
+        key_index = keys.setdefault(key, len(keys))
+        value_index = values.setdefault(value, len(values))
+        return key_index, value_index
+
+    encoded_features = []
+    for feature in features:
+        px, py = project(feature['latitude'], feature['longitude'], z)
+        geometry = [CMD_MOVE_TO_ONE, _zigzag(int(round((float(px) - x) * extent))), _zigzag(int(round((float(py) - y) * extent)))]
+
+        tags = []
+        payload = b''
+        if feature['type'] == 'cluster':
+            tags.extend(tag('cluster', 'true'))
+            tags.extend(tag('point_count', feature['count']))
+        else:
+            payload += _varint_field(FEATURE_ID, feature['id'])
+            for key in ('name', 'category'):
+                if feature.get(key):
+                    tags.extend(tag(key, str(feature[key])))
+
+        payload += _packed_field(FEATURE_TAGS, tags)
+        payload += _varint_field(FEATURE_TYPE, GEOM_POINT)
+        payload += _packed_field(FEATURE_GEOMETRY, geometry)
+        encoded_features.append(_bytes_field(LAYER_FEATURES, payload))
+
+    layer = _varint_field(LAYER_VERSION, 2) + _bytes_field(LAYER_NAME_FIELD, layer_name.encode('utf-8'))
+    layer += b''.join(encoded_features)
+    layer += b''.join(_bytes_field(LAYER_KEYS, key.encode('utf-8')) for key in keys)
+    for value in values:
+        if isinstance(value, int):
+            layer += _bytes_field(LAYER_VALUES, _varint_field(VALUE_UINT, value))
+        else:
+            layer += _bytes_field(LAYER_VALUES, _bytes_field(VALUE_STRING, value.encode('utf-8')))
+    layer += _varint_field(LAYER_EXTENT, extent)
+
+    return _bytes_field(TILE_LAYERS, layer)
+
+class TilePyramid:
+    """Directory of {z}/{x}/{y}.pbf service tiles, rebuilt incrementally.
+
+    The manifest records the updated_at watermark of the last build and the
+    position of every service it saw, so the next build only rewrites tiles
+    that contained a changed or deleted service before or contain one now.
+    """
+
+    def __init__(self, directory, min_zoom=0, max_zoom=14, max_cluster_zoom=14):
+        self.directory = directory
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.max_cluster_zoom = max_cluster_zoom
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self.positions_path = os.path.join(directory, 'positions.npz')
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load_positions(self):
+        try:
+            with np.load(self.positions_path) as data:
+                return {int(i): (float(lat), float(lng)) for i, lat, lng in zip(data['ids'], data['lat'], data['lng'])}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def update(self, rows, changed_ids=None, watermark=None):
+        """Rewrite the tiles affected by changed_ids, or every tile when changed_ids is None.
+
+        rows is the full current catalog as dicts with id, name, category,
+        latitude and longitude; services missing from it count as deleted.
+        """
+        started = time.perf_counter()
+        rows = [row for row in rows if row.get('latitude') is not None and row.get('longitude') is not None]
+        index = ClusterIndex(max_cluster_zoom=self.max_cluster_zoom)
+        index.build(rows)
+
+        current = {row['id']: (row['latitude'], row['longitude']) for row in rows}
+        previous = self._load_positions() if changed_ids is not None else None
+        manifest = self.load_manifest()
+        full = (
+            previous is None or manifest is None
+            or (manifest.get('min_zoom'), manifest.get('max_zoom'), manifest.get('max_cluster_zoom'))
+            != (self.min_zoom, self.max_zoom, self.max_cluster_zoom)
+        )
+
+        if not full:
+            # Old positions of changed or deleted services, and new positions of changed ones
+            touched = [previous[i] for i in set(changed_ids) | (previous.keys() - current.keys()) if i in previous]
+            touched += [current[i] for i in changed_ids if i in current]
+            touched_lat = np.array([position[0] for position in touched], dtype=np.float64)
+            touched_lng = np.array([position[1] for position in touched], dtype=np.float64)
+
+        written = removed = 0
+        for z in range(self.min_zoom, self.max_zoom + 1):
+            if full:
+                tiles = index.occupied_tiles(z) | self._existing_tiles(z)
+            elif touched:
+                tiles = index.tiles_containing(touched_lat, touched_lng, z)
+            else:
+                tiles = set()
+
+            for x, y in tiles:
+                features = index.tile(z, x, y, levels=TILE_CLUSTER_LEVELS)
+                if features:
+                    self._write_tile(z, x, y, encode_tile(features, z, x, y))
+                    written += 1
+                elif self._remove_tile(z, x, y):
+                    removed += 1
+
+        ids = np.fromiter(current.keys(), dtype=np.int64, count=len(current))
+        np.savez(
+            self.positions_path,
+            ids=ids,
+            lat=np.array([current[i][0] for i in ids.tolist()], dtype=np.float64),
+            lng=np.array([current[i][1] for i in ids.tolist()], dtype=np.float64)
+        )
+        manifest = {
+            'min_zoom': self.min_zoom,
+            'max_zoom': self.max_zoom,
+            'max_cluster_zoom': self.max_cluster_zoom,
+            'layer': LAYER_NAME,
+            'services': len(current),
+            'watermark': watermark,
+            'built_at': time.time(),
+            'full': full,
+            'tiles_written': written,
+            'tiles_removed': removed
+        }
+        self._write_atomic(self.manifest_path, json.dumps(manifest, indent=2).encode('utf-8'))
+
+        logger.info(f"{'Built' if full else 'Updated'} tile pyramid: {written} tiles written, {removed} removed in {time.perf_counter() - started:.1f} s")
+        return manifest
+
+    def _tile_path(self, z, x, y):
+        return os.path.join(self.directory, str(z), str(x), f"{y}.pbf")
+
+    def _existing_tiles(self, z):
+        """Tiles already on disk at zoom z, so a full build also clears emptied ones"""
+        tiles = set()
+        zoom_dir = os.path.join(self.directory, str(z))
+        if os.path.isdir(zoom_dir):
+            for x in os.listdir(zoom_dir):
+                for name in os.listdir(os.path.join(zoom_dir, x)):
+                    if name.endswith('.pbf'):
+                        tiles.add((int(x), int(name[:-4])))
+        return tiles
+
+    def _write_tile(self, z, x, y, data):
+        path = self._tile_path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write_atomic(path, data)
+
+    def _remove_tile(self, z, x, y):
+        try:
+            os.remove(self._tile_path(z, x, y))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
@@ -2,10 +2,10 @@ import logging
 import os
 import tempfile
 import json
-import africastalking
 from flask import current_app, url_for
 from app import db
 from models import User, Conversation, Message
+from services.providers import provider_registry
 
 logger = logging.getLogger(__name__)
 
@@ -14,7 +14,6 @@ class VoiceService:
     
     def __init__(self, app=None):
         self.app = app
-        self.voice = None
         
         if app:
             self.init_app(app)
@@ -23,17 +22,14 @@ class VoiceService:
         """Initialize with Flask app context"""
         self.app = app
         
-        # Initialize Africa's Talking SDK
-        username = app.config.get('AT_USERNAME')
-        api_key = app.config.get('AT_API_KEY')
-        
-        try:
-            africastalking.initialize(username, api_key)
-            self.voice = africastalking.Voice
-            logger.info("Africa's Talking Voice client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Africa's Talking Voice client: {e}")
-            self.voice = None
+        # The provider client is shared with SMSService and built once per process
+        if not provider_registry.app:
+            provider_registry.init_app(app)
+    
+    @property
+    def voice(self):
+        """The process's shared Voice client, or None if it could not be initialized"""
+        return provider_registry.get() if self.app else None
     
     def handle_incoming_call(self, caller_number, session_id, is_active=True):
         """Process incoming voice call"""
@@ -94,12 +90,15 @@ class VoiceService:
             
         elif action_type == "service_confirmation":
             service_name = kwargs.get('service_name', 'the requested service')
+            walking_minutes = kwargs.get('walking_minutes')
             language = kwargs.get('language', 'en')
             
             if language == 'en':
-                speech = f"I found {service_name} near you. Would you like directions? Say yes or no."
+                distance_text = f", about {walking_minutes} minutes' walk away" if walking_minutes is not None else ""
+                speech = f"I found {service_name} near you{distance_text}. Would you like directions? Say yes or no."
             else:  # Kinyarwanda
-                speech = f"Nabonye {service_name} hafi yawe. Urashaka amabwiriza? Vuga yego cyangwa oya."
+                distance_text = f", ni nk'iminota {walking_minutes} n'amaguru" if walking_minutes is not None else ""
+                speech = f"Nabonye {service_name} hafi yawe{distance_text}. Urashaka amabwiriza? Vuga yego cyangwa oya."
             
             response = f"""
             <?xml version="1.0" encoding="UTF-8"?>
@@ -199,11 +198,9 @@ class VoiceService:
         
         try:
             # Make the call
-            response = self.voice.call({
-                'callFrom': current_app.config.get('AT_SHORTCODE', '+254711082000'),
-                'callTo': [phone_number],
-                'callbackUrl': callback_url
-            })
+            response = self.voice.call(
+                current_app.config.get('AT_SHORTCODE', '+254711082000'), [phone_number], callback_url=callback_url
+            )
             
             # Log the response
             logger.info(f"Call initiated: {response}")
@@ -140,7 +140,6 @@ const mapboxToken = 'pk.eyJ1IjoibWFwYm94IiwiYSI6ImNpejY4NXVycTA2emYycXBndHRqcmZ3
 
 let map;
 let userMarker;
-let serviceMarkers = [];
 
 function initMap() {
     if (map) {
@@ -158,6 +157,9 @@ function initMap() {
         zoomOffset: -1
     }).addTo(map);
 
+    // Load clustered services for the visible area
+    attachServiceTiles(map);
+
     // Get user's location with high accuracy
     if ("geolocation" in navigator) {
         navigator.geolocation.getCurrentPosition(
@@ -180,16 +182,11 @@ function initMap() {
                 // Add user popup
                 userMarker.bindPopup('Your Location').openPopup();
 
-                // Center map on user
+                // Center map on user; the service tiles follow the viewport
                 map.setView([userLat, userLng], 13);
-
-                // Load services near user location
-                loadServices(userLat, userLng);
             },
             function(error) {
                 console.error("Error getting location:", error);
-                // Load default services for Rwanda if location fails
-                loadServices(-1.9403, 29.8739);
             },
             {
                 enableHighAccuracy: true,
@@ -200,45 +197,100 @@ function initMap() {
     }
 }
 
-function loadServices(lat, lng) {
-    // Clear existing markers
-    serviceMarkers.forEach(marker => marker.remove());
-    serviceMarkers = [];
+// Tile responses are immutable for their max-age, so keep them per zoom/x/y
+const serviceTileCache = new Map();
+const SERVICE_TILE_CACHE_SIZE = 512;
 
-    fetch(`/api/services?lat=${lat}&lng=${lng}`)
-        .then(response => response.json())
-        .then(data => {
-            if (data.services && data.services.length > 0) {
-                data.services.forEach(service => {
-                    // Create marker for service
-                    const marker = L.marker([service.latitude, service.longitude], {
-                        icon: L.divIcon({
-                            className: `service-location ${service.category}`,
-                            html: getServiceIcon(service.category)
-                        })
-                    }).addTo(map);
+/**
+ * Show clustered services for the visible map tiles and keep them in sync as the map moves
+ */
+function attachServiceTiles(targetMap) {
+    const layer = L.layerGroup().addTo(targetMap);
+    const refresh = () => loadServiceTiles(targetMap, layer);
+    targetMap.on('moveend', refresh);
+    refresh();
+    return layer;
+}
 
-                    // Add popup with service info
-                    const popupContent = `
-                        <div class="service-popup">
-                            <h5>${service.name}</h5>
-                            <p><strong>Category:</strong> ${service.category}</p>
-                            <p><strong>Address:</strong> ${service.address}</p>
-                            <p><strong>Hours:</strong> ${service.opening_hours || 'N/A'}</p>
-                            <p><strong>Phone:</strong> ${service.phone_number || 'N/A'}</p>
-                            <button onclick="getDirections(${service.latitude}, ${service.longitude})" class="btn btn-sm btn-primary">Get Directions</button>
-                        </div>
-                    `;
-                    marker.bindPopup(popupContent);
-                    serviceMarkers.push(marker);
-                });
-            } else {
-                console.warn("No services data received");
-            }
-        })
+function loadServiceTiles(targetMap, layer) {
+    const zoom = Math.round(targetMap.getZoom());
+    const pixelBounds = targetMap.getPixelBounds();
+    const min = pixelBounds.min.divideBy(256).floor();
+    const max = pixelBounds.max.divideBy(256).floor();
+    const last = Math.pow(2, zoom) - 1;
+
+    const requests = [];
+    for (let x = Math.max(0, min.x); x <= Math.min(last, max.x); x++) {
+        for (let y = Math.max(0, min.y); y <= Math.min(last, max.y); y++) {
+            requests.push(fetchServiceTile(zoom, x, y));
+        }
+    }
+
+    Promise.all(requests).then(tiles => {
+        // Ignore responses for a zoom level the user has already left
+        if (Math.round(targetMap.getZoom()) !== zoom) return;
+
+        layer.clearLayers();
+        tiles.forEach(features => features.forEach(feature => addServiceFeature(targetMap, layer, feature)));
+    });
+}
+
+function fetchServiceTile(z, x, y) {
+    const key = `${z}/${x}/${y}`;
+    if (serviceTileCache.has(key)) {
+        return serviceTileCache.get(key);
+    }
+    if (serviceTileCache.size >= SERVICE_TILE_CACHE_SIZE) {
+        serviceTileCache.clear();
+    }
+
+    const request = fetch(`/api/services/tiles/${key}.json`)
+        .then(response => response.json())
+        .then(data => data.features || [])
         .catch(error => {
             console.error("Error loading services:", error);
+            serviceTileCache.delete(key);
+            return [];
+        });
+    serviceTileCache.set(key, request);
+    return request;
+}
+
+function addServiceFeature(targetMap, layer, feature) {
+    if (feature.type === 'cluster') {
+        // Clicking a cluster zooms in until it splits into individual services
+        const marker = L.marker([feature.latitude, feature.longitude], {
+            icon: L.divIcon({
+                className: 'service-cluster',
+                html: `<span class="badge rounded-pill bg-primary">${feature.count}</span>`
+            })
         });
+        marker.on('click', () => targetMap.setView([feature.latitude, feature.longitude], targetMap.getZoom() + 2));
+        layer.addLayer(marker);
+        return;
+    }
+
+    // Create marker for service
+    const marker = L.marker([feature.latitude, feature.longitude], {
+        icon: L.divIcon({
+            className: `service-location ${feature.category}`,
+            html: getServiceIcon(feature.category)
+        })
+    });
+
+    // Add popup with service info
+    const popupContent = `
+        <div class="service-popup">
+            <h5>${feature.name}</h5>
+            <p><strong>Category:</strong> ${feature.category}</p>
+            <p><strong>Address:</strong> ${feature.address}</p>
+            <p><strong>Hours:</strong> ${feature.opening_hours || 'N/A'}</p>
+            <p><strong>Phone:</strong> ${feature.phone_number || 'N/A'}</p>
+            <button onclick="getDirections(${feature.latitude}, ${feature.longitude})" class="btn btn-sm btn-primary">Get Directions</button>
+        </div>
+    `;
+    marker.bindPopup(popupContent);
+    layer.addLayer(marker);
 }
 
 function getServiceIcon(category) {
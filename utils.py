@@ -1,13 +1,18 @@
 import re
 import json
+import math
 import random
 import string
 import logging
 from datetime import datetime, timedelta
 from sqlalchemy import func
+from services.lexicon import current_lexicon
 
 logger = logging.getLogger(__name__)
 
+# Mean Earth radius used for all great-circle distances
+EARTH_RADIUS_KM = 6371.0088
+
 def generate_session_id():
     """Generate a random session ID for conversations"""
     chars = string.ascii_letters + string.digits
@@ -26,23 +31,7 @@ def extract_keywords(text):
     words = text.split()
     
     # Remove common stopwords
-    stopwords = {
-        'i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 
-        'you', 'your', 'yours', 'yourself', 'yourselves', 
-        'he', 'him', 'his', 'himself', 'she', 'her', 'hers', 'herself', 
-        'it', 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 
-        'what', 'which', 'who', 'whom', 'this', 'that', 'these', 'those', 
-        'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 
-        'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 
-        'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 
-        'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 
-        'against', 'between', 'into', 'through', 'during', 'before', 'after', 
-        'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out', 'on', 'off', 
-        'over', 'under', 'again', 'further', 'then', 'once', 'here', 'there', 
-        'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more', 
-        'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 
-        'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', 'should', 'now'
-    }
+    stopwords = current_lexicon().word_set('stopword')
     
     # Keep only non-stopwords
     keywords = [word for word in words if word not in stopwords and len(word) > 2]
@@ -53,6 +42,16 @@ def format_coordinates_for_postgis(latitude, longitude):
     """Format coordinates for PostGIS POINT geometry"""
     return f'POINT({longitude} {latitude})'
 
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in kilometers between two coordinates"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
 def is_valid_phone_number(phone):
     """Validate phone number format"""
     # Basic validation for international format